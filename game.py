@@ -1,11 +1,58 @@
+import argparse
 import os
 import sys
 
 # Add the project root directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from src.game import FightingGame
+from src.game import FightingGame, LockstepGame
+from src.spectator import DEFAULT_PORT, parse_address
+from src.stage import STAGES, DEFAULT_STAGE
 
 if __name__ == "__main__":
-    game = FightingGame()
-    game.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Retro Fighting Game")
+    parser.add_argument('--record', metavar='PATH',
+                        help='save the match inputs to PATH (.npz) for rendering with src.replay_renderer')
+    parser.add_argument('--track-allocations', action='store_true',
+                        help='report memory allocated per frame by each part of the game loop on exit')
+    parser.add_argument('--frame-stats', action='store_true',
+                        help='report frame times and garbage collection pauses on exit')
+    parser.add_argument('--ai', action='store_true',
+                        help='let the lookahead AI play player 2')
+    parser.add_argument('--ai-budget', type=float, default=6.0, metavar='MS',
+                        help='CPU time the AI may spend per decision (default: 6)')
+    parser.add_argument('--broadcast', nargs='?', const=f':{DEFAULT_PORT}', metavar='[HOST]:PORT',
+                        help=f'stream the match to spectators (default: port {DEFAULT_PORT} on localhost)')
+    parser.add_argument('--spectate', nargs='?', const=f':{DEFAULT_PORT}', metavar='[HOST]:PORT',
+                        help='watch a match streamed with --broadcast instead of playing')
+    parser.add_argument('--profile', type=float, metavar='SECONDS',
+                        help='sample the game loop for SECONDS from the start and write a '
+                             'collapsed-stack flamegraph profile (F9 does the same in game)')
+    parser.add_argument('--lockstep', action='store_true',
+                        help='run the fixed-point deterministic simulation; recordings then carry '
+                             'per-frame checksums for python -m src.lockstep to verify')
+    parser.add_argument('--vsync', action='store_true',
+                        help='swap buffers in step with the display refresh')
+    parser.add_argument('--tick-rate', type=int, default=60, metavar='HZ',
+                        help='simulation ticks (and frames) per second; gameplay is tuned in seconds, '
+                             'so 120 or 240 cut input latency with the same feel (default: 60)')
+    parser.add_argument('--stage', choices=sorted(STAGES), default=DEFAULT_STAGE,
+                        help=f'stage to fight on (default: {DEFAULT_STAGE}); spectators pass the '
+                             'same stage as the match they watch')
+    parser.add_argument('--pipelined', action='store_true',
+                        help='simulate on a separate thread, one frame ahead of drawing')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='save a timeline of every frame (Chrome trace-event JSON, for '
+                             'chrome://tracing or ui.perfetto.dev) to PATH on exit')
+    args = parser.parse_args()
+
+    game_class = LockstepGame if args.lockstep else FightingGame
+    game = game_class(record_path=args.record, track_allocations=args.track_allocations,
+                      frame_stats=args.frame_stats,
+                      ai_budget_ms=args.ai_budget if args.ai else None,
+                      broadcast=parse_address(args.broadcast) if args.broadcast else None,
+                      spectate=parse_address(args.spectate) if args.spectate else None,
+                      profile_seconds=args.profile, trace_path=args.trace,
+                      vsync=args.vsync, pipelined=args.pipelined, tick_rate=args.tick_rate,
+                      stage=args.stage)
+    game.run()
@@ -0,0 +1,243 @@
+import sys
+import tracemalloc
+
+import numpy as np
+
+# Columns of the per-frame history
+NET_BYTES = 0     # Bytes still allocated when the section ends
+PEAK_BYTES = 1    # Highest transient allocation inside the section
+NET_BLOCKS = 2    # Memory blocks (roughly objects) still allocated
+
+
+class _Section:
+    # Context manager for one named section; reused every frame
+    __slots__ = ('tracker', 'index')
+
+    def __init__(self, tracker, index):
+        self.tracker = tracker
+        self.index = index
+
+    def __enter__(self):
+        self.tracker._enter(self.index)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Arguments by name, as packing them into a tuple would allocate
+        # inside the interval being measured
+        self.tracker._exit()
+        return False
+
+
+class _NullSection:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SECTION = _NullSection()
+
+
+class NullAllocationTracker:
+    # Used when tracking is off; every call is a no-op
+    enabled = False
+
+    def section(self, name):
+        return _NULL_SECTION
+
+    def begin_frame(self):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+NULL_TRACKER = NullAllocationTracker()
+
+
+class AllocationTracker:
+    # Attributes allocations to named sections of the frame (character
+    # update, particles, projectiles, HUD, draw...) using tracemalloc for
+    # bytes and sys.getallocatedblocks() for object counts. Sections can be
+    # nested; each one is charged only for its own work, not its children's.
+    # The last `history` frames are kept for reporting and budget checks.
+    enabled = True
+
+    def __init__(self, history=600, max_sections=16, frames_per_trace=25):
+        self.history = history
+        self.names = []
+        self._sections = {}
+        self.frames = np.zeros((history, max_sections, 3), dtype=np.int64)
+        self.frame_count = 0
+        self._row = self.frames[0]
+        # The open sections, innermost last, and where the current interval
+        # started (bytes, peak, blocks). Both are preallocated and written in
+        # place, so the bookkeeping does the same allocations whichever
+        # sections it moves between and the calibrated bias holds for all.
+        self._stack = [0] * max_sections
+        self._depth = 0
+        self._mark = np.zeros(3, dtype=np.int64)
+        self.frames_per_trace = frames_per_trace
+        # What the bookkeeping itself allocates or frees per interval, as
+        # (bytes, blocks), measured in start() and subtracted from every
+        # charge. An interval ending where a nested section is entered
+        # holds a little more than one ending at an exit (the with
+        # statement's bound __exit__, for one), so each has its own.
+        self._enter_bias = (0, 0)
+        self._exit_bias = (0, 0)
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames_per_trace)
+        self._calibrate()
+
+    def _calibrate(self, rounds=50):
+        # Time an empty section inside another into scratch rows until the
+        # bookkeeping reaches a steady state, then take its cost from the
+        # last round: the inner section is one interval ending at an exit,
+        # the outer one such an interval plus one ending at an enter
+        row = self._row
+        self._row = np.zeros((2, 3), dtype=np.int64)
+        self._enter_bias = self._exit_bias = (0, 0)
+        outer = _Section(self, 0)
+        inner = _Section(self, 1)
+        for _ in range(rounds):
+            self._row[:] = 0
+            with outer:
+                with inner:
+                    pass
+        exit_bytes, exit_blocks = int(self._row[1, NET_BYTES]), int(self._row[1, NET_BLOCKS])
+        self._exit_bias = (exit_bytes, exit_blocks)
+        self._enter_bias = (int(self._row[0, NET_BYTES]) - exit_bytes,
+                            int(self._row[0, NET_BLOCKS]) - exit_blocks)
+        self._row = row
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def section(self, name):
+        section = self._sections.get(name)
+        if section is None:
+            if len(self.names) == self.frames.shape[1]:
+                raise ValueError(f"Too many allocation sections (max {self.frames.shape[1]})")
+            section = _Section(self, len(self.names))
+            self._sections[name] = section
+            self.names.append(name)
+        return section
+
+    def begin_frame(self):
+        self._row = self.frames[self.frame_count % self.history]
+        self._row[:] = 0
+        self._depth = 0
+
+    def end_frame(self):
+        self.frame_count += 1
+
+    def _measure(self):
+        current, peak = tracemalloc.get_traced_memory()
+        return current, peak, sys.getallocatedblocks()
+
+    def _charge(self, bias):
+        # Charge everything since the last mark, less the bookkeeping's
+        # own bias, to the innermost section
+        current, peak, blocks = self._measure()
+        if self._depth:
+            mark = self._mark
+            row = self._row[self._stack[self._depth - 1]]
+            row[NET_BYTES] += current - mark[0] - bias[0]
+            row[PEAK_BYTES] = max(row[PEAK_BYTES], peak - mark[0])
+            row[NET_BLOCKS] += blocks - mark[2] - bias[1]
+            # Freed before the next interval starts, which would otherwise
+            # be charged for it only when it starts inside a section
+            del row
+        # Start the next interval from here
+        tracemalloc.reset_peak()
+        self._mark[:] = self._measure()
+
+    def _enter(self, index):
+        self._charge(self._enter_bias)
+        self._stack[self._depth] = index
+        self._depth += 1
+
+    def _exit(self):
+        self._charge(self._exit_bias)
+        self._depth -= 1
+
+    def recorded_frames(self):
+        # The history rows in use, oldest first
+        n = min(self.frame_count, self.history)
+        if self.frame_count <= self.history:
+            return self.frames[:n, :len(self.names)]
+        start = self.frame_count % self.history
+        return np.concatenate((self.frames[start:], self.frames[:start]))[:, :len(self.names)]
+
+    def summary(self):
+        # Mean and worst case per section over the recorded frames
+        frames = self.recorded_frames()
+        result = {}
+        for i, name in enumerate(self.names):
+            column = frames[:, i]
+            result[name] = {
+                'net_bytes_mean': float(column[:, NET_BYTES].mean()) if len(column) else 0.0,
+                'net_bytes_max': int(column[:, NET_BYTES].max()) if len(column) else 0,
+                'peak_bytes_max': int(column[:, PEAK_BYTES].max()) if len(column) else 0,
+                'net_blocks_mean': float(column[:, NET_BLOCKS].mean()) if len(column) else 0.0,
+                'net_blocks_max': int(column[:, NET_BLOCKS].max()) if len(column) else 0,
+            }
+        return result
+
+    def report(self):
+        lines = [f"Allocations per frame over the last {min(self.frame_count, self.history)} frames:",
+                 f"  {'section':<20}{'bytes/frame':>14}{'max bytes':>12}{'peak bytes':>12}{'blocks/frame':>14}"]
+        for name, stats in self.summary().items():
+            lines.append(f"  {name:<20}{stats['net_bytes_mean']:>14.1f}{stats['net_bytes_max']:>12}"
+                         f"{stats['peak_bytes_max']:>12}{stats['net_blocks_mean']:>14.2f}")
+        return '\n'.join(lines)
+
+    def assert_budget(self, name, max_bytes=0, max_blocks=0, skip_frames=0):
+        # Fails if the section's steady-state net allocation exceeds the
+        # budget on any recorded frame (after skipping warm-up frames)
+        index = self.names.index(name)
+        frames = self.recorded_frames()[skip_frames:, index]
+        worst_bytes = int(frames[:, NET_BYTES].max()) if len(frames) else 0
+        worst_blocks = int(frames[:, NET_BLOCKS].max()) if len(frames) else 0
+        assert worst_bytes <= max_bytes and worst_blocks <= max_blocks, (
+            f"{name} allocated {worst_bytes} bytes / {worst_blocks} blocks in one frame "
+            f"(budget {max_bytes} bytes / {max_blocks} blocks)")
+
+
+def _nothing():
+    pass
+
+
+def _net_allocations(fn, args, calls):
+    # Bytes and blocks left allocated after `calls` calls of fn(*args),
+    # including what taking the measurement leaves behind
+    start_bytes = tracemalloc.get_traced_memory()[0]
+    start_blocks = sys.getallocatedblocks()
+    for _ in range(calls):
+        fn(*args)
+    return tracemalloc.get_traced_memory()[0] - start_bytes, sys.getallocatedblocks() - start_blocks
+
+
+def measure_allocations(fn, *args, calls=1000, warmup=100):
+    # Net bytes and blocks left allocated per call of fn(*args), once it has
+    # warmed up. For benchmark budgets such as "Projectile.update allocates
+    # nothing in steady state". What the measurement itself leaves behind
+    # (the integers it starts from) is measured around a call of nothing
+    # and taken off, so a function that allocates nothing comes out at 0.
+    for _ in range(warmup):
+        fn(*args)
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        bias_bytes, bias_blocks = _net_allocations(_nothing, (), calls)
+        net_bytes, net_blocks = _net_allocations(fn, args, calls)
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return (net_bytes - bias_bytes) / calls, (net_blocks - bias_blocks) / calls
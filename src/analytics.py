@@ -0,0 +1,320 @@
+import argparse
+import math
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pygame
+
+from src.stage import ARENA, STAGES, DEFAULT_STAGE
+
+# Where damage came from (see Match.damage)
+MISSILE = 0
+MELEE = 1
+FIRE_BREATH = 2
+HAZARD = 3
+SOURCE_NAMES = ('missile', 'melee', 'fire breath', 'hazard')
+JUMP_NAMES = ('jump', 'double jump')
+
+# The position heatmap covers the arena across and from the floor up, in
+# square cells; fighters past its edges count in the edge cells
+HEATMAP_X = (ARENA[0], ARENA[2])
+HEATMAP_Y = (-2.0, 14.0)
+HEATMAP_CELL = 0.5
+HEATMAP_COLUMNS = int((HEATMAP_X[1] - HEATMAP_X[0]) / HEATMAP_CELL)
+HEATMAP_ROWS = int((HEATMAP_Y[1] - HEATMAP_Y[0]) / HEATMAP_CELL)
+# Timelines are in whole seconds of match time, the last bin taking
+# everything later
+TIME_BINS = 120
+
+
+class NullAnalytics:
+    # Used when nothing collects statistics; every hook does nothing
+    enabled = False
+
+    def sample(self, match):
+        pass
+
+    def jump(self, match, fighter, double):
+        pass
+
+    def damage(self, match, defender, amount, source):
+        pass
+
+    def knockout(self, match, defender):
+        pass
+
+
+NULL_ANALYTICS = NullAnalytics()
+
+
+def _bin(value, low, size, count):
+    index = math.floor((value - low) / size)
+    return 0 if index < 0 else count - 1 if index >= count else index
+
+
+class MatchAnalytics:
+    # Aggregate statistics over any number of matches, fed by the match
+    # loop through the same hooks as NullAnalytics. Every hook bumps a bin
+    # of a fixed-size histogram, so memory stays the same however many
+    # frames go through and nothing per frame is kept. Sinks from separate
+    # workers merge by adding their arrays.
+    enabled = True
+
+    def __init__(self):
+        # All counts or sums, indexed by player first:
+        #   heatmap       (player, row, column)    frames spent in each cell
+        #   damage_taken  (player, source, second) strength lost
+        #   hits          (player, source)         hits taken
+        #   knockouts     (player, second)         when it was knocked out
+        #   jumps         (player, kind, column)   where it jumped
+        players = 2
+        sources = len(SOURCE_NAMES)
+        self.heatmap = np.zeros((players, HEATMAP_ROWS, HEATMAP_COLUMNS), dtype=np.int64)
+        self.damage_taken = np.zeros((players, sources, TIME_BINS))
+        self.hits = np.zeros((players, sources), dtype=np.int64)
+        self.knockouts = np.zeros((players, TIME_BINS), dtype=np.int64)
+        self.jumps = np.zeros((players, len(JUMP_NAMES), HEATMAP_COLUMNS), dtype=np.int64)
+        # The heatmap's cells in a row, counted through a memoryview, which
+        # skips numpy's per-call overhead on the one hook run every frame
+        self._cells = memoryview(self.heatmap.reshape(-1))
+
+    def __getstate__(self):
+        # Pickled as the arrays alone, for sinks sent back from workers
+        return self.arrays()
+
+    def __setstate__(self, arrays):
+        self.__init__()
+        self._fill(arrays)
+
+    def sample(self, match):
+        # Called once per simulated frame
+        cells = self._cells
+        offset = 0
+        for fighter in match.players:
+            position = fighter.position
+            row = _bin(position[1], HEATMAP_Y[0], HEATMAP_CELL, HEATMAP_ROWS)
+            cells[offset + row * HEATMAP_COLUMNS +
+                  _bin(position[0], HEATMAP_X[0], HEATMAP_CELL, HEATMAP_COLUMNS)] += 1
+            offset += HEATMAP_ROWS * HEATMAP_COLUMNS
+
+    def jump(self, match, fighter, double):
+        column = _bin(fighter.position[0], HEATMAP_X[0], HEATMAP_CELL, HEATMAP_COLUMNS)
+        self.jumps[_player(match, fighter), int(double), column] += 1
+
+    def damage(self, match, defender, amount, source):
+        player = _player(match, defender)
+        self.damage_taken[player, source, _second(match)] += amount
+        self.hits[player, source] += 1
+
+    def knockout(self, match, defender):
+        self.knockouts[_player(match, defender), _second(match)] += 1
+
+    def arrays(self):
+        return {'heatmap': self.heatmap, 'damage': self.damage_taken, 'hits': self.hits,
+                'knockout': self.knockouts, 'jumps': self.jumps}
+
+    def merge(self, other):
+        # Adds other's statistics to these; returns self
+        for mine, theirs in zip(self.arrays().values(), other.arrays().values()):
+            mine += theirs
+        return self
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, **self.arrays())
+
+    @classmethod
+    def load(cls, path):
+        analytics = cls()
+        with np.load(path) as data:
+            analytics._fill(data)
+        return analytics
+
+    def _fill(self, arrays):
+        for name, values in self.arrays().items():
+            values[...] = arrays[name]
+
+    def summary(self):
+        # A few lines of totals for the console
+        frames = int(self.heatmap[0].sum())
+        knockouts = self.knockouts.sum(axis=0)
+        lines = [f"{frames} frames, {int(knockouts.sum())} knockouts"]
+        if knockouts.any():
+            seconds = np.arange(TIME_BINS) + 0.5
+            lines.append(f"  mean time to knockout {np.average(seconds, weights=knockouts):.1f} s")
+        for source, name in enumerate(SOURCE_NAMES):
+            hits = int(self.hits[:, source].sum())
+            if hits:
+                damage = self.damage_taken[:, source].sum()
+                lines.append(f"  {name}: {damage:.0f} damage in {hits} hits")
+        for kind, name in enumerate(JUMP_NAMES):
+            lines.append(f"  {name}s: {int(self.jumps[:, kind].sum())}")
+        return lines
+
+    def plot(self, directory):
+        # Writes the statistics as PNG charts to directory; returns their
+        # paths
+        os.makedirs(directory, exist_ok=True)
+        pygame.font.init()
+        charts = {
+            'heatmap.png': _heatmaps(self.heatmap),
+            'damage_by_source.png': _bars("Damage taken by source",
+                                          self.damage_taken.sum(axis=2), PLAYER_NAMES, PLAYER_COLORS,
+                                          SOURCE_NAMES),
+            'damage_timeline.png': _bars("Damage per second of match time, by source",
+                                         self.damage_taken.sum(axis=0), SOURCE_NAMES, SOURCE_COLORS),
+            'time_to_knockout.png': _bars("Knockouts by second of match time",
+                                          self.knockouts, PLAYER_NAMES, PLAYER_COLORS),
+            'jumps.png': _bars("Jumps by position across the arena",
+                               self.jumps.sum(axis=0), JUMP_NAMES, SOURCE_COLORS),
+        }
+        paths = []
+        for name, surface in charts.items():
+            path = os.path.join(directory, name)
+            pygame.image.save(surface, path)
+            paths.append(path)
+        return paths
+
+
+def _player(match, fighter):
+    return 0 if fighter is match.player1 else 1
+
+
+def _second(match):
+    second = match.frame // match.tick_rate.hz
+    return second if second < TIME_BINS else TIME_BINS - 1
+
+
+# Chart drawing, with pygame so plots need nothing beyond the game itself
+PLAYER_NAMES = ('player 1', 'player 2')
+PLAYER_COLORS = ((60, 90, 230), (220, 60, 50))
+SOURCE_COLORS = ((230, 170, 40), (80, 180, 90), (220, 80, 40), (150, 80, 200))
+_BACKGROUND = (20, 20, 24)
+_TEXT = (220, 220, 220)
+_CHART_SIZE = (720, 360)
+_MARGIN = 40
+
+
+def _heatmaps(heatmap):
+    # Both players' heatmaps side by side on a log scale, up as up
+    scale = 10
+    width, height = HEATMAP_COLUMNS * scale, HEATMAP_ROWS * scale
+    surface = pygame.Surface((2 * width + 3 * _MARGIN // 2, height + 2 * _MARGIN))
+    surface.fill(_BACKGROUND)
+    font = pygame.font.Font(None, 22)
+    for player, counts in enumerate(heatmap):
+        level = np.log1p(counts) / max(np.log1p(counts.max()), 1e-9)
+        # Black through red and yellow to white
+        rgb = np.stack((np.clip(level * 3, 0, 1), np.clip(level * 3 - 1, 0, 1),
+                        np.clip(level * 3 - 2, 0, 1)), axis=-1)
+        image = pygame.surfarray.make_surface((rgb[::-1].transpose(1, 0, 2) * 255).astype(np.uint8))
+        left = _MARGIN // 2 + player * (width + _MARGIN // 2)
+        surface.blit(pygame.transform.scale(image, (width, height)), (left, _MARGIN))
+        surface.blit(font.render(f"Player {player + 1}: {int(counts.sum())} frames", True, _TEXT),
+                     (left, _MARGIN // 3))
+    return surface
+
+
+def _bars(title, series, names, colors, labels=None):
+    # One bar per bin, stacking the rows of series (one per name), with the
+    # bins labelled if labels are given
+    series = np.asarray(series, dtype=float)
+    bins = series.shape[1]
+    surface = pygame.Surface(_CHART_SIZE)
+    surface.fill(_BACKGROUND)
+    font = pygame.font.Font(None, 22)
+    surface.blit(font.render(title, True, _TEXT), (_MARGIN, _MARGIN // 3))
+    width = _CHART_SIZE[0] - 2 * _MARGIN
+    height = _CHART_SIZE[1] - 3 * _MARGIN
+    bottom = _MARGIN + height
+    top = series.sum(axis=0).max()
+    bar = width / bins
+    for index in range(bins):
+        y = bottom
+        for row, color in zip(series[:, index], colors):
+            if row <= 0 or top <= 0:
+                continue
+            size = row / top * height
+            pygame.draw.rect(surface, color, pygame.Rect(round(_MARGIN + index * bar), round(y - size),
+                                                         max(1, round(bar) - 1), max(1, round(size))))
+            y -= size
+    pygame.draw.line(surface, _TEXT, (_MARGIN, bottom), (_MARGIN + width, bottom))
+    scale = font.render(f"tallest bar {top:.0f}", True, _TEXT)
+    surface.blit(scale, (_MARGIN + width - scale.get_width(), _MARGIN // 3))
+    if labels is not None:
+        for index, label in enumerate(labels):
+            surface.blit(font.render(label, True, _TEXT), (round(_MARGIN + (index + 0.3) * bar), bottom + 6))
+    x = _MARGIN
+    for name, color in zip(names, colors):
+        pygame.draw.rect(surface, color, pygame.Rect(x, bottom + 30, 12, 12))
+        surface.blit(font.render(name, True, _TEXT), (x + 18, bottom + 28))
+        x += 30 + font.size(name)[0]
+    return surface
+
+
+def play(seeds, duration=3600, hold=6, stage=DEFAULT_STAGE):
+    # Plays a headless match of random inputs, each pair held for `hold`
+    # frames, for every seed until a knockout or `duration` frames, and
+    # returns their statistics
+    from src.match import Match  # Match reports to this module
+    analytics = MatchAnalytics()
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        match = Match(seed=seed, stage=stage, analytics=analytics, quiet=True)
+        match.simulate_effects = False
+        while match.running and match.frame < duration:
+            if match.frame % hold == 0:
+                inputs1, inputs2 = (int(value) for value in rng.integers(0, 128, 2))
+            match.step(inputs1, inputs2)
+    return analytics
+
+
+def _play_job(job):
+    return play(*job)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect statistics over random headless matches, "
+                                                 "or merge saved ones")
+    parser.add_argument('--matches', type=int, default=100)
+    parser.add_argument('--duration', type=int, default=3600, help='most frames per match')
+    parser.add_argument('--hold', type=int, default=6, help='frames each random input is held for')
+    parser.add_argument('--stage', choices=sorted(STAGES), default=DEFAULT_STAGE, help='stage to play on')
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--merge', nargs='+', metavar='STATS', help='saved statistics to add up instead')
+    parser.add_argument('--output', default='analytics.npz', help='where to save the statistics')
+    parser.add_argument('--plots', metavar='DIR', help='also draw charts of them to DIR')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.merge:
+        analytics = MatchAnalytics()
+        for path in args.merge:
+            analytics.merge(MatchAnalytics.load(path))
+    else:
+        jobs = args.jobs or os.cpu_count() or 1
+        jobs = [(range(first, args.matches, jobs), args.duration, args.hold, args.stage)
+                for first in range(min(jobs, args.matches))]
+        if len(jobs) == 1:
+            results = [_play_job(jobs[0])]
+        else:
+            with multiprocessing.Pool(len(jobs)) as pool:
+                results = pool.map(_play_job, jobs)
+        analytics = MatchAnalytics()
+        for result in results:
+            analytics.merge(result)
+    elapsed = time.perf_counter() - start
+
+    analytics.save(args.output)
+    for line in analytics.summary():
+        print(line)
+    print(f"Saved to {args.output} in {elapsed:.1f} s")
+    if args.plots:
+        for path in analytics.plot(args.plots):
+            print(f"  {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,190 +1,454 @@
+from array import array
+
 import numpy as np
 from OpenGL.GL import *
-from pygame.math import Vector3
 import pygame
 
+from src.animation import AnimationCurves, TRAIL_PULSE
+from src.render_queue import PASS_LIT, PASS_PARTICLES
+from src.particles import ParticleSystem
+from src.timer_wheel import TimerWheel
+from src.hitboxes import (MELEE_FRAMES, MELEE_ACTIVE_FRAME, HURTBOX_TREES,
+                          PUNCH_BOXES, KICK_BOXES)
+from src.meshes import get_meshes, ARM_MESHES, LEG_MESH, KICK_LEG_MESH
+from src.tick_rate import TickRate, BASE_RATE, DURATION, SPEED, ACCELERATION, DECAY, REST
+from src.stage import get_stage, DEFAULT_STAGE
+
+# Layout of Character.physics, one contiguous float64 array per fighter
+PX, PY, PZ = 0, 1, 2  # Position
+VX, VY, VZ = 3, 4, 5  # Velocity
+AX, AY, AZ = 6, 7, 8  # Acceleration
+PHYSICS_SIZE = 9
+
+# Fraction of a fighter's speed kept every 1/60 s along the ground and
+# through the air, and gravity in units per second per second. Speeds given
+# to fighters are compiled with these (see src/tick_rate.py).
+GROUND_DRAG = 0.9
+AIR_DRAG = 0.98
+GRAVITY = 72.0
+
+# Layout of Character.timers, one int32 array of absolute frame numbers on
+# the fighter's timer wheel. Cooldowns store the frame they are ready again,
+# actions and effects the frame they started; nothing is counted down.
+T_JUMP_READY = 0
+T_MELEE_READY = 1
+T_SHOOT_READY = 2
+T_ATTACK_READY = 3
+T_FIRE_BREATH_READY = 4
+T_PUNCH_START = 5
+T_KICK_START = 6
+T_STAGGER_START = 7
+T_FIRE_BREATH_START = 8
+T_EYES_FIRE_START = 9
+T_EXPLOSION_START = 10
+T_AI_TIMER = 11
+TIMER_COUNT = 12
+
+def _timer(index):
+    # Exposes one slot of the timers array as a plain int attribute
+    def get(self):
+        return self.timers[index]
+    def set(self, value):
+        self.timers[index] = value
+    return property(get, set)
+
+def _cooldown(index):
+    # Frames left until a ready frame comes round; assigning a cooldown
+    # stores the frame it runs out instead
+    def get(self):
+        remaining = self.timers[index] - self.wheel.frame
+        return remaining if remaining > 0 else 0
+    def set(self, value):
+        self.timers[index] = self.wheel.frame + value
+    return property(get, set)
+
+def _elapsed(index):
+    # Frames since a start frame; assigning 0 starts counting now
+    def get(self):
+        return self.wheel.frame - self.timers[index]
+    def set(self, value):
+        self.timers[index] = self.wheel.frame - value
+    return property(get, set)
+
 class Character:
-    def __init__(self, name, position=(0, 0, 0), color=(1, 1, 1), strength=100, pistols=0, is_ai=False):
+    # Fighter state lives in fixed slots and two flat arrays instead of an
+    # instance dict, so a fighter is small, cheap to copy and the physics
+    # step runs without allocating anything.
+    __slots__ = (
+        'name', 'color', 'bicep_color', 'muscle_color', 'chest_color',
+        'wing_color', 'wing_detail_color', 'wing_bone_color', 'palette',
+        'strength', 'pistols', 'projectiles',
+        'physics', 'timers', 'wheel', 'position', 'velocity', 'acceleration',
+        'is_jumping', 'can_double_jump',
+        'is_exploding', 'explosion_particles',
+        'is_ai', 'ai_state', 'ai_move_direction',
+        'is_punching', 'is_kicking',
+        'is_breathing_fire', 'fire_breath_particles',
+        'is_eyes_on_fire', 'is_staggered',
+        'combo_count', 'last_hit_time',
+        'animation', 'stage', 'rng', 'quiet',
+    )
+
+    # Bounding sphere around the body, wings, horns and a full kick, relative
+    # to the character's position. Used for frustum culling.
+    bounds_center = (0.0, 0.2, -0.4)
+    bounds_radius = 4.0
+
+    # Movement and combat tuning, shared by every fighter, in seconds and
+    # units per second (see src/tick_rate.py). Each entry is compiled into a
+    # per-tick class attribute of the same name: on Character itself for
+    # BASE_RATE, and on the subclasses at_rate() makes for other rates.
+    TUNING = {
+        'friction': (DECAY, GROUND_DRAG),
+        'air_resistance': (DECAY, AIR_DRAG),
+        'gravity': (ACCELERATION, GRAVITY, AIR_DRAG),
+        # Vertical velocity of a fighter not rising or falling
+        'rest_velocity': (REST, GRAVITY, AIR_DRAG),
+        'move_speed': (SPEED, 9.0),
+        'jump_speed': (SPEED, 24.0, AIR_DRAG),
+        'double_jump_push': (SPEED, 18.0, GROUND_DRAG),
+        'jump_cooldown_max': (DURATION, 1 / 6),
+
+        'explosion_duration': (DURATION, 1.0),
+        'attack_cooldown_max': (DURATION, 1.0),
+
+        # A punch or kick, and the tick of it on which the fist or foot lands
+        'melee_frames': (DURATION, MELEE_FRAMES / BASE_RATE),
+        'melee_active_frame': (DURATION, MELEE_ACTIVE_FRAME / BASE_RATE),
+        'punch_cooldown_max': (DURATION, 1 / 3),
+        'kick_cooldown_max': (DURATION, 0.5),
+        'punch_push': (SPEED, 6.0, GROUND_DRAG),
+        'kick_push': (SPEED, 9.0, GROUND_DRAG),
+        'kick_lift': (SPEED, 6.0, AIR_DRAG),
+
+        'shoot_cooldown_max': (DURATION, 1 / 3),  # Between shots
+        'projectile_speed': (SPEED, 6.0),
+        'fire_breath_max': (DURATION, 2.0),
+        'fire_breath_cooldown_max': (DURATION, 0.5),  # Shorter cooldown
+        'fire_particle_life': (DURATION, 0.5),
+        'eyes_fire_max': (DURATION, 1.0),
+        'stagger_recovery': (DURATION, 0.5),  # To recover from stagger
+        'combo_window': (DURATION, 0.75),  # To continue a combo
+
+        # The built-in AI rethinks every second up close, every two far off
+        'ai_think_near': (DURATION, 1.0),
+        'ai_think_far': (DURATION, 2.0),
+    }
+    tick_rate = TickRate()
+
+    mass = 1.0
+    melee_damage = 15  # Most a punch or kick can deal
+    fire_breath_damage = 1
+    fire_breath_range = 4.0
+
+    # Cooldowns, read and written as frames remaining
+    jump_cooldown = _cooldown(T_JUMP_READY)
+    melee_cooldown = _cooldown(T_MELEE_READY)
+    shoot_cooldown = _cooldown(T_SHOOT_READY)
+    attack_cooldown = _cooldown(T_ATTACK_READY)
+    fire_breath_cooldown = _cooldown(T_FIRE_BREATH_READY)
+    # Animation and effect progress, in frames since they started
+    punch_frame = _elapsed(T_PUNCH_START)
+    kick_frame = _elapsed(T_KICK_START)
+    stagger_time = _elapsed(T_STAGGER_START)
+    fire_breath_duration = _elapsed(T_FIRE_BREATH_START)
+    eyes_fire_duration = _elapsed(T_EYES_FIRE_START)
+    explosion_time = _elapsed(T_EXPLOSION_START)
+    ai_timer = _timer(T_AI_TIMER)
+
+    @classmethod
+    def at_rate(cls, hz):
+        # This fighter class with its tuning compiled for `hz` ticks a
+        # second. Subclasses are made once per rate and add no state.
+        if hz == cls.tick_rate.hz:
+            return cls
+        subclass = _RATE_CLASSES.get((cls, hz))
+        if subclass is None:
+            tick_rate = TickRate(hz)
+            attributes = tick_rate.compile(cls.TUNING)
+            attributes.update(__slots__=(), tick_rate=tick_rate)
+            subclass = type(f'{cls.__name__}{hz}Hz', (cls,), attributes)
+            _RATE_CLASSES[cls, hz] = subclass
+        return subclass
+
+    def __init__(self, name, position=(0, 0, 0), color=(1, 1, 1), strength=100, pistols=0, is_ai=False,
+                 wheel=None):
         self.name = name
-        self.position = list(position)  # Changed to list for mutability
         self.color = color
+        # Shades of the character color used by the body parts, worked out
+        # once here rather than with a list comprehension per draw call
+        self.bicep_color = tuple(c * 0.9 for c in color)
+        self.muscle_color = tuple(c * 0.85 for c in color)
+        self.chest_color = tuple(c * 0.8 for c in color)
+        self.wing_color = tuple(0.9 + c * 0.1 for c in color)
+        self.wing_detail_color = tuple(c * 0.7 for c in self.wing_color)
+        self.wing_bone_color = tuple(c * 0.6 for c in self.wing_color)
+        # The same shades in the order of the mesh palette slots
+        self.palette = (color, self.bicep_color, self.muscle_color, self.chest_color,
+                        self.wing_color, self.wing_detail_color, self.wing_bone_color)
         self.strength = strength
         self.pistols = pistols
         self.projectiles = []
         
+        # Position, velocity and acceleration are views into one float array,
+        # indexed [0], [1], [2] for x, y, z
+        self.physics = array('d', bytes(8 * PHYSICS_SIZE))
+        self.physics[PX:PZ + 1] = array('d', position)
+        view = memoryview(self.physics)
+        self.position = view[PX:PZ + 1]
+        self.velocity = view[VX:VZ + 1]
+        self.acceleration = view[AX:AZ + 1]
+
+        # Cooldowns and animation frames. The wheel provides the current
+        # frame and ends timed actions; a match shares one between fighters.
+        self.timers = array('i', bytes(4 * TIMER_COUNT))
+        self.wheel = wheel if wheel is not None else TimerWheel()
+
         # Jumping properties
-        self.velocity = Vector3(0, 0, 0)
-        self.acceleration = Vector3(0, 0, 0)
-        self.mass = 1.0
-        self.friction = 0.9
-        self.jump_speed = 0.4
-        self.gravity = 0.02
-        self.move_speed = 0.15
-        self.air_resistance = 0.98
         self.is_jumping = False
-        self.jump_cooldown = 0
-        self.jump_cooldown_max = 10
         self.can_double_jump = True  # New flag for double jump
         
         # Explosion properties
         self.is_exploding = False
-        self.explosion_time = 0
-        self.explosion_duration = 60
-        self.explosion_particles = []
+        self.explosion_particles = ParticleSystem(200)
 
         self.is_ai = is_ai
         self.ai_state = 'idle'
-        self.ai_timer = 0
         self.ai_move_direction = 1
-        self.attack_cooldown = 0
-        self.attack_cooldown_max = 60  # frames (1 second at 60 FPS)
 
         # Combat properties
         self.is_punching = False
         self.is_kicking = False
-        self.punch_frame = 0
-        self.kick_frame = 0
-        self.melee_cooldown = 0
-        self.melee_damage = 15
-        self.shoot_cooldown = 0
-        self.shoot_cooldown_max = 20  # Frames between shots
 
         # Fire breath properties
         self.is_breathing_fire = False
-        self.fire_breath_duration = 0
-        self.fire_breath_max = 120  # 2 seconds at 60 FPS
-        self.fire_breath_particles = []
-        self.fire_breath_damage = 1
-        self.fire_breath_cooldown = 0
-        self.fire_breath_cooldown_max = 30  # Shorter cooldown (0.5 seconds)
-        self.fire_breath_range = 4.0
+        self.fire_breath_particles = ParticleSystem(160)
 
         self.is_eyes_on_fire = False
-        self.eyes_fire_duration = 0
-        self.eyes_fire_max = 60  # 1 second of fire eyes
-
         self.is_staggered = False
-        self.stagger_time = 0
-        self.stagger_recovery = 30  # Frames to recover from stagger
 
         self.combo_count = 0
         self.last_hit_time = 0
-        self.combo_window = 45  # Frames to continue combo
+
+        # Per-frame animation curves shared by the draw routines
+        self.animation = AnimationCurves()
+
+        # What the fighter stands on and runs into; the match sets its own
+        self.stage = get_stage(DEFAULT_STAGE)
+        # Where effects and the built-in AI draw random numbers from: numpy's
+        # global generator, or the match's own Generator when it has one
+        self.rng = np.random
+        # Whether to keep from printing what the fighter does; follows its
+        # match's (see Match.quiet)
+        self.quiet = False
+
+    def copy_state_from(self, other):
+        # Overwrites this fighter's simulation state with other's, in place.
+        # Particles and animation are cosmetic and are not carried over, so
+        # a copy made for lookahead never pays for them.
+        self.name = other.name
+        self.strength = other.strength
+        self.pistols = other.pistols
+        self.projectiles = [projectile.clone() for projectile in other.projectiles]
+        self.physics[:] = other.physics
+        self.timers[:] = other.timers
+        self.is_jumping = other.is_jumping
+        self.can_double_jump = other.can_double_jump
+        self.is_exploding = other.is_exploding
+        self.is_ai = other.is_ai
+        self.ai_state = other.ai_state
+        self.ai_move_direction = other.ai_move_direction
+        self.is_punching = other.is_punching
+        self.is_kicking = other.is_kicking
+        self.is_breathing_fire = other.is_breathing_fire
+        self.is_eyes_on_fire = other.is_eyes_on_fire
+        self.is_staggered = other.is_staggered
+        self.combo_count = other.combo_count
+        self.last_hit_time = other.last_hit_time
+        self.explosion_particles.clear()
+        self.fire_breath_particles.clear()
+        # The timers hold absolute frames, so the copy's wheel must be at the
+        # same frame as other's
+        self.schedule_timers()
+
+    def clone(self, wheel=None):
+        if wheel is None:
+            wheel = TimerWheel(frame=self.wheel.frame)
+        copy = type(self)(self.name, self.position, self.color, self.strength, self.pistols, self.is_ai, wheel)
+        copy.stage = self.stage
+        copy.rng = self.rng
+        copy.quiet = self.quiet
+        copy.copy_state_from(self)
+        return copy
+
+    def schedule_timers(self):
+        # Registers the end of every action or effect in progress with the
+        # wheel, from the start frames in the timers array
+        if self.is_exploding:
+            self.schedule_end(T_EXPLOSION_START, self.explosion_duration + 1, self.end_explosion)
+        if self.is_staggered:
+            self.schedule_end(T_STAGGER_START, self.stagger_recovery, self.end_stagger)
+        if self.is_punching:
+            self.schedule_end(T_PUNCH_START, self.melee_frames, self.end_punch)
+        if self.is_kicking:
+            self.schedule_end(T_KICK_START, self.melee_frames, self.end_kick)
+        if self.is_breathing_fire:
+            self.schedule_end(T_FIRE_BREATH_START, self.fire_breath_max, self.stop_fire_breath)
+        if self.is_eyes_on_fire:
+            self.schedule_end(T_EYES_FIRE_START, self.eyes_fire_max, self.end_fire_eyes)
+
+    def schedule_end(self, start_index, duration, callback):
+        # Calls callback `duration` frames after the start frame stored at
+        # start_index, unless the action has been restarted by then
+        start = self.timers[start_index]
+        self.wheel.schedule(start + duration, self._end_if_current, start_index, start, callback)
+
+    def _end_if_current(self, start_index, start, callback):
+        if self.timers[start_index] == start:
+            callback()
 
     def start_explosion(self):
         self.is_exploding = True
         self.explosion_time = 0
-        # Create explosion particles
-        for _ in range(20):  # 20 particles
-            angle = np.random.uniform(0, 2 * np.pi)
-            speed = np.random.uniform(0.05, 0.15)
-            self.explosion_particles.append({
-                'position': list(self.position),
-                'velocity': [np.cos(angle) * speed, np.sin(angle) * speed, 0],
-                'color': [1.0, np.random.uniform(0.0, 0.5), 0.0],  # Random orange-red
-                'size': np.random.uniform(0.1, 0.3)
-            })
-
-    def update_explosion(self):
-        if not self.is_exploding:
-            return
-
-        self.explosion_time += 1
-        if self.explosion_time >= self.explosion_duration:
-            self.is_exploding = False
-            return
-
-        # Update particle positions
-        for particle in self.explosion_particles:
-            for i in range(3):
-                particle['position'][i] += particle['velocity'][i]
-            # Add gravity effect
-            particle['velocity'][1] -= 0.01
-            # Fade out
-            particle['size'] *= 0.95
+        # The fighter stays in the exploding state for the whole of its
+        # last explosion frame. Being hit again restarts the explosion.
+        self.schedule_end(T_EXPLOSION_START, self.explosion_duration + 1, self.end_explosion)
+        self.emit_explosion_particles()
+
+    def emit_explosion_particles(self):
+        particles = self.explosion_particles
+        new = particles.emit(20)  # 20 particles
+        n = new.stop - new.start
+        angle = self.rng.uniform(0, 2 * np.pi, n)
+        speed = self.rng.uniform(0.05, 0.15, n) * self.tick_rate.base_ticks
+        particles.position[new] = self.position
+        particles.velocity[new, 0] = np.cos(angle) * speed
+        particles.velocity[new, 1] = np.sin(angle) * speed
+        particles.velocity[new, 2] = 0
+        particles.color[new, 0] = 1.0  # Random orange-red
+        particles.color[new, 1] = self.rng.uniform(0.0, 0.5, n)
+        particles.color[new, 2] = 0.0
+        particles.size[new] = self.rng.uniform(0.1, 0.3, n)
+        particles.life[new] = self.explosion_duration
+
+    def end_explosion(self):
+        self.is_exploding = False
 
-    def update(self):
+    def update_particles(self):
+        # Particle effects are stepped separately from the fighter's own
+        # update so their cost can be measured on its own
         if self.is_exploding:
-            self.update_explosion()
-            return
+            # Move particles, add gravity effect and fade out
+            base_ticks = self.tick_rate.base_ticks
+            self.explosion_particles.advance(gravity=0.01 * base_ticks * base_ticks,
+                                             shrink=0.95 ** base_ticks, stage=self.stage)
+        elif self.is_breathing_fire and not self.is_staggered:
+            self.update_fire_breath()
 
-        # Update stagger state
-        if self.is_staggered:
-            self.stagger_time += 1
-            if self.stagger_time >= self.stagger_recovery:
-                self.is_staggered = False
-                self.stagger_time = 0
-            return  # Can't act while staggered
-
-        # Update combat cooldowns
-        if self.melee_cooldown > 0:
-            self.melee_cooldown -= 1
-        if self.shoot_cooldown > 0:
-            self.shoot_cooldown -= 1
-
-        # Update punch animation
-        if self.is_punching:
-            self.punch_frame += 1
-            if self.punch_frame >= 10:
-                self.is_punching = False
-                self.punch_frame = 0
-
-        # Update kick animation
-        if self.is_kicking:
-            self.kick_frame += 1
-            if self.kick_frame >= 10:
-                self.is_kicking = False
-                self.kick_frame = 0
-
-        # Update jump cooldown
-        if self.jump_cooldown > 0:
-            self.jump_cooldown -= 1
-
-        # Apply physics
-        self.velocity.x *= self.friction
-        self.velocity.y *= self.air_resistance
-        self.velocity += self.acceleration
-        self.velocity.y -= self.gravity
-
-        # Update position with physics
-        self.position[0] += self.velocity.x
-        new_y = max(self.position[1] + self.velocity.y, 0)
-        
-        # Check if landed
-        if new_y == 0 and self.velocity.y < 0:
-            self.velocity.y = 0
-            self.is_jumping = False
-            self.can_double_jump = True  # Reset double jump when landing
-        
-        self.position[1] = new_y
-        self.position[2] += self.velocity.z
+    def update(self):
+        # Cooldowns, animations and effect durations are ended by the timer
+        # wheel, so a fighter that is not doing anything only pays for physics
+        if self.is_exploding or self.is_staggered:
+            return  # Can't act while exploding or staggered
 
-        # Reset acceleration
-        self.acceleration = Vector3(0, 0, 0)
+        self.step_physics()
 
         # Update AI behavior if this is an AI character
         if self.is_ai:
             self.update_ai()
 
-        # Update attack cooldown
-        if self.attack_cooldown > 0:
-            self.attack_cooldown -= 1
-
-        # Update fire breath
-        if self.fire_breath_cooldown > 0:
-            self.fire_breath_cooldown -= 1
-            
-        if self.is_breathing_fire:
-            self.fire_breath_duration += 1
-            if self.fire_breath_duration >= self.fire_breath_max:
-                self.stop_fire_breath()
-            else:
-                self.update_fire_breath()
-
-        # Update combo
-        if pygame.time.get_ticks() - self.last_hit_time > self.combo_window:
+        # Update combo. The window is in ticks, like last_hit_time.
+        if self.wheel.frame - self.last_hit_time > self.combo_window:
             self.combo_count = 0
 
+    def melee_pose(self, elapsed):
+        # The pose (0 to MELEE_FRAMES - 1, see src/hitboxes.py) a punch or
+        # kick `elapsed` ticks in is drawn and hit in. Poses are spread out
+        # from the active one, so the tick that can land always shows the
+        # pose that lands; at BASE_RATE the pose is the tick itself.
+        pose = MELEE_ACTIVE_FRAME + (elapsed - self.melee_active_frame) * MELEE_FRAMES // self.melee_frames
+        return min(max(pose, 0), MELEE_FRAMES - 1)
+
+    def hurtboxes(self):
+        # Hurtbox tree for the current punch and kick poses, in local space
+        punch_state = self.melee_pose(self.punch_frame) + 1 if self.is_punching else 0
+        kick_state = self.melee_pose(self.kick_frame) + 1 if self.is_kicking else 0
+        return HURTBOX_TREES[punch_state][kick_state]
+
+    def attack_boxes(self):
+        # Fists and feet that can land a hit this frame, in local space
+        punch = self.is_punching and self.punch_frame == self.melee_active_frame
+        kick = self.is_kicking and self.kick_frame == self.melee_active_frame
+        if punch and kick:
+            return PUNCH_BOXES + KICK_BOXES
+        if punch:
+            return PUNCH_BOXES
+        if kick:
+            return KICK_BOXES
+        return ()
+
+    def stagger(self):
+        self.is_staggered = True
+        self.stagger_time = 0
+        self.schedule_end(T_STAGGER_START, self.stagger_recovery, self.end_stagger)
+
+    def end_stagger(self):
+        self.is_staggered = False
+
+    def set_eyes_on_fire(self):
+        self.is_eyes_on_fire = True
+        self.eyes_fire_duration = 0
+        self.schedule_end(T_EYES_FIRE_START, self.eyes_fire_max, self.end_fire_eyes)
+
+    def end_fire_eyes(self):
+        self.is_eyes_on_fire = False
+
+    def walk(self, direction):
+        # One frame of walking, -1 for left and 1 for right
+        x = self.position[0]
+        self.position[0] = self.stage.stop_x(x, x + self.move_speed * direction, self.position[1])
+
+    def step_physics(self):
+        # Friction, air resistance, gravity and collision with the stage,
+        # done in place on the physics array
+        p = self.physics
+        stage = self.stage
+        vx = p[VX] * self.friction + p[AX]
+        vy = p[VY] * self.air_resistance + p[AY] - self.gravity
+        vz = p[VZ] + p[AZ]
+
+        # Update position with physics, stopping at walls
+        y = p[PY]
+        new_x = p[PX] + vx
+        x = stage.stop_x(p[PX], new_x, y)
+        if x != new_x:
+            vx = 0.0
+        new_y = y + vy
+
+        # Check if landed, or bumped into something overhead
+        if vy < 0:
+            ground = stage.ground(x, y, new_y)
+            if ground is not None:
+                new_y = ground
+                vy = self.rest_velocity
+                self.is_jumping = False
+                self.can_double_jump = True  # Reset double jump when landing
+        elif vy > 0:
+            ceiling = stage.ceiling(x, y, new_y)
+            if ceiling is not None:
+                new_y = ceiling
+                vy = self.rest_velocity
+
+        p[PX] = x
+        p[PY] = new_y
+        p[PZ] += vz
+        p[VX] = vx
+        p[VY] = vy
+        p[VZ] = vz
+
+        # Reset acceleration
+        p[AX] = p[AY] = p[AZ] = 0.0
+
     def update_ai(self):
         self.ai_timer += 1
 
@@ -192,7 +456,7 @@ class Character:
         target_distance = abs(self.position[0] - (-3))  # Distance to player (at -3)
         
         # Change state more frequently when player is closer
-        state_change_interval = 60 if target_distance < 5 else 120  # Every 1 or 2 seconds
+        state_change_interval = self.ai_think_near if target_distance < 5 else self.ai_think_far
         if self.ai_timer % state_change_interval == 0:
             self.choose_ai_state(target_distance)
 
@@ -204,17 +468,17 @@ class Character:
             
             # Add some tactical movement
             if target_distance < 3:  # If too close, sometimes back away
-                if np.random.random() < 0.3:
+                if self.rng.random() < 0.3:
                     direction *= -1
             
             new_pos = self.position[0] + (self.move_speed * direction)
             if abs(new_pos) < 8:  # Stay within bounds
-                self.position[0] = new_pos
+                self.walk(direction)
 
         elif self.ai_state == 'attack':
             # Attack more frequently when closer to player
             attack_chance = 0.2 if target_distance < 5 else 0.1
-            if self.attack_cooldown <= 0 and np.random.random() < attack_chance:
+            if self.attack_cooldown <= 0 and self.rng.random() < attack_chance:
                 self.shoot()
                 self.attack_cooldown = self.attack_cooldown_max // 2  # Faster cooldown
 
@@ -223,48 +487,52 @@ class Character:
             if not self.is_jumping:
                 self.jump()
                 # Move sideways while jumping
-                direction = 1 if np.random.random() < 0.5 else -1
+                direction = 1 if self.rng.random() < 0.5 else -1
                 new_pos = self.position[0] + (self.move_speed * direction)
                 if abs(new_pos) < 8:
-                    self.position[0] = new_pos
+                    self.walk(direction)
 
     def choose_ai_state(self, target_distance):
         # Adjust probabilities based on distance to player
         if target_distance < 4:  # Close range
-            if np.random.random() < 0.6:  # 60% chance to attack when close
+            if self.rng.random() < 0.6:  # 60% chance to attack when close
                 self.ai_state = 'attack'
-            elif np.random.random() < 0.3:  # 30% chance to dodge
+            elif self.rng.random() < 0.3:  # 30% chance to dodge
                 self.ai_state = 'dodge'
             else:  # 10% chance to move
                 self.ai_state = 'move'
         else:  # Long range
-            if np.random.random() < 0.5:  # 50% chance to move closer
+            if self.rng.random() < 0.5:  # 50% chance to move closer
                 self.ai_state = 'move'
-            elif np.random.random() < 0.4:  # 40% chance to attack
+            elif self.rng.random() < 0.4:  # 40% chance to attack
                 self.ai_state = 'attack'
             else:  # 10% chance to dodge
                 self.ai_state = 'dodge'
 
+    def say(self, text):
+        if not self.quiet:
+            print(text)
+
     def jump(self):
         # First jump from ground
         if not self.is_jumping and self.jump_cooldown <= 0:
-            self.velocity.y = self.jump_speed
+            self.velocity[1] = self.jump_speed + self.rest_velocity
             self.is_jumping = True
             self.can_double_jump = True  # Reset double jump availability
             self.jump_cooldown = self.jump_cooldown_max
-            print("First Jump!")
+            self.say("First Jump!")
             return True
         # Double jump in air
         elif self.is_jumping and self.can_double_jump and self.jump_cooldown <= 0:
-            self.velocity.y = self.jump_speed * 1.5  # Higher double jump
+            self.velocity[1] = self.jump_speed * 1.5 + self.rest_velocity  # Higher double jump
             self.can_double_jump = False  # Use up double jump
             self.jump_cooldown = self.jump_cooldown_max
             
             # Add horizontal boost for double jumps
             direction = 1.0 if self.position[0] < 0 else -1.0
-            self.velocity.x += direction * 0.3
+            self.velocity[0] += direction * self.double_jump_push
             
-            print("Double Jump!")
+            self.say("Double Jump!")
             return True
         return False
 
@@ -279,248 +547,94 @@ class Character:
             projectile = Projectile(
                 position=start_pos,
                 direction=direction,
-                speed=0.1  # Consistent speed
+                speed=self.projectile_speed  # Consistent speed
             )
             self.projectiles.append(projectile)
             self.shoot_cooldown = self.shoot_cooldown_max
             return True
         return False
 
-    def draw(self):
+    def draw(self, queue, frustum=None, time_ms=None):
+        # Submits this character to the render queue. Returns the number of
+        # objects skipped by frustum culling.
         if self.is_exploding:
-            self.draw_explosion()
-            return
-            
-        glPushMatrix()
-        glTranslatef(*self.position)
-        glColor3f(*self.color)
+            return self.draw_explosion(queue, frustum)
+
+        culled = 0
+        # Evaluate this frame's animation curves once for all body parts
+        if time_ms is None:
+            time_ms = pygame.time.get_ticks()
+        self.animation.evaluate(time_ms)
+        
+        x, y, z = self.position
+        cx, cy, cz = self.bounds_center
+        if frustum is None or frustum.sphere_visible(x + cx, y + cy, z + cz, self.bounds_radius):
+            queue.submit(PASS_LIT, None, (x, y, z), self.draw_body)
+        else:
+            culled += 1
         
-        # Draw body
-        self.draw_torso()
+        # Draw fire breath if active (particles are tested on their own since
+        # the breath can reach the screen while the body is off it)
+        if self.is_breathing_fire:
+            culled += self.draw_fire_breath(queue, frustum)
+        
+        return culled
+
+    def draw_body(self):
+        # Drawn relative to the character's position. The static parts are
+        # baked meshes; only the flames are generated per frame.
+        meshes = get_meshes()
+        meshes.bind(self.palette)
+        meshes.draw('torso')
         
         # Draw head with face and horns
-        self.draw_head()
+        self.draw_head(meshes)
         
         # Draw limbs
-        self.draw_arms()
-        self.draw_legs()
-        
-        # Draw fire breath if active
-        if self.is_breathing_fire:
-            self.draw_fire_breath()
-        
-        glPopMatrix()
+        self.draw_arms(meshes)
+        self.draw_legs(meshes)
+        meshes.unbind()
 
-    def draw_head(self):
+    def draw_head(self, meshes):
         glPushMatrix()
         glTranslatef(0, 1.2, 0)
         
-        # Skull base
-        glColor3f(0.95, 0.95, 0.95)  # Bone white
-        self.draw_cube(0, 0, 0, 0.45)  # Slightly larger skull
-        
-        # Skull features
-        glColor3f(0.1, 0.1, 0.1)  # Darker black for depth
-        
-        # Deep eye sockets (more realistic)
-        glBegin(GL_QUADS)
-        # Left eye socket
-        glVertex3f(-0.15, 0.1, 0.23)
-        glVertex3f(-0.05, 0.1, 0.23)
-        glVertex3f(-0.05, -0.05, 0.23)
-        glVertex3f(-0.15, -0.05, 0.23)
-        # Add depth to left socket
-        glColor3f(0, 0, 0)  # Pure black for depth
-        glVertex3f(-0.14, 0.09, 0.231)
-        glVertex3f(-0.06, 0.09, 0.231)
-        glVertex3f(-0.06, -0.04, 0.231)
-        glVertex3f(-0.14, -0.04, 0.231)
-        
-        # Right eye socket
-        glColor3f(0.1, 0.1, 0.1)
-        glVertex3f(0.15, 0.1, 0.23)
-        glVertex3f(0.05, 0.1, 0.23)
-        glVertex3f(0.05, -0.05, 0.23)
-        glVertex3f(0.15, -0.05, 0.23)
-        # Add depth to right socket
-        glColor3f(0, 0, 0)
-        glVertex3f(0.14, 0.09, 0.231)
-        glVertex3f(0.06, 0.09, 0.231)
-        glVertex3f(0.06, -0.04, 0.231)
-        glVertex3f(0.14, -0.04, 0.231)
-        glEnd()
-        
-        # Nasal cavity (more detailed)
-        glBegin(GL_TRIANGLES)
-        glVertex3f(-0.03, -0.1, 0.23)
-        glVertex3f(0.03, -0.1, 0.23)
-        glVertex3f(0, -0.15, 0.23)
-        # Nasal bridge
-        glVertex3f(-0.02, -0.05, 0.23)
-        glVertex3f(0.02, -0.05, 0.23)
-        glVertex3f(0, -0.1, 0.23)
-        glEnd()
+        # Skull with eye sockets, nose, upper teeth and sutures
+        meshes.draw('skull')
         
         # Animated jaw
-        time = pygame.time.get_ticks() / 1000.0
-        jaw_angle = 20 * np.sin(time * 2)  # Oscillating jaw movement
-        
         glPushMatrix()
         glTranslatef(0, -0.2, 0)  # Move to jaw pivot point
-        glRotatef(jaw_angle, 1, 0, 0)  # Rotate around x-axis
-        
-        # Lower jaw bone
-        glColor3f(0.9, 0.9, 0.9)  # Slightly darker than skull
-        glBegin(GL_QUADS)
-        # Front of jaw
-        glVertex3f(-0.2, 0, 0.23)
-        glVertex3f(0.2, 0, 0.23)
-        glVertex3f(0.2, -0.15, 0.23)
-        glVertex3f(-0.2, -0.15, 0.23)
-        # Bottom of jaw
-        glVertex3f(-0.2, -0.15, 0.23)
-        glVertex3f(0.2, -0.15, 0.23)
-        glVertex3f(0.15, -0.15, 0)
-        glVertex3f(-0.15, -0.15, 0)
-        glEnd()
-        
-        # Lower teeth
-        glColor3f(1, 1, 1)
-        glBegin(GL_QUADS)
-        for i in range(4):
-            x = -0.15 + i * 0.1
-            glVertex3f(x, 0, 0.231)
-            glVertex3f(x + 0.08, 0, 0.231)
-            glVertex3f(x + 0.08, 0.05, 0.231)
-            glVertex3f(x, 0.05, 0.231)
-        glEnd()
+        glRotatef(self.animation.jaw_angle, 1, 0, 0)  # Rotate around x-axis
+        meshes.draw('jaw')
         glPopMatrix()
         
-        # Upper teeth (fixed in place)
-        glColor3f(1, 1, 1)
-        glBegin(GL_QUADS)
-        for i in range(4):
-            x = -0.15 + i * 0.1
-            glVertex3f(x, -0.2, 0.231)
-            glVertex3f(x + 0.08, -0.2, 0.231)
-            glVertex3f(x + 0.08, -0.15, 0.231)
-            glVertex3f(x, -0.15, 0.231)
-        glEnd()
-        
-        # Cranial details (suture lines)
-        glColor3f(0.8, 0.8, 0.8)
-        glBegin(GL_LINES)
-        # Coronal suture
-        glVertex3f(-0.22, 0.1, 0.23)
-        glVertex3f(0.22, 0.1, 0.23)
-        # Sagittal suture
-        glVertex3f(0, -0.1, 0.23)
-        glVertex3f(0, 0.22, 0.23)
-        glEnd()
-        
         # Draw flames
         self.draw_flames()
         
-        # Horns - now darker and more menacing
-        glColor3f(0.2, 0.2, 0.2)  # Even darker gray for horns
-        glBegin(GL_TRIANGLES)
-        # Left horn
-        glVertex3f(-0.2, 0.3, 0)
-        glVertex3f(-0.4, 0.9, 0)  # Made horns longer
-        glVertex3f(-0.1, 0.3, 0)
-        
-        # Right horn
-        glVertex3f(0.2, 0.3, 0)
-        glVertex3f(0.4, 0.9, 0)  # Made horns longer
-        glVertex3f(0.1, 0.3, 0)
-        glEnd()
+        # Horns
+        meshes.draw('horns')
         
         # Add wings
-        self.draw_wings()
+        self.draw_wings(meshes)
         
         glPopMatrix()
 
-    def draw_wings(self):
-        # Wing base color (blend with character color)
-        wing_color = [0.9 + c * 0.1 for c in self.color]
+    def draw_wings(self, meshes):
+        wing_flap = self.animation.wing_flap
         
-        # Animation
-        time = pygame.time.get_ticks() / 1000.0
-        wing_flap = np.sin(time * 2) * 15  # Slower, subtler flap
-        
-        # Left wing
+        # Left wing, low and behind the head
         glPushMatrix()
-        glColor3f(*wing_color)
-        # Move wing lower and further back
         glTranslatef(-0.4, -0.3, -0.3)
         glRotatef(wing_flap - 40, 0, 1, 0)  # Base angle + animation
-        
-        # Draw main wing segments with curved shape
-        for i in range(4):  # Four segments for longer wings
-            glBegin(GL_TRIANGLES)
-            # Main wing membrane with curved shape
-            glVertex3f(0, 0, 0)
-            glVertex3f(-1.0 - i * 0.5, 0.4 + np.sin(i * 0.8) * 0.3, -0.6 - i * 0.3)
-            glVertex3f(-0.8 - i * 0.5, -0.4 + np.sin(i * 0.8) * 0.3, -0.5 - i * 0.3)
-            
-            # Wing details (darker shade)
-            glColor3f(*[c * 0.7 for c in wing_color])
-            # Additional membrane details
-            glVertex3f(-0.2 - i * 0.4, 0.1 + np.sin(i * 0.8) * 0.2, -0.2 - i * 0.2)
-            glVertex3f(-0.7 - i * 0.5, 0.3 + np.sin(i * 0.8) * 0.2, -0.5 - i * 0.3)
-            glVertex3f(-0.6 - i * 0.5, -0.3 + np.sin(i * 0.8) * 0.2, -0.4 - i * 0.3)
-            glEnd()
-            
-            # Wing bones and veins
-            glColor3f(*[c * 0.6 for c in wing_color])
-            glBegin(GL_LINES)
-            # Main bone
-            glVertex3f(0, 0, 0)
-            glVertex3f(-1.2 - i * 0.5, np.sin(i * 0.8) * 0.3, -0.7 - i * 0.3)
-            # Secondary veins
-            for j in range(3):
-                t = j / 2.0
-                glVertex3f(-0.3 - i * 0.4 * t, 0.2 * t, -0.2 - i * 0.2 * t)
-                glVertex3f(-0.8 - i * 0.5 * t, -0.2 + np.sin(i * 0.8) * 0.3, -0.5 - i * 0.3 * t)
-            glEnd()
-            
-            glColor3f(*wing_color)  # Reset color for next segment
+        meshes.draw('left_wing')
         glPopMatrix()
         
         # Right wing (mirrored)
         glPushMatrix()
-        glColor3f(*wing_color)
         glTranslatef(0.4, -0.3, -0.3)
         glRotatef(-wing_flap + 40, 0, 1, 0)
-        
-        for i in range(4):
-            glBegin(GL_TRIANGLES)
-            # Main wing membrane
-            glVertex3f(0, 0, 0)
-            glVertex3f(1.0 + i * 0.5, 0.4 + np.sin(i * 0.8) * 0.3, -0.6 - i * 0.3)
-            glVertex3f(0.8 + i * 0.5, -0.4 + np.sin(i * 0.8) * 0.3, -0.5 - i * 0.3)
-            
-            # Wing details
-            glColor3f(*[c * 0.7 for c in wing_color])
-            glVertex3f(0.2 + i * 0.4, 0.1 + np.sin(i * 0.8) * 0.2, -0.2 - i * 0.2)
-            glVertex3f(0.7 + i * 0.5, 0.3 + np.sin(i * 0.8) * 0.2, -0.5 - i * 0.3)
-            glVertex3f(0.6 + i * 0.5, -0.3 + np.sin(i * 0.8) * 0.2, -0.4 - i * 0.3)
-            glEnd()
-            
-            # Wing bones and veins
-            glColor3f(*[c * 0.6 for c in wing_color])
-            glBegin(GL_LINES)
-            # Main bone
-            glVertex3f(0, 0, 0)
-            glVertex3f(1.2 + i * 0.5, np.sin(i * 0.8) * 0.3, -0.7 - i * 0.3)
-            # Secondary veins
-            for j in range(3):
-                t = j / 2.0
-                glVertex3f(0.3 + i * 0.4 * t, 0.2 * t, -0.2 - i * 0.2 * t)
-                glVertex3f(0.8 + i * 0.5 * t, -0.2 + np.sin(i * 0.8) * 0.3, -0.5 - i * 0.3 * t)
-            glEnd()
-            
-            glColor3f(*wing_color)
+        meshes.draw('right_wing')
         glPopMatrix()
 
     def draw_flames(self):
@@ -531,8 +645,9 @@ class Character:
             (1.0, 0.8, 0.0)   # Yellow
         ]
         
-        # Current time for animation
-        time = pygame.time.get_ticks() / 200.0
+        # Current animation values
+        flame_x = self.animation.flame_x
+        flame_height = self.animation.flame_height
         
         for i, color in enumerate(flame_colors):
             glColor3f(*color)
@@ -540,8 +655,8 @@ class Character:
             
             # Multiple flame tongues with wave effect
             for j in range(6):
-                x_offset = 0.1 * np.sin(time + j)
-                height = 0.3 + 0.1 * np.sin(time * 2 + j)
+                x_offset = flame_x[j]
+                height = flame_height[j]
                 width = 0.15 - i * 0.03  # Flames get thinner towards the center
                 
                 # Main flame
@@ -555,87 +670,59 @@ class Character:
                 glVertex3f(0 + x_offset, 0.2 + height*0.8, width*0.5)
             glEnd()
 
-    def draw_arms(self):
-        # Left arm with bicep
+    def draw_arms(self, meshes):
+        # The bicep flexes more as a punch goes on; each pose has its own mesh
+        punching = self.is_punching and self.punch_frame < self.melee_frames
+        arm = ARM_MESHES[self.melee_pose(self.punch_frame) if punching else 0]
+        
+        # Left arm
         glPushMatrix()
         glTranslatef(-0.6, 0.5, 0)
-        if self.is_punching and self.punch_frame < 10:
-            glRotatef(45 * self.punch_frame/10, 0, 0, 1)
-            # Flex bicep more during punch
-            bicep_flex = 0.3 + 0.1 * (self.punch_frame/10)
-        else:
-            bicep_flex = 0.3
-        
-        # Upper arm (bicep)
-        glColor3f(*[c * 0.9 for c in self.color])
-        self.draw_bicep(0, -0.2, 0, bicep_flex)
-        
-        # Tricep
-        glColor3f(*[c * 0.85 for c in self.color])
-        self.draw_tricep(0, -0.2, 0, 0.2)
-        
-        # Lower arm with muscles
-        glColor3f(*self.color)
-        self.draw_limb(0.2, 0.6, True)
+        if punching:
+            glRotatef(45 * self.punch_frame/self.melee_frames, 0, 0, 1)
+        meshes.draw(arm)
         glPopMatrix()
         
         # Right arm (mirror of left)
         glPushMatrix()
         glTranslatef(0.6, 0.5, 0)
-        if self.is_punching and self.punch_frame < 10:
-            glRotatef(-45 * self.punch_frame/10, 0, 0, 1)
-            bicep_flex = 0.3 + 0.1 * (self.punch_frame/10)
-        else:
-            bicep_flex = 0.3
-        
-        glColor3f(*[c * 0.9 for c in self.color])
-        self.draw_bicep(0, -0.2, 0, bicep_flex)
-        
-        glColor3f(*[c * 0.85 for c in self.color])
-        self.draw_tricep(0, -0.2, 0, 0.2)
-        
-        glColor3f(*self.color)
-        self.draw_limb(0.2, 0.6, True)
+        if punching:
+            glRotatef(-45 * self.punch_frame/self.melee_frames, 0, 0, 1)
+        meshes.draw(arm)
         glPopMatrix()
 
-    def draw_legs(self):
+    def draw_legs(self, meshes):
+        # Leg muscles flex (a wider mesh) during a kick
+        kicking = self.is_kicking and self.kick_frame < self.melee_frames
+        leg = KICK_LEG_MESH if kicking else LEG_MESH
+        
         # Left leg
         glPushMatrix()
         glTranslatef(-0.3, -1, 0)
-        if self.is_kicking and self.kick_frame < 10:
-            glRotatef(-90 * self.kick_frame/10, 0, 0, 1)
-            glTranslatef(0, 0.3 * self.kick_frame/10, 0)
-            # Flex leg muscles during kick
-            muscle_flex = 1.2
-        else:
-            muscle_flex = 1.0
-        
-        glColor3f(*self.color)
-        self.draw_limb(0.25 * muscle_flex, 0.8, False)  # Wider leg with muscle definition
+        if kicking:
+            glRotatef(-90 * self.kick_frame/self.melee_frames, 0, 0, 1)
+            glTranslatef(0, 0.3 * self.kick_frame/self.melee_frames, 0)
+        meshes.draw(leg)
         glPopMatrix()
         
         # Right leg
         glPushMatrix()
         glTranslatef(0.3, -1, 0)
-        if self.is_kicking and self.kick_frame < 10:
-            glRotatef(90 * self.kick_frame/10, 0, 0, 1)
-            glTranslatef(0, 0.3 * self.kick_frame/10, 0)
-            muscle_flex = 1.2
-        else:
-            muscle_flex = 1.0
-        
-        glColor3f(*self.color)
-        self.draw_limb(0.25 * muscle_flex, 0.8, False)
+        if kicking:
+            glRotatef(90 * self.kick_frame/self.melee_frames, 0, 0, 1)
+            glTranslatef(0, 0.3 * self.kick_frame/self.melee_frames, 0)
+        meshes.draw(leg)
         glPopMatrix()
 
     def punch(self):
         if self.melee_cooldown <= 0 and not self.is_punching:
             self.is_punching = True
             self.punch_frame = 0
-            self.melee_cooldown = 20
+            self.melee_cooldown = self.punch_cooldown_max
+            self.schedule_end(T_PUNCH_START, self.melee_frames, self.end_punch)
             # Add forward momentum to punch
             direction = 1.0 if self.position[0] < 0 else -1.0
-            self.velocity.x += direction * 0.1
+            self.velocity[0] += direction * self.punch_push
             return True
         return False
 
@@ -643,268 +730,94 @@ class Character:
         if self.melee_cooldown <= 0 and not self.is_kicking:
             self.is_kicking = True
             self.kick_frame = 0
-            self.melee_cooldown = 30
+            self.melee_cooldown = self.kick_cooldown_max
+            self.schedule_end(T_KICK_START, self.melee_frames, self.end_kick)
             # Add upward and forward momentum to kick
             direction = 1.0 if self.position[0] < 0 else -1.0
-            self.velocity.x += direction * 0.15
-            self.velocity.y += 0.1
+            self.velocity[0] += direction * self.kick_push
+            self.velocity[1] += self.kick_lift
             return True
         return False
 
-    def draw_torso(self):
-        glPushMatrix()
-        glTranslatef(0, 0, 0)
-        
-        # Main body (torso)
-        glColor3f(*self.color)
-        self.draw_cube(0, 0, 0, 0.8)  # Base torso
-        
-        # Add chest muscles
-        glColor3f(*[c * 0.8 for c in self.color])  # Slightly darker shade
-        glPushMatrix()
-        glTranslatef(0, 0.2, 0.41)  # Move slightly forward
-        
-        # Left pec
-        glBegin(GL_TRIANGLES)
-        glVertex3f(-0.3, 0.2, 0)
-        glVertex3f(-0.1, 0, 0)
-        glVertex3f(-0.3, -0.1, 0)
-        glEnd()
-        
-        # Right pec
-        glBegin(GL_TRIANGLES)
-        glVertex3f(0.3, 0.2, 0)
-        glVertex3f(0.1, 0, 0)
-        glVertex3f(0.3, -0.1, 0)
-        glEnd()
-        
-        glPopMatrix()
-        glPopMatrix()
-
-    def draw_limb(self, width, length, is_arm=True):
-        # Base limb shape
-        glBegin(GL_QUADS)
-        # Front face
-        glVertex3f(-width/2, 0, width/2)
-        glVertex3f(width/2, 0, width/2)
-        glVertex3f(width/2, -length, width/2)
-        glVertex3f(-width/2, -length, width/2)
-        # Back face
-        glVertex3f(-width/2, 0, -width/2)
-        glVertex3f(width/2, 0, -width/2)
-        glVertex3f(width/2, -length, -width/2)
-        glVertex3f(-width/2, -length, -width/2)
-        # Side faces
-        glVertex3f(-width/2, 0, -width/2)
-        glVertex3f(-width/2, 0, width/2)
-        glVertex3f(-width/2, -length, width/2)
-        glVertex3f(-width/2, -length, -width/2)
-        
-        glVertex3f(width/2, 0, -width/2)
-        glVertex3f(width/2, 0, width/2)
-        glVertex3f(width/2, -length, width/2)
-        glVertex3f(width/2, -length, -width/2)
-        glEnd()
-
-        # Add muscle definition
-        glColor3f(*[c * 0.85 for c in self.color])  # Slightly darker for muscles
-        
-        if is_arm:
-            # Forearm muscle bulge
-            glBegin(GL_TRIANGLES)
-            # Front bulge
-            glVertex3f(-width/3, -length*0.3, width/2 + 0.05)
-            glVertex3f(width/3, -length*0.3, width/2 + 0.05)
-            glVertex3f(0, -length*0.6, width/2 + 0.08)
-            glEnd()
-        else:
-            # Calf muscle
-            glBegin(GL_TRIANGLES)
-            # Back calf bulge
-            glVertex3f(-width/2, -length*0.3, -width/2 - 0.05)
-            glVertex3f(width/2, -length*0.3, -width/2 - 0.05)
-            glVertex3f(0, -length*0.6, -width/2 - 0.1)
-            # Side calf bulges
-            glVertex3f(-width/2 - 0.05, -length*0.3, 0)
-            glVertex3f(-width/2 - 0.05, -length*0.6, 0)
-            glVertex3f(-width/2, -length*0.45, 0)
-            
-            glVertex3f(width/2 + 0.05, -length*0.3, 0)
-            glVertex3f(width/2 + 0.05, -length*0.6, 0)
-            glVertex3f(width/2, -length*0.45, 0)
-            glEnd()
+    def end_punch(self):
+        self.is_punching = False
 
-    def draw_bicep(self, x, y, z, size):
-        # Draw a bulging bicep
-        glPushMatrix()
-        glTranslatef(x, y, z)
-        
-        # Main bicep bulge
-        glBegin(GL_TRIANGLES)
-        # Front bulge
-        glVertex3f(-size, 0, size)
-        glVertex3f(size, 0, size)
-        glVertex3f(0, size*1.5, size*0.8)
-        # Back bulge
-        glVertex3f(-size, 0, -size)
-        glVertex3f(size, 0, -size)
-        glVertex3f(0, size*1.5, -size*0.8)
-        # Side bulges
-        glVertex3f(-size, 0, -size)
-        glVertex3f(-size, 0, size)
-        glVertex3f(0, size*1.5, 0)
-        
-        glVertex3f(size, 0, -size)
-        glVertex3f(size, 0, size)
-        glVertex3f(0, size*1.5, 0)
-        glEnd()
-        
-        glPopMatrix()
+    def end_kick(self):
+        self.is_kicking = False
 
-    def draw_tricep(self, x, y, z, size):
-        glPushMatrix()
-        glTranslatef(x, y, z)
-        
-        glBegin(GL_TRIANGLES)
-        # Back tricep bulge
-        glVertex3f(-size, 0, -size)
-        glVertex3f(size, 0, -size)
-        glVertex3f(0, -size*1.2, -size*1.2)
-        glEnd()
-        
-        glPopMatrix()
+    def draw_explosion(self, queue, frustum=None):
+        # Only the on-screen particles are handed to the particle pass
+        particles = self.explosion_particles
+        visible = particles.visible_mask(frustum)
+        visible_count = int(np.count_nonzero(visible))
+        if visible_count:
+            queue.submit(PASS_PARTICLES, None, None, self.draw_explosion_particles, visible)
+        return len(particles) - visible_count
 
-    def draw_cube(self, x, y, z, size=1.0):
-        # Helper function to draw a cube of given size
-        glPushMatrix()
-        glTranslatef(x, y, z)
-        glBegin(GL_QUADS)
-        # Front face
-        glVertex3f(-size/2, -size/2, size/2)
-        glVertex3f(size/2, -size/2, size/2)
-        glVertex3f(size/2, size/2, size/2)
-        glVertex3f(-size/2, size/2, size/2)
-        # Back face
-        glVertex3f(-size/2, -size/2, -size/2)
-        glVertex3f(-size/2, size/2, -size/2)
-        glVertex3f(size/2, size/2, -size/2)
-        glVertex3f(size/2, -size/2, -size/2)
-        # Top face
-        glVertex3f(-size/2, size/2, -size/2)
-        glVertex3f(-size/2, size/2, size/2)
-        glVertex3f(size/2, size/2, size/2)
-        glVertex3f(size/2, size/2, -size/2)
-        # Bottom face
-        glVertex3f(-size/2, -size/2, -size/2)
-        glVertex3f(size/2, -size/2, -size/2)
-        glVertex3f(size/2, -size/2, size/2)
-        glVertex3f(-size/2, -size/2, size/2)
-        # Right face
-        glVertex3f(size/2, -size/2, -size/2)
-        glVertex3f(size/2, size/2, -size/2)
-        glVertex3f(size/2, size/2, size/2)
-        glVertex3f(size/2, -size/2, size/2)
-        # Left face
-        glVertex3f(-size/2, -size/2, -size/2)
-        glVertex3f(-size/2, -size/2, size/2)
-        glVertex3f(-size/2, size/2, size/2)
-        glVertex3f(-size/2, size/2, -size/2)
-        glEnd()
-        glPopMatrix()
-
-    def draw_explosion(self):
-        # Draw explosion particles
-        for particle in self.explosion_particles:
-            glPushMatrix()
-            glTranslatef(*particle['position'])
-            
-            # Draw particle as a colored quad
-            glColor3f(*particle['color'])
-            size = particle['size']
-            glBegin(GL_QUADS)
-            glVertex3f(-size, -size, 0)
-            glVertex3f(size, -size, 0)
-            glVertex3f(size, size, 0)
-            glVertex3f(-size, size, 0)
-            glEnd()
-            
-            glPopMatrix()
+    def draw_explosion_particles(self, visible):
+        # All particles go out in one batch as colored quads
+        self.explosion_particles.draw(GL_QUADS, visible)
 
     def breathe_fire(self):
         if not self.is_breathing_fire and self.fire_breath_cooldown <= 0:
             self.is_breathing_fire = True
             self.fire_breath_duration = 0
-            self.fire_breath_particles = []
+            self.fire_breath_particles.clear()
+            self.schedule_end(T_FIRE_BREATH_START, self.fire_breath_max, self.stop_fire_breath)
             return True
         return False
 
     def stop_fire_breath(self):
         self.is_breathing_fire = False
-        self.fire_breath_duration = 0
         self.fire_breath_cooldown = self.fire_breath_cooldown_max
-        self.fire_breath_particles = []
+        self.fire_breath_particles.clear()
 
     def update_fire_breath(self):
-        # Add new particles with character's color
+        # Add new particles with character's color. The flames look the same
+        # at any tick rate: fewer, faster particles per tick at low rates.
         direction = 1.0 if self.position[0] < 0 else -1.0
-        for _ in range(5):
-            spread = np.random.uniform(-0.3, 0.3)
-            speed = np.random.uniform(0.4, 0.6)
-            
-            # Create color gradient from character color to white
-            base_color = self.color
-            random_intensity = np.random.uniform(0.5, 1.0)
-            particle_color = [
-                min(1.0, c + (1.0 - c) * random_intensity)
-                for c in base_color
-            ]
-            
-            self.fire_breath_particles.append({
-                'position': [
-                    self.position[0] + direction * 0.5,
-                    self.position[1] + 1.2,
-                    self.position[2]
-                ],
-                'velocity': [direction * speed, spread * 0.2, spread],
-                'size': np.random.uniform(0.2, 0.4),
-                'life': 30,
-                'color': particle_color
-            })
+        base_ticks = self.tick_rate.base_ticks
+        particles = self.fire_breath_particles
+        new = particles.emit(max(1, round(5 * base_ticks)))
+        n = new.stop - new.start
+        spread = self.rng.uniform(-0.3, 0.3, n) * base_ticks
+        speed = self.rng.uniform(0.4, 0.6, n) * base_ticks
+        
+        # Create color gradient from character color to white
+        random_intensity = self.rng.uniform(0.5, 1.0, n)[:, None]
+        base_color = self.color
+        particles.color[new] = np.minimum(1.0, np.add(base_color, np.subtract(1.0, base_color) * random_intensity))
+        
+        particles.position[new] = (
+            self.position[0] + direction * 0.5,
+            self.position[1] + 1.2,
+            self.position[2]
+        )
+        particles.velocity[new, 0] = direction * speed
+        particles.velocity[new, 1] = spread * 0.2
+        particles.velocity[new, 2] = spread
+        particles.size[new] = self.rng.uniform(0.2, 0.4, n)
+        particles.life[new] = self.fire_particle_life
 
         # Update existing particles
-        for particle in self.fire_breath_particles:
-            particle['position'][0] += particle['velocity'][0]
-            particle['position'][1] += particle['velocity'][1]
-            particle['position'][2] += particle['velocity'][2]
-            particle['life'] -= 1
-            particle['size'] *= 0.98  # Slower shrinking
+        particles.advance(shrink=0.98 ** base_ticks, stage=self.stage)  # Slower shrinking
 
         # Remove dead particles
-        self.fire_breath_particles = [p for p in self.fire_breath_particles if p['life'] > 0]
-
-    def draw_fire_breath(self):
-        for particle in self.fire_breath_particles:
-            glPushMatrix()
-            pos = particle['position']
-            glTranslatef(pos[0] - self.position[0], pos[1] - self.position[1], pos[2] - self.position[2])
-            
-            # Use particle's stored color
-            life_ratio = particle['life'] / 30.0
-            base_color = particle['color']
-            glColor3f(
-                base_color[0] * life_ratio,
-                base_color[1] * life_ratio,
-                base_color[2] * life_ratio
-            )
-            
-            size = particle['size']
-            glBegin(GL_TRIANGLES)
-            glVertex3f(-size, -size, 0)
-            glVertex3f(size, -size, 0)
-            glVertex3f(0, size, 0)
-            glEnd()
-            
-            glPopMatrix()
+        particles.remove_dead()
+
+    def draw_fire_breath(self, queue, frustum=None):
+        particles = self.fire_breath_particles
+        visible = particles.visible_mask(frustum)
+        visible_count = int(np.count_nonzero(visible))
+        if visible_count:
+            queue.submit(PASS_PARTICLES, None, None, self.draw_fire_breath_particles, visible)
+        return len(particles) - visible_count
+
+    def draw_fire_breath_particles(self, visible):
+        # Particles fade out with their remaining life
+        particles = self.fire_breath_particles
+        life_ratio = particles.life[:particles.count] / float(self.fire_particle_life)
+        particles.draw(GL_TRIANGLES, visible, color_scale=life_ratio)
 
     def draw_fire_eyes(self):
         # Base colors using character's color
@@ -914,7 +827,7 @@ class Character:
             (1.0, 1.0, 1.0)  # White core
         ]
         
-        time = pygame.time.get_ticks() / 100.0
+        eye_wave = self.animation.eye_wave
         
         # Draw fire for each eye
         for x_offset in [-0.1, 0.1]:  # Left and right eye positions
@@ -924,7 +837,7 @@ class Character:
                 
                 # Multiple flame tongues
                 for j in range(4):
-                    wave = 0.02 * np.sin(time + j * 2)
+                    wave = eye_wave[j]
                     height = 0.08 - i * 0.02
                     width = 0.05 - i * 0.01
                     
@@ -933,133 +846,124 @@ class Character:
                     glVertex3f(x_offset + wave, 0.05 + height, 0.22)
                 glEnd()
 
+
+# Fighter classes compiled for other tick rates, by (class, rate)
+_RATE_CLASSES = {}
+
+# Character itself plays at BASE_RATE
+for _name, _value in Character.tick_rate.compile(Character.TUNING).items():
+    setattr(Character, _name, _value)
+
+
 class Projectile:
+    # Collision sphere around the missile body
+    hit_radius = 0.2
+    # Distance from the origin at which a missile that hit nothing is gone
+    max_range = 10
+
     def __init__(self, position, direction, speed=0.1):
         self.position = list(position)
         self.direction = direction
         self.speed = speed
         self.active = True
         # Enhance trail effect
-        self.trail = []
         self.trail_length = 15
         self.trail_fade = 0.8
-
-    def update(self):
-        # Add current position to trail
-        self.trail.append(list(self.position))
-        # Keep trail at fixed length
-        if len(self.trail) > self.trail_length:
-            self.trail.pop(0)
+        # Trail points live in a fixed ring buffer (x, y, z per point) so
+        # updating the trail never allocates
+        self.trail = array('d', bytes(8 * 3 * self.trail_length))
+        self.trail_start = 0
+        self.trail_count = 0
+
+    def clone(self):
+        copy = type(self)(self.position, self.direction, self.speed)
+        copy.active = self.active
+        copy.trail[:] = self.trail
+        copy.trail_start = self.trail_start
+        copy.trail_count = self.trail_count
+        return copy
+
+    def restore_trail(self, count):
+        # Rebuilds a trail of `count` points behind the missile. Missiles fly
+        # in a straight line, so this is the trail it would have left.
+        self.trail_start = 0
+        self.trail_count = min(count, self.trail_length)
+        trail = self.trail
+        for i in range(self.trail_count):
+            steps = self.trail_count - i
+            for axis in range(3):
+                trail[i * 3 + axis] = self.position[axis] - self.direction[axis] * self.speed * steps
+
+    def update(self, frames=1):
+        # Flies `frames` frames' worth of the way (more than one for a coarse
+        # step, see Match.update); the trail only gets one point per call
+        self.add_trail_point()
         
         # Update position based on direction and speed
-        self.position[0] += self.direction[0] * self.speed
-        self.position[1] += self.direction[1] * self.speed
-        self.position[2] += self.direction[2] * self.speed
+        self.position[0] += self.direction[0] * self.speed * frames
+        self.position[1] += self.direction[1] * self.speed * frames
+        self.position[2] += self.direction[2] * self.speed * frames
         
         # Deactivate if too far from origin
-        if abs(self.position[0]) > 10 or abs(self.position[1]) > 10:
+        if abs(self.position[0]) > self.max_range or abs(self.position[1]) > self.max_range:
             self.active = False
 
-    def draw(self):
+    def add_trail_point(self):
+        # Add current position to trail, overwriting the oldest point once
+        # the trail is at full length
+        if self.trail_count < self.trail_length:
+            index = (self.trail_start + self.trail_count) % self.trail_length
+            self.trail_count += 1
+        else:
+            index = self.trail_start
+            self.trail_start = (self.trail_start + 1) % self.trail_length
+        trail = self.trail
+        position = self.position
+        trail[index * 3] = position[0]
+        trail[index * 3 + 1] = position[1]
+        trail[index * 3 + 2] = position[2]
+
+    def bounding_sphere(self):
+        # Centered on the missile with enough radius to cover the fins and
+        # the trail left behind it
+        x, y, z = self.position
+        return x, y, z, 0.6 + self.speed * self.trail_count
+
+    def draw(self, queue):
         if not self.active:
             return
-            
-        glPushMatrix()
         
+        # The trail is an unlit effect in world space; the body is lit and
+        # drawn relative to the missile's position
+        queue.submit(PASS_PARTICLES, None, None, self.draw_trail)
+        queue.submit(PASS_LIT, None, tuple(self.position), self.draw_body)
+
+    def draw_trail(self):
         # Draw trail with enhanced effect
+        trail = self.trail
+        count = self.trail_count
         glBegin(GL_QUAD_STRIP)
-        for i, pos in enumerate(self.trail):
+        # Oldest point first
+        for i in range(count):
+            index = (self.trail_start + i) % self.trail_length * 3
+            x, y, z = trail[index], trail[index + 1], trail[index + 2]
             # Calculate fade based on position in trail
-            alpha = (i / len(self.trail)) * self.trail_fade
+            alpha = (i / count) * self.trail_fade
             # Trail color: brighter orange/red gradient
             glColor3f(1.0, alpha * 0.8, alpha * 0.2)
             
             # Create width for trail with pulsing effect
-            trail_width = 0.15 * alpha * (1 + 0.2 * np.sin(i * 0.5))
-            glVertex3f(pos[0], pos[1] + trail_width, pos[2])
-            glVertex3f(pos[0], pos[1] - trail_width, pos[2])
+            trail_width = 0.15 * alpha * TRAIL_PULSE[i]
+            glVertex3f(x, y + trail_width, z)
+            glVertex3f(x, y - trail_width, z)
         glEnd()
-        
-        # Draw missile body
-        glTranslatef(*self.position)
-        
+
+    def draw_body(self):
+        meshes = get_meshes()
+        meshes.bind()
         # Rotate missile to face direction of travel
         if self.direction[0] < 0:
             glRotatef(180, 0, 1, 0)
-        
-        # Draw missile body (elongated shape)
-        glColor3f(0.8, 0.8, 0.8)  # Metallic gray
-        
-        # Main body (cylinder-like)
-        glBegin(GL_QUADS)
-        size = 0.1
-        length = 0.4
-        
-        # Body
-        glVertex3f(-length, -size, size)
-        glVertex3f(length, -size, size)
-        glVertex3f(length, size, size)
-        glVertex3f(-length, size, size)
-        
-        glVertex3f(-length, -size, -size)
-        glVertex3f(-length, size, -size)
-        glVertex3f(length, size, -size)
-        glVertex3f(length, -size, -size)
-        
-        glVertex3f(-length, size, -size)
-        glVertex3f(-length, size, size)
-        glVertex3f(length, size, size)
-        glVertex3f(length, size, -size)
-        
-        glVertex3f(-length, -size, -size)
-        glVertex3f(length, -size, -size)
-        glVertex3f(length, -size, size)
-        glVertex3f(-length, -size, size)
-        glEnd()
-        
-        # Nose cone (red tip)
-        glColor3f(1.0, 0.0, 0.0)  # Red
-        glBegin(GL_TRIANGLES)
-        glVertex3f(length, 0, 0)  # Tip
-        glVertex3f(length-0.2, size, size)  # Base
-        glVertex3f(length-0.2, -size, size)
-        
-        glVertex3f(length, 0, 0)  # Tip
-        glVertex3f(length-0.2, -size, -size)
-        glVertex3f(length-0.2, size, -size)
-        
-        glVertex3f(length, 0, 0)  # Tip
-        glVertex3f(length-0.2, size, size)
-        glVertex3f(length-0.2, size, -size)
-        
-        glVertex3f(length, 0, 0)  # Tip
-        glVertex3f(length-0.2, -size, -size)
-        glVertex3f(length-0.2, -size, size)
-        glEnd()
-        
-        # Fins
-        glColor3f(0.7, 0.7, 0.7)  # Lighter gray
-        glBegin(GL_TRIANGLES)
-        fin_size = 0.2
-        
-        # Top fin
-        glVertex3f(-length, size, 0)
-        glVertex3f(-length+0.2, size+fin_size, 0)
-        glVertex3f(-length+0.4, size, 0)
-        
-        # Bottom fin
-        glVertex3f(-length, -size, 0)
-        glVertex3f(-length+0.2, -size-fin_size, 0)
-        glVertex3f(-length+0.4, -size, 0)
-        
-        # Side fins
-        glVertex3f(-length, 0, size)
-        glVertex3f(-length+0.2, 0, size+fin_size)
-        glVertex3f(-length+0.4, 0, size)
-        
-        glVertex3f(-length, 0, -size)
-        glVertex3f(-length+0.2, 0, -size-fin_size)
-        glVertex3f(-length+0.4, 0, -size)
-        glEnd()
-        
-        glPopMatrix()
\ No newline at end of file
+        # Gray body, red nose cone and fins
+        meshes.draw('projectile')
+        meshes.unbind()
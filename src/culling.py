@@ -0,0 +1,45 @@
+import numpy as np
+from OpenGL.GL import *
+
+
+class Frustum:
+    # Six clip planes (left, right, bottom, top, near, far) pulled out of the
+    # combined projection * modelview matrix. Each plane is (a, b, c, d) with
+    # the normal pointing into the view volume, so a point is inside when
+    # a*x + b*y + c*z + d >= 0 for every plane.
+    def __init__(self, projection, modelview):
+        clip = np.asarray(projection, dtype=np.float64) @ np.asarray(modelview, dtype=np.float64)
+        planes = np.array([
+            clip[3] + clip[0],  # Left
+            clip[3] - clip[0],  # Right
+            clip[3] + clip[1],  # Bottom
+            clip[3] - clip[1],  # Top
+            clip[3] + clip[2],  # Near
+            clip[3] - clip[2],  # Far
+        ])
+        # Normalize so the plane equation gives a true distance for sphere tests
+        planes /= np.linalg.norm(planes[:, :3], axis=1)[:, None]
+        self.planes = planes
+        # Plain tuples are much faster than numpy scalars for single-object tests
+        self._plane_tuples = [tuple(float(v) for v in plane) for plane in planes]
+
+    @classmethod
+    def from_gl(cls):
+        # OpenGL hands matrices back column-major, so transpose into row-major
+        projection = np.array(glGetFloatv(GL_PROJECTION_MATRIX), dtype=np.float64).reshape(4, 4).T
+        modelview = np.array(glGetFloatv(GL_MODELVIEW_MATRIX), dtype=np.float64).reshape(4, 4).T
+        return cls(projection, modelview)
+
+    def sphere_visible(self, x, y, z, radius):
+        for a, b, c, d in self._plane_tuples:
+            if a * x + b * y + c * z + d < -radius:
+                return False
+        return True
+
+    def spheres_visible(self, centers, radii):
+        # Vectorized version for particle batches: returns a boolean mask
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+        if len(centers) == 0:
+            return np.zeros(0, dtype=bool)
+        distances = centers @ self.planes[:, :3].T + self.planes[:, 3]
+        return np.all(distances >= -np.asarray(radii, dtype=np.float64).reshape(-1, 1), axis=1)
@@ -0,0 +1,109 @@
+import argparse
+import time
+
+import numpy as np
+
+from src.match import Match
+from src.stage import STAGES, DEFAULT_STAGE
+
+# Coarse steps checked by default, in frames
+DEFAULT_STEPS = (2, 4, 8)
+
+
+def play(seed, inputs, frames, coarse, stage=DEFAULT_STAGE):
+    # Plays `inputs` (one pair per step, held for `frames` frames) and
+    # returns both fighters' strength after every step and the time taken.
+    # A fine run applies each pair and then steps single frames, which is
+    # what the coarse run has to agree with.
+    strengths = []
+    match = Match(seed=seed, stage=stage, quiet=True)
+    match.simulate_effects = False
+    start = time.perf_counter()
+    for inputs1, inputs2 in inputs:
+        if not match.running:
+            break
+        if coarse:
+            match.step(inputs1, inputs2, frames)
+        else:
+            match.step(inputs1, inputs2)
+            for _ in range(frames - 1):
+                if not match.running:
+                    break
+                match.update()
+        strengths.append((match.player1.strength, match.player2.strength))
+    elapsed = time.perf_counter() - start
+    return strengths, elapsed
+
+
+def outcome(strengths):
+    # Strengths after each step up to a knockout, rounded past the last bits
+    # that depend on the order damage was added in, and which fighters were
+    # knocked out in the step that ended it. A knockout in the middle of a
+    # coarse step only starts the explosion at its end, and until then the
+    # loser can still burn the winner a little, so that step is compared by
+    # knockouts alone.
+    steps = []
+    for strength1, strength2 in strengths:
+        if strength1 <= 0 or strength2 <= 0:
+            return steps, (strength1 <= 0, strength2 <= 0)
+        steps.append((round(strength1, 9), round(strength2, 9)))
+    return steps, None
+
+
+def check_parity(seed, frames, duration=1800, stage=DEFAULT_STAGE):
+    # Runs one random match of `duration` frames fine and in coarse steps of
+    # `frames`, and compares their hit outcomes step by step: the same
+    # damage has to have landed by the end of every step.
+    rng = np.random.default_rng(seed)
+    inputs = [(int(rng.integers(0, 128)), int(rng.integers(0, 128)))
+              for _ in range(duration // frames)]
+    fine, fine_time = play(seed, inputs, frames, coarse=False, stage=stage)
+    coarse, coarse_time = play(seed, inputs, frames, coarse=True, stage=stage)
+    (fine, fine_knockout), (coarse, coarse_knockout) = outcome(fine), outcome(coarse)
+    mismatch = next((step for step, (a, b) in enumerate(zip(fine, coarse)) if a != b), None)
+    if mismatch is None and (len(fine) != len(coarse) or fine_knockout != coarse_knockout):
+        mismatch = min(len(fine), len(coarse))
+    # Steps in which someone lost strength
+    hits = sum(1 for previous, current in zip([(100, 100)] + fine, fine) if current != previous)
+    return {
+        'steps': len(fine),
+        'hits': hits,
+        'knockout': fine_knockout is not None,
+        'mismatch': mismatch,
+        'fine_s': fine_time,
+        'coarse_s': coarse_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that coarse simulation steps give the same hits as single frames")
+    parser.add_argument('--matches', type=int, default=20, help='random matches per step size')
+    parser.add_argument('--frames', type=int, nargs='+', default=DEFAULT_STEPS,
+                        help='coarse step sizes to check')
+    parser.add_argument('--duration', type=int, default=1800, help='frames per match')
+    parser.add_argument('--stage', choices=sorted(STAGES), default=DEFAULT_STAGE, help='stage to play on')
+    args = parser.parse_args()
+
+    failed = False
+    for frames in args.frames:
+        hits = mismatches = 0
+        fine_time = coarse_time = 0.0
+        for seed in range(args.matches):
+            result = check_parity(seed, frames, args.duration, args.stage)
+            hits += result['hits']
+            fine_time += result['fine_s']
+            coarse_time += result['coarse_s']
+            if result['mismatch'] is not None:
+                mismatches += 1
+                print(f"  seed {seed}: hits differ from step {result['mismatch']} "
+                      f"(frame {result['mismatch'] * frames})")
+        failed = failed or mismatches > 0
+        print(f"{frames} frames per step: {args.matches - mismatches}/{args.matches} matches agree "
+              f"({hits} steps with hits), {fine_time / coarse_time:.2f}x faster than single frames")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
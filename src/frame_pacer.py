@@ -0,0 +1,76 @@
+import time
+
+# Never sleep closer to a deadline than this; the rest is spun
+MIN_SPIN_NS = 200_000
+
+
+class FramePacer:
+    # Holds the game loop to `rate` frames per second, in place of
+    # pygame.time.Clock.tick, which sleeps in whole milliseconds and counts
+    # from the end of the last tick rather than from a fixed schedule.
+    #
+    # Deadlines are laid out every 1/rate seconds on the perf_counter_ns
+    # clock. wait() sleeps until shortly before the next one and spins the
+    # rest of the way. The spin margin follows how late the OS has woken us
+    # recently, so it is only as long as this machine needs. A frame that
+    # reaches wait() after its deadline is counted as missed and the next one
+    # starts at once; one that is more than a whole frame late restarts the
+    # schedule from now instead of rushing several frames out to catch up.
+    #
+    # With vsync the buffer swap itself waits for the display, so wait() only
+    # sleeps until one refresh before the deadline and lets the swap finish
+    # the job (a display refreshing at the target rate means no sleep at
+    # all). Spinning would only push frames past the vblank they were aimed at.
+    #
+    # Each wait() reports the interval since the previous frame was let go
+    # and whether the deadline was missed to frame_stats, if given.
+    def __init__(self, rate=60, frame_stats=None, vsync=False, refresh_rate=None):
+        self.rate = rate
+        self.period_ns = round(1e9 / rate)
+        self.frame_stats = frame_stats
+        self.vsync = vsync
+        self.refresh_ns = round(1e9 / (refresh_rate or rate))
+        self.spin_ns = MIN_SPIN_NS
+        self.deadline = None
+        self.last_release = None
+        self.missed = 0
+        if frame_stats is not None:
+            frame_stats.target_rate = rate
+
+    def reset(self):
+        # Starts the schedule over, for example after a pause in the loop
+        self.deadline = None
+        self.last_release = None
+
+    def wait(self):
+        now = time.perf_counter_ns()
+        if self.deadline is None:
+            self.deadline = now
+        deadline = self.deadline + self.period_ns
+        missed = now > deadline
+        if missed:
+            self.missed += 1
+            if now - deadline > self.period_ns:
+                deadline = now
+        elif self.vsync:
+            self._sleep_until(deadline - self.refresh_ns)
+        else:
+            self._sleep_until(deadline - self.spin_ns)
+            while time.perf_counter_ns() < deadline:
+                pass
+        self.deadline = deadline
+
+        release = time.perf_counter_ns()
+        if self.last_release is not None and self.frame_stats is not None:
+            self.frame_stats.add_pacing((release - self.last_release) / 1e6, missed)
+        self.last_release = release
+
+    def _sleep_until(self, wake):
+        remaining = wake - time.perf_counter_ns()
+        if remaining <= 0:
+            return
+        time.sleep(remaining / 1e9)
+        # Widen the margin at once when the OS wakes us late, narrow it slowly
+        overshoot = time.perf_counter_ns() - wake
+        self.spin_ns = min(max(self.spin_ns * 0.99, overshoot * 1.25, MIN_SPIN_NS),
+                           self.period_ns // 2)
@@ -1,3 +1,5 @@
+import time
+
 import pygame
 from pygame.locals import *
 from OpenGL.GL import *
@@ -5,19 +7,185 @@ from OpenGL.GLU import *
 import numpy as np
 
 from src.sound_manager import SoundManager
-from src.characters import Character, Projectile
+from src.match import (Match, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, INPUT_PUNCH,
+                       INPUT_KICK, INPUT_SHOOT, INPUT_FIRE)
+from src.recording import MatchRecording
+from src.lockstep import LockstepMatch
+from src.culling import Frustum
+from src.render_queue import RenderQueue, PASS_LIT, PASS_PARTICLES, PASS_HUD
+from src.alloc_tracker import AllocationTracker
+from src.perf_stats import FrameStats
+from src.frame_pacer import FramePacer
+from src.gc_policy import GCPolicy
+from src.lookahead_ai import LookaheadAI
+from src.instant_replay import InstantReplay
+from src.spectator import SpectatorServer, SpectatorClient
+from src.snapshot import unpack_match
+from src.characters import T_EXPLOSION_START
+from src.sampling_profiler import SamplingProfiler, DEFAULT_PROFILE_SECONDS
+from src.tracing import Tracer, NULL_TRACER
+from src.pipeline import SimulationPipeline
+from src.tick_rate import BASE_RATE
+from src.stage import DEFAULT_STAGE
+from src import meshes, tracing
+
+# Keyboard layout for each player
+PLAYER1_KEYS = (
+    (pygame.K_LEFT, INPUT_LEFT),
+    (pygame.K_RIGHT, INPUT_RIGHT),
+    (pygame.K_UP, INPUT_JUMP),
+    (pygame.K_m, INPUT_PUNCH),   # M for punch
+    (pygame.K_n, INPUT_KICK),    # N for kick
+    (pygame.K_b, INPUT_SHOOT),   # B for shoot
+    (pygame.K_v, INPUT_FIRE),    # V for fire breath
+)
+PLAYER2_KEYS = (
+    (pygame.K_a, INPUT_LEFT),
+    (pygame.K_d, INPUT_RIGHT),
+    (pygame.K_w, INPUT_JUMP),
+    (pygame.K_q, INPUT_PUNCH),   # Q for punch
+    (pygame.K_e, INPUT_KICK),    # E for kick
+    (pygame.K_r, INPUT_SHOOT),   # R for shoot
+    (pygame.K_f, INPUT_FIRE),    # F for fire breath
+)
+
+class FightingGame(Match):
+    def __init__(self, width=800, height=600, display=True, seed=None, record_path=None,
+                 track_allocations=False, frame_stats=False, ai_budget_ms=None,
+                 broadcast=None, spectate=None, profile_seconds=None,
+                 trace_path=None, frame_rate=None, vsync=False, pipelined=False,
+                 tick_rate=BASE_RATE, stage=DEFAULT_STAGE):
+        # With display=False the caller provides the GL context (for example
+        # the offscreen replay renderer) and there is no window or audio.
+        # broadcast and spectate are (host, port) addresses: the first streams
+        # this match to spectators, the second makes this game a spectator
+        # that only draws the match streamed from there. profile_seconds
+        # starts a sampling profile of that length as soon as the game runs,
+        # and trace_path saves a timeline of the session there on exit.
+        # With vsync the buffer swap waits for the display's refresh.
+        # pipelined simulates on a thread of its own, a frame ahead of
+        # drawing (see src/pipeline.py). Every frame simulates one tick, so
+        # the loop is paced at tick_rate unless frame_rate says otherwise.
+        # stage names one of the stages in src/stage.py.
+        # Installed first so the loader threads started below are traced too
+        self.trace_path = trace_path
+        tracer = NULL_TRACER
+        if trace_path is not None:
+            tracer = Tracer()
+            tracing.install(tracer)
+        if display:
+            meshes.preload()
 
-class FightingGame:
-    def __init__(self, width=800, height=600):
         pygame.init()
-        pygame.display.set_mode((width, height), DOUBLEBUF | OPENGL)
-        pygame.display.set_caption("Retro Fighting Game")
+        if display:
+            try:
+                pygame.display.set_mode((width, height), DOUBLEBUF | OPENGL, vsync=int(vsync))
+            except pygame.error as e:
+                print(f"Warning: Could not enable vsync: {e}")
+                vsync = False
+                pygame.display.set_mode((width, height), DOUBLEBUF | OPENGL)
+            pygame.display.set_caption("Retro Fighting Game")
         
+        self.width = width
+        self.height = height
+        self.init_gl()
+
+        # Live matches get a random seed so the recording can reproduce them
+        if seed is None:
+            seed = int(np.random.randint(0, 2**31 - 1))
+
+        # Optional per-section allocation accounting, reported on exit
+        tracker = None
+        if track_allocations:
+            tracker = AllocationTracker()
+            tracker.start()
+
+        # Add sound manager
+        Match.__init__(self, SoundManager() if display else None, seed=seed,
+                       alloc_tracker=tracker, tracer=tracer, tick_rate=tick_rate, stage=stage)
+
+        # Add font for score display
+        pygame.font.init()
+        self.font = pygame.font.Font(None, 36)
+
+        # Objects skipped by frustum culling in the last drawn frame
+        self.culled_count = 0
+
+        # Everything drawn in a frame goes through the render queue
+        self.render_queue = RenderQueue(tracer)
+
+        # Score text is only re-rendered when the score changes
+        self.score_text = None
+        self.score_text_value = None
+
+        # Optional input recording, saved when the game loop exits
+        self.record_path = record_path
+        self.recording = MatchRecording(seed, tick_rate=tick_rate, stage=stage) if record_path else None
+
+        # Player 2 is computer-controlled when given a planning budget
+        self.ai = None
+        if ai_budget_ms is not None:
+            self.ai = LookaheadAI(self, 1, budget_ms=ai_budget_ms, seed=seed)
+
+        # Frame timing, printed on exit when frame_stats is set
+        frame_rate = frame_rate or tick_rate
+        self.frame_stats = FrameStats(budget_ms=1000.0 / frame_rate)
+        self.show_frame_stats = frame_stats
+
+        # Holds the loop to frame_rate and reports how evenly it did so
+        self.pacer = FramePacer(frame_rate, self.frame_stats, vsync=vsync)
+
+        # F9 samples the game loop's stacks for profile_seconds, tagged with
+        # the frame numbers in frame_stats
+        self.profiler = SamplingProfiler(lambda: self.frame_stats.frame_count, self.frame_stats)
+        self.profile_seconds = profile_seconds or DEFAULT_PROFILE_SECONDS
+        self.profile_on_start = profile_seconds is not None
+
+        # P pauses the round; the pause screen is where deferred GC runs
+        self.paused = False
+        # Rendered overlay text, keyed by the string
+        self.banner_text = {}
+
+        # TAB plays back the last 10 seconds
+        self.instant_replay = InstantReplay(self)
+        self.frame_inputs = (0, 0)
+
+        # Spectator streaming, in either direction
+        self.spectator_server = None
+        if broadcast is not None:
+            self.spectator_server = SpectatorServer(*broadcast)
+            self.spectator_server.start()
+        self.spectator_client = None
+        self.stream_state = None
+        if spectate is not None:
+            self.spectator_client = SpectatorClient(*spectate)
+            self.spectator_client.start()
+
+        # The allocation tracker and the spectator view both work on the
+        # match from the main thread, so neither can be pipelined
+        self.pipeline = None
+        if pipelined:
+            if track_allocations or spectate is not None:
+                print("Warning: --pipelined is not available with --track-allocations or --spectate")
+            else:
+                self.pipeline = SimulationPipeline(self)
+        # When the inputs shown in the frame being drawn were read, if new
+        self.shown_input_ns = None
+
+        # Characters and sounds are loaded by now, so freeze them out of
+        # the garbage collector's way
+        self.gc_policy = GCPolicy(self.frame_stats)
+        self.gc_policy.install()
+        self.gc_policy.freeze()
+
+    def init_gl(self):
         # Set up the 3D perspective
-        glViewport(0, 0, width, height)
+        glViewport(0, 0, self.width, self.height)
         glMatrixMode(GL_PROJECTION)
-        gluPerspective(45, (width/height), 0.1, 50.0)
+        glLoadIdentity()
+        gluPerspective(45, (self.width/self.height), 0.1, 50.0)
         glMatrixMode(GL_MODELVIEW)
+        glLoadIdentity()
         # Move camera back and up slightly to see the scene better
         glTranslatef(0.0, -1.0, -15.0)
         
@@ -33,241 +201,155 @@ class FightingGame:
         glEnable(GL_COLOR_MATERIAL)
         glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
 
-        # Initialize characters
-        self.initialize_characters()
-
-        # Game state
-        self.running = True
-        self.clock = pygame.time.Clock()
-
-        # Add sound manager
-        self.sound_manager = SoundManager()
-        
-        # Add score
-        self.score = 0
-        
-        # Add font for score display
-        pygame.font.init()
-        self.font = pygame.font.Font(None, 36)
-
-        # List to manage all projectiles in the game
-        self.all_projectiles = []
-
-        # Melee combat range
-        self.melee_range = 1.5
-
-    def initialize_characters(self):
-        self.player1 = Character(
-            name="Player 1", 
-            position=(-3, 0, 0),
-            color=(0, 0, 1),      # Blue
-            strength=100,
-            pistols=2,
-            is_ai=False
-        )
-        self.player2 = Character(
-            name="Player 2",
-            position=(3, 0, 0),
-            color=(1, 0, 0),      # Red
-            strength=100,
-            pistols=2,
-            is_ai=False          # Changed to False for human player
-        )
+    def read_inputs(self, keys, key_map):
+        inputs = 0
+        for key, bit in key_map:
+            if keys[key]:
+                inputs |= bit
+        return inputs
 
     def handle_events(self):
-        keys = pygame.key.get_pressed()
-        
-        # Player 1 controls
-        if keys[pygame.K_LEFT]:
-            self.player1.position[0] -= self.player1.move_speed
-        if keys[pygame.K_RIGHT]:
-            self.player1.position[0] += self.player1.move_speed
-        if keys[pygame.K_UP]:
-            if self.player1.jump():
-                self.sound_manager.play('jump')
-        if keys[pygame.K_m]:  # M for punch
-            if self.player1.punch():
-                self.sound_manager.play('punch')
-        if keys[pygame.K_n]:  # N for kick
-            if self.player1.kick():
-                self.sound_manager.play('kick')
-        if keys[pygame.K_b]:  # B for shoot
-            if self.player1.shoot():
-                self.sound_manager.play('shoot')
-        if keys[pygame.K_v]:  # V for fire breath
-            if self.player1.breathe_fire():
-                self.sound_manager.play('fire')
-
-        # Player 2 controls
-        if keys[pygame.K_a]:
-            self.player2.position[0] -= self.player2.move_speed
-        if keys[pygame.K_d]:
-            self.player2.position[0] += self.player2.move_speed
-        if keys[pygame.K_w]:
-            if self.player2.jump():
-                self.sound_manager.play('jump')
-        if keys[pygame.K_q]:  # Q for punch
-            if self.player2.punch():
-                self.sound_manager.play('punch')
-        if keys[pygame.K_e]:  # E for kick
-            if self.player2.kick():
-                self.sound_manager.play('kick')
-        if keys[pygame.K_r]:  # R for shoot
-            if self.player2.shoot():
-                self.sound_manager.play('shoot')
-        if keys[pygame.K_f]:  # F for fire breath
-            if self.player2.breathe_fire():
-                self.sound_manager.play('fire')
-        
+        with self.tracer.span('handle_events'), self.alloc_tracker.section('events'):
+            self._handle_events()
+
+    def _handle_events(self):
         # Event handling for window close and escape
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                self.running = False
+                self.quit()
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
-                    self.running = False
-
-    def update(self):
-        # Check if either character is already defeated
-        if self.player1.strength <= 0 or self.player2.strength <= 0:
-            # Wait for explosion animation to finish
-            if not self.player1.is_exploding and not self.player2.is_exploding:
-                print("Game Over!")
-                if self.player2.strength <= 0:
-                    print(f"Player 1 wins!")
-                else:
-                    print(f"Player 2 wins!")
-                self.running = False
-                return
-
-        # Update characters
-        self.player1.update()
-        self.player2.update()
-        
-        # Check melee combat
-        self.check_melee_combat()
-        
-        # Update all active projectiles and check collisions
-        for projectile in self.all_projectiles:
-            projectile.update()
-            
-            # Check collision with player2 (Villain)
-            if projectile.direction[0] > 0:  # Moving right (from player1)
-                if self.check_collision(projectile, self.player2):
-                    print(f"{self.player2.name} was hit by a missile!")
-                    self.player2.strength -= 15
-                    projectile.active = False
-                    self.score += 15
-                    self.sound_manager.play('hit')
-                    
-                    if self.player2.strength <= 0:
-                        print(f"{self.player2.name} has been defeated!")
-                        self.player2.start_explosion()
-                        self.sound_manager.play('explosion')
-                        self.score += 50
-                        self.player2.strength = 0  # Ensure health doesn't go negative
-            
-            # Check collision with player1 (Captain Destructor)
-            elif projectile.direction[0] < 0:  # Moving left (from player2)
-                if self.check_collision(projectile, self.player1):
-                    print(f"{self.player1.name} was hit by a missile!")
-                    self.player1.strength -= 15
-                    projectile.active = False
-                    self.sound_manager.play('hit')
-                    
-                    if self.player1.strength <= 0:
-                        print(f"{self.player1.name} has been defeated!")
-                        self.player1.start_explosion()
-                        self.sound_manager.play('explosion')
-                        self.player1.strength = 0  # Ensure health doesn't go negative
-
-        # Add new projectiles from both players to the main list
-        for projectile in self.player1.projectiles + self.player2.projectiles:
-            self.all_projectiles.append(projectile)
-        self.player1.projectiles.clear()
-        self.player2.projectiles.clear()
-        
-        # Remove inactive projectiles
-        self.all_projectiles = [p for p in self.all_projectiles if p.active]
-
-        # Check fire breath damage
-        if self.player1.is_breathing_fire:
-            distance = abs(self.player1.position[0] - self.player2.position[0])
-            # Only damage if player 1 is to the left of player 2 (facing right)
-            is_facing_right = self.player1.position[0] < self.player2.position[0]
-            if distance < 4.0 and is_facing_right:  # Fire breath range and correct direction
-                damage = 2.0
-                self.player2.strength -= damage
-                self.score += damage
-                
-                if pygame.time.get_ticks() % 10 == 0:
-                    self.sound_manager.play('hit')
-                    print(f"{self.player2.name} is burning! Health: {self.player2.strength}")
-                
-                if self.player2.strength <= 0:
-                    print(f"{self.player2.name} was incinerated!")
-                    self.player2.start_explosion()
-                    self.sound_manager.play('explosion')
-                    self.score += 50
-                    self.player2.strength = 0
-
-        # Same for player 2's fire breath
-        if self.player2.is_breathing_fire:
-            distance = abs(self.player1.position[0] - self.player2.position[0])
-            # Only damage if player 2 is to the right of player 1 (facing left)
-            is_facing_left = self.player2.position[0] > self.player1.position[0]
-            if distance < 4.0 and is_facing_left:
-                damage = 2.0
-                self.player1.strength -= damage
-                
-                if pygame.time.get_ticks() % 10 == 0:
-                    self.sound_manager.play('hit')
-                    print(f"{self.player1.name} is burning! Health: {self.player1.strength}")
-                
-                if self.player1.strength <= 0:
-                    print(f"{self.player1.name} was incinerated!")
-                    self.player1.start_explosion()
-                    self.sound_manager.play('explosion')
-                    self.player1.strength = 0
-
-        # Update eye fire effects
-        for player in [self.player1, self.player2]:
-            if player.is_eyes_on_fire:
-                player.eyes_fire_duration += 1
-                if player.eyes_fire_duration >= player.eyes_fire_max:
-                    player.is_eyes_on_fire = False
-
-    def draw_score(self):
-        glPushMatrix()
-        glMatrixMode(GL_PROJECTION)
-        glPushMatrix()
-        glLoadIdentity()
-        glOrtho(-1, 1, -1, 1, -1, 1)
-        glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
-        
-        # Disable lighting and depth testing for 2D elements
-        glDisable(GL_LIGHTING)
-        glDisable(GL_DEPTH_TEST)
+                    self.quit()
+                elif event.key == pygame.K_p and not self.instant_replay.playing:
+                    self.toggle_pause()
+                elif event.key == pygame.K_TAB:
+                    self.toggle_replay()
+                elif event.key == pygame.K_F9:
+                    self.toggle_profiler()
+                elif self.instant_replay.playing:
+                    # Scrub with the arrow keys, hold with space
+                    if event.key == pygame.K_LEFT:
+                        self.instant_replay.slower()
+                    elif event.key == pygame.K_RIGHT:
+                        self.instant_replay.faster()
+                    elif event.key == pygame.K_SPACE:
+                        self.instant_replay.toggle_hold()
+
+        keys = pygame.key.get_pressed()
         
+        # Player controls (frozen, and not recorded, while paused or
+        # watching a replay; spectators have none). Read after the events,
+        # so a frame that pauses is neither applied nor recorded and
+        # recordings step exactly the frames the live match did.
+        if (self.running and not self.paused and not self.instant_replay.playing and
+                self.spectator_client is None):
+            inputs1 = self.read_inputs(keys, PLAYER1_KEYS)
+            inputs2 = None if self.ai is not None else self.read_inputs(keys, PLAYER2_KEYS)
+            if self.pipeline is not None:
+                self.pipeline.submit(inputs1, inputs2)
+            else:
+                self.shown_input_ns = time.perf_counter_ns()
+                self.take_inputs(inputs1, inputs2)
+
+    def take_inputs(self, inputs1, inputs2):
+        # Applies and records one live frame's inputs; with inputs2 None the
+        # AI chooses player 2's. The AI plans on the live match, so when
+        # pipelined this runs on the simulation thread along with simulate().
+        if inputs2 is None:
+            inputs2 = self.ai.decide()
+        self.apply_inputs(inputs1, inputs2)
+        self.frame_inputs = (inputs1, inputs2)
+        if self.recording is not None:
+            self.recording.record(inputs1, inputs2)
+
+    def simulate(self):
+        # Steps the live match once its inputs have been taken
+        self.update()
+        self.instant_replay.record(*self.frame_inputs)
+        if self.spectator_server is not None:
+            self.spectator_server.publish(self)
+
+    def quit(self):
+        # Leave any replay first so the live match is what gets saved
+        self.instant_replay.stop()
+        self.running = False
+
+    def toggle_pause(self):
+        self.paused = not self.paused
+        if self.paused:
+            # Nothing is moving, so this is a good time for a full collection
+            self.gc_policy.end_round()
+        else:
+            self.gc_policy.begin_round()
+
+    def toggle_replay(self):
+        if self.instant_replay.playing:
+            self.instant_replay.stop()
+        elif not self.paused and self.spectator_client is None:
+            if self.pipeline is not None:
+                self.pipeline.drain()
+            self.instant_replay.start()
+
+    def toggle_profiler(self):
+        # The profile is written when it ends, or right away if F9 is pressed again
+        if self.profiler.running:
+            self.profiler.stop()
+        else:
+            self.profiler.start(self.profile_seconds, time.strftime('profile-%Y%m%d-%H%M%S.folded'))
+
+    def draw_banner(self, text):
+        # Centered overlay text, rendered once per distinct string
+        banner = self.banner_text.get(text)
+        if banner is None:
+            surface = self.font.render(text, True, (255, 255, 255))
+            banner = (surface.get_width(), surface.get_height(),
+                      pygame.image.tostring(surface, 'RGBA', True))
+            self.banner_text[text] = banner
+        width, height, data = banner
+        glRasterPos2f(-width / self.width, -height / self.height)
+        glDrawPixels(width, height, GL_RGBA, GL_UNSIGNED_BYTE, data)
+
+    def draw_score(self, score):
+        # Drawn in the HUD pass, which sets up the orthographic projection
         # Render score text
-        score_surface = self.font.render(f'Score: {self.score}', True, (255, 255, 255))
-        score_data = pygame.image.tostring(score_surface, 'RGBA', True)
+        if self.score_text_value != score:
+            score_surface = self.font.render(f'Score: {score}', True, (255, 255, 255))
+            score_data = pygame.image.tostring(score_surface, 'RGBA', True)
+            self.score_text = (score_surface.get_width(), score_surface.get_height(), score_data)
+            self.score_text_value = score
         
+        width, height, score_data = self.score_text
         glRasterPos2f(-0.9, -0.9)
-        glDrawPixels(score_surface.get_width(), score_surface.get_height(), 
-                    GL_RGBA, GL_UNSIGNED_BYTE, score_data)
-        
-        # Restore state
-        glEnable(GL_DEPTH_TEST)
-        glEnable(GL_LIGHTING)
-        
-        glMatrixMode(GL_PROJECTION)
-        glPopMatrix()
-        glMatrixMode(GL_MODELVIEW)
-        glPopMatrix()
+        glDrawPixels(width, height, GL_RGBA, GL_UNSIGNED_BYTE, score_data)
 
     def draw(self):
+        self.render()
+        self.frame_stats.add_culled(self.culled_count)
+        with self.tracer.span('display.flip'):
+            pygame.display.flip()
+        if self.shown_input_ns is not None:
+            self.frame_stats.add_latency((time.perf_counter_ns() - self.shown_input_ns) / 1e6)
+            self.shown_input_ns = None
+
+    def render(self, time_ms=None):
+        # Draws the current frame into whatever framebuffer is bound.
+        # Animations follow the wall clock unless a time is given.
+        with self.tracer.span('render'), self.alloc_tracker.section('draw'):
+            self._render(time_ms)
+
+    def _render(self, time_ms):
+        if time_ms is None:
+            time_ms = pygame.time.get_ticks()
+
+        # When pipelined, the live match belongs to the simulation thread and
+        # the newest snapshot of it is drawn instead (a replay plays in the
+        # live match while the simulation thread is idle)
+        match = self
+        if self.pipeline is not None and not self.instant_replay.playing:
+            match, input_ns = self.pipeline.show_latest()
+            if input_ns is not None:
+                self.shown_input_ns = input_ns
+        
         # Clear the screen and set background color to dark blue
         glClearColor(0.1, 0.1, 0.2, 1)
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
@@ -279,44 +361,137 @@ class FightingGame:
         # Move camera back and up slightly
         glTranslatef(0.0, -1.0, -15.0)
         
-        # Draw ground plane
-        glBegin(GL_QUADS)
-        glColor3f(0.2, 0.5, 0.2)  # Green color for ground
-        glVertex3f(-10, -2, -10)
-        glVertex3f(-10, -2, 10)
-        glVertex3f(10, -2, 10)
-        glVertex3f(10, -2, -10)
-        glEnd()
+        # Build the view frustum once the camera is in place so anything
+        # off-screen can be skipped before issuing GL calls for it
+        frustum = Frustum.from_gl()
+        culled = 0
+        queue = self.render_queue
+        
+        # Draw the stage
+        queue.submit(PASS_LIT, None, None, self.draw_stage, match.stage)
 
         # Draw a reference cube
-        self.draw_cube(0, 0, 0)
+        queue.submit(PASS_LIT, None, (0, 0, 0), self.draw_cube)
         
-        # Draw ground plane and characters
-        self.player1.draw()
-        self.player2.draw()
+        # Draw characters
+        culled += match.player1.draw(queue, frustum, time_ms)
+        culled += match.player2.draw(queue, frustum, time_ms)
 
         # Draw all active projectiles
-        for projectile in self.all_projectiles:
-            projectile.draw()
+        for projectile in match.all_projectiles:
+            if frustum.sphere_visible(*projectile.bounding_sphere()):
+                projectile.draw(queue)
+            else:
+                culled += 1
+
+        # Draw missiles that shot each other down
+        culled += self.draw_blasts(queue, frustum, match.blast_particles)
+        
+        # Number of objects skipped this frame
+        self.culled_count = culled
 
         # Draw health bars and score
-        self.draw_health_bars()
-        self.draw_score()
+        with self.alloc_tracker.section('hud'):
+            self.draw_health_bars(queue, match)
+            queue.submit(PASS_HUD, None, None, self.draw_score, match.score)
+            if self.paused:
+                queue.submit(PASS_HUD, None, None, self.draw_banner, 'PAUSED')
+            elif self.instant_replay.playing:
+                queue.submit(PASS_HUD, None, None, self.draw_banner,
+                             f'REPLAY {self.instant_replay.speed:g}x')
+            elif self.spectator_client is not None and self.stream_state is None:
+                queue.submit(PASS_HUD, None, None, self.draw_banner, 'WAITING FOR MATCH')
         
-        pygame.display.flip() 
+        # Sort everything by pass and material and draw it
+        queue.flush()
 
     def run(self):
+        tracker = self.alloc_tracker
+        tracer = self.tracer
+        stats = self.frame_stats
+        self.gc_policy.begin_round()
+        if self.profile_on_start:
+            self.toggle_profiler()
+        if self.pipeline is not None:
+            self.pipeline.start()
         while self.running:
-            self.handle_events()
-            self.update()
-            self.draw()
-            self.clock.tick(60)  # 60 FPS
+            stats.begin_frame()
+            tracker.begin_frame()
+            # The frame number matches the one in sampling profiles
+            with tracer.span('frame', {'frame': stats.frame_count} if tracer.enabled else None):
+                self.handle_events()
+                with tracer.span('update'):
+                    if self.spectator_client is not None:
+                        self.follow_stream()
+                    elif self.instant_replay.playing:
+                        self.instant_replay.advance()
+                    elif self.pipeline is None and not self.paused:
+                        self.simulate()
+                self.draw()
+            tracker.end_frame()
+            stats.end_frame()
+            with tracer.span('pacer.wait'):
+                self.pacer.wait()
+        self.profiler.stop()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        # Round over: catch up on the collections put off during it
+        self.gc_policy.end_round()
+        self.gc_policy.uninstall()
+        if tracker.enabled:
+            print(tracker.report())
+        if self.show_frame_stats:
+            print(stats.report())
+        if self.recording is not None:
+            self.recording.checksums = self.checksums
+            self.recording.save(self.record_path)
+            print(f"Match recorded to {self.record_path}")
+        if self.spectator_server is not None:
+            self.spectator_server.stop()
+        if self.spectator_client is not None:
+            self.spectator_client.stop()
+        if self.trace_path is not None:
+            tracer.save(self.trace_path)
+            tracing.install(NULL_TRACER)
+            print(f"Trace written to {self.trace_path}")
         pygame.quit() 
 
-    def draw_cube(self, x, y, z):
-        # Helper function to draw a small cube
-        glPushMatrix()
-        glTranslatef(x, y, z)
+    def follow_stream(self):
+        # Spectator mode: take on the newest streamed state. Particles are
+        # not part of the stream, so they keep running here and explosions
+        # are started whenever a fighter's explosion (re)starts.
+        state = self.spectator_client.state
+        if state is not None and state is not self.stream_state:
+            self.stream_state = state
+            running = self.running
+            explosions = [player.timers[T_EXPLOSION_START] for player in self.players]
+            unpack_match(self, state, clear_effects=False)
+            # The window stays open after the streamed match ends
+            self.running = running
+            for player, started in zip(self.players, explosions):
+                if player.is_exploding and player.timers[T_EXPLOSION_START] != started:
+                    player.emit_explosion_particles()
+        if not self.paused:
+            for player in self.players:
+                player.update_particles()
+
+    def draw_blasts(self, queue, frustum, particles):
+        # As Character.draw_explosion, for the match's missile blasts
+        visible = particles.visible_mask(frustum)
+        visible_count = int(np.count_nonzero(visible))
+        if visible_count:
+            queue.submit(PASS_PARTICLES, None, None, particles.draw, GL_QUADS, visible)
+        return len(particles) - visible_count
+
+    def draw_stage(self, stage):
+        # Static geometry, baked with the fighters' meshes (see src/meshes.py)
+        library = meshes.get_meshes()
+        library.bind()
+        library.draw(stage.mesh)
+        library.unbind()
+
+    def draw_cube(self):
+        # Helper function to draw a small cube at the current origin
         glBegin(GL_QUADS)
         # Front face (red)
         glColor3f(1.0, 0.0, 0.0)
@@ -343,77 +518,27 @@ class FightingGame:
         glVertex3f(0.5, -0.5, 0.5)
         glVertex3f(-0.5, -0.5, 0.5)
         glEnd()
-        glPopMatrix()
-
-    def check_collision(self, projectile, character):
-        # Get the distance between projectile and character
-        dx = projectile.position[0] - character.position[0]
-        dy = projectile.position[1] - character.position[1]
-        dz = projectile.position[2] - character.position[2]
-        
-        # Calculate 3D distance
-        distance = np.sqrt(dx*dx + dy*dy + dz*dz)
-        
-        # Use a smaller collision radius for more precise hits
-        return distance < 0.8  # Reduced from 1.0 for more precise hits
 
-    def draw_health_bars(self):
-        # Save current matrix and set up orthographic projection for 2D
-        glPushMatrix()
-        glMatrixMode(GL_PROJECTION)
-        glPushMatrix()
-        glLoadIdentity()
-        glOrtho(-1, 1, -1, 1, -1, 1)
-        glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
-        
-        # Disable lighting and depth testing for 2D elements
-        glDisable(GL_LIGHTING)
-        glDisable(GL_DEPTH_TEST)
-        
+    def draw_health_bars(self, queue, match):
+        # Both bars go into the HUD pass, which shares one orthographic
+        # setup with the score
         # Draw player 1 health bar (left side)
-        glColor3f(0, 0, 1)  # Blue
-        glBegin(GL_QUADS)
-        glVertex3f(-0.9, 0.8, 0)
-        glVertex3f(-0.9 + (self.player1.strength/100) * 0.8, 0.8, 0)
-        glVertex3f(-0.9 + (self.player1.strength/100) * 0.8, 0.9, 0)
-        glVertex3f(-0.9, 0.9, 0)
-        glEnd()
+        queue.submit(PASS_HUD, (0, 0, 1), None, self.draw_health_bar, -0.9, match.player1.strength)  # Blue
         
         # Draw player 2 health bar (right side)
-        glColor3f(1, 0, 0)  # Red
+        queue.submit(PASS_HUD, (1, 0, 0), None, self.draw_health_bar, 0.1, match.player2.strength)  # Red
+
+    def draw_health_bar(self, left, strength):
+        right = left + (strength/100) * 0.8
         glBegin(GL_QUADS)
-        glVertex3f(0.1, 0.8, 0)
-        glVertex3f(0.1 + (self.player2.strength/100) * 0.8, 0.8, 0)
-        glVertex3f(0.1 + (self.player2.strength/100) * 0.8, 0.9, 0)
-        glVertex3f(0.1, 0.9, 0)
+        glVertex3f(left, 0.8, 0)
+        glVertex3f(right, 0.8, 0)
+        glVertex3f(right, 0.9, 0)
+        glVertex3f(left, 0.9, 0)
         glEnd()
-        
-        # Restore previous state
-        glEnable(GL_DEPTH_TEST)
-        glEnable(GL_LIGHTING)
-        
-        # Restore matrices
-        glMatrixMode(GL_PROJECTION)
-        glPopMatrix()
-        glMatrixMode(GL_MODELVIEW)
-        glPopMatrix()
 
-    def check_melee_combat(self):
-        if self.player1.strength <= 0 or self.player2.strength <= 0:
-            return
 
-        distance = abs(self.player1.position[0] - self.player2.position[0])
-        
-        if distance < self.melee_range:
-            # Calculate damage based on velocity and position
-            if self.player1.is_punching and self.player1.punch_frame == 5:
-                impact = abs(self.player1.velocity.x) * 20
-                damage = min(max(5, impact), 15)  # Between 5 and 15 damage
-                self.player2.strength -= damage
-                # Add knockback
-                self.player2.velocity.x += self.player1.velocity.x * 1.5
-                self.player2.velocity.y += 0.1
-                self.sound_manager.play('hit')
-                print(f"{self.player2.name} was hit for {damage:.1f} damage!")
-                self.score += damage
\ No newline at end of file
+class LockstepGame(LockstepMatch, FightingGame):
+    # The game on the fixed-point simulation. Its recordings carry a
+    # checksum per frame for python -m src.lockstep to verify.
+    pass
@@ -0,0 +1,71 @@
+import gc
+import time
+
+# Collection thresholds used while a round is running. Young collections are
+# cheap and catch short-lived cycles, so they stay on, but less often than
+# the default 700; the generation 2 threshold is set so high that a full
+# collection never starts on its own mid-round.
+ROUND_THRESHOLDS = (5000, 20, 1_000_000)
+
+
+class GCPolicy:
+    # Keeps Python's cyclic garbage collector from pausing in the middle of
+    # a frame. Everything alive after start-up is frozen into the permanent
+    # generation, full collections are put off while a round is running, and
+    # the deferred work is done at round end or on the pause screen, where
+    # nobody is waiting on the next frame. Every collection's duration is
+    # reported to the frame stats through gc.callbacks.
+    def __init__(self, stats=None, round_thresholds=ROUND_THRESHOLDS):
+        self.stats = stats
+        self.round_thresholds = round_thresholds
+        self.saved_thresholds = None
+        self.in_round = False
+        self._gc_start = None
+        self.installed = False
+
+    def install(self):
+        if not self.installed:
+            gc.callbacks.append(self._on_gc)
+            self.installed = True
+
+    def uninstall(self):
+        if self.in_round:
+            self.end_round(collect=False)
+        if self.installed:
+            gc.callbacks.remove(self._on_gc)
+            self.installed = False
+
+    def freeze(self):
+        # Called once characters and assets are loaded. Collects what start-up
+        # left behind, then moves every surviving object into the permanent
+        # generation so later collections never traverse them again.
+        gc.collect()
+        gc.freeze()
+
+    def begin_round(self):
+        if self.in_round:
+            return
+        self.saved_thresholds = gc.get_threshold()
+        gc.set_threshold(*self.round_thresholds)
+        self.in_round = True
+
+    def end_round(self, collect=True):
+        if not self.in_round:
+            return
+        gc.set_threshold(*self.saved_thresholds)
+        self.in_round = False
+        if collect:
+            self.collect()
+
+    def collect(self):
+        # Full collection at a point where a pause is harmless
+        return gc.collect()
+
+    def _on_gc(self, phase, info):
+        if phase == 'start':
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            duration_ms = (time.perf_counter() - self._gc_start) * 1000
+            self._gc_start = None
+            if self.stats is not None:
+                self.stats.add_gc_pause(info['generation'], duration_ms)
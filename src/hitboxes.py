@@ -0,0 +1,244 @@
+import math
+
+# Frames a punch or kick animation lasts, and the frame on which it lands
+MELEE_FRAMES = 10
+MELEE_ACTIVE_FRAME = 5
+
+# Body parts, used as leaf ids in the hurtbox tree and to name hits
+HEAD = 0
+TORSO = 1
+LEFT_ARM = 2
+RIGHT_ARM = 3
+LEFT_LEG = 4
+RIGHT_LEG = 5
+LIMB_NAMES = ('head', 'torso', 'left arm', 'right arm', 'left leg', 'right leg')
+
+# Boxes are (min_x, min_y, min_z, max_x, max_y, max_z) tuples in the
+# fighter's local space, i.e. relative to Character.position
+
+
+def _limb_box(pivot_x, pivot_y, angle, offset, width, top, bottom):
+    # Box around the part of a limb between `top` and `bottom` (measured down
+    # from the joint) after the same transforms as Character.draw_arms and
+    # draw_legs: translate to the joint, rotate `angle` degrees about z, then
+    # translate `offset` along the rotated y axis
+    radians = math.radians(angle)
+    c, s = math.cos(radians), math.sin(radians)
+    # Center and half extents of the segment before rotation
+    local_y = offset - (top + bottom) / 2
+    half_w = width / 2
+    half_h = (bottom - top) / 2
+    center_x = pivot_x - s * local_y
+    center_y = pivot_y + c * local_y
+    extent_x = abs(c) * half_w + abs(s) * half_h
+    extent_y = abs(s) * half_w + abs(c) * half_h
+    return (center_x - extent_x, center_y - extent_y, -half_w,
+            center_x + extent_x, center_y + extent_y, half_w)
+
+
+def _cube_box(x, y, z, size):
+    h = size / 2
+    return (x - h, y - h, z - h, x + h, y + h, z + h)
+
+
+# Search steps when a swept sphere meets a box edge-on; each one cuts the
+# interval to at most 2/3, so 24 leave well under a thousandth of the path
+_SWEEP_ITERATIONS = 24
+
+
+def _union(boxes):
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), min(b[2] for b in boxes),
+            max(b[3] for b in boxes), max(b[4] for b in boxes), max(b[5] for b in boxes))
+
+
+def _overlaps(a, b, dx, dy, dz):
+    # Box b shifted by (dx, dy, dz) against box a
+    return (b[0] + dx <= a[3] and b[3] + dx >= a[0] and
+            b[1] + dy <= a[4] and b[4] + dy >= a[1] and
+            b[2] + dz <= a[5] and b[5] + dz >= a[2])
+
+
+def _sphere_overlaps(box, x, y, z, radius):
+    # Distance from the sphere center to the closest point of the box
+    nx = min(max(x, box[0]), box[3]) - x
+    ny = min(max(y, box[1]), box[4]) - y
+    nz = min(max(z, box[2]), box[5]) - z
+    return nx * nx + ny * ny + nz * nz <= radius * radius
+
+
+def _distance2(box, x, y, z):
+    # Squared distance from a point to the closest point of the box
+    nx = min(max(x, box[0]), box[3]) - x
+    ny = min(max(y, box[1]), box[4]) - y
+    nz = min(max(z, box[2]), box[5]) - z
+    return nx * nx + ny * ny + nz * nz
+
+
+def sweep_box(box, x, y, z, dx, dy, dz, radius):
+    # Earliest t in [0, 1] at which a sphere moving from (x, y, z) to
+    # (x + dx, y + dy, z + dz) touches the box, or -1. The path is first
+    # clipped against the box grown by the radius on every side (slab test).
+    t0, t1 = 0.0, 1.0
+    for start, delta, low, high in ((x, dx, box[0], box[3]),
+                                    (y, dy, box[1], box[4]),
+                                    (z, dz, box[2], box[5])):
+        low -= radius
+        high += radius
+        if delta == 0:
+            if start < low or start > high:
+                return -1.0
+            continue
+        a = (low - start) / delta
+        b = (high - start) / delta
+        if a > b:
+            a, b = b, a
+        if a > t0:
+            t0 = a
+        if b < t1:
+            t1 = b
+        if t0 > t1:
+            return -1.0
+    r2 = radius * radius
+    if _distance2(box, x + t0 * dx, y + t0 * dy, z + t0 * dz) <= r2:
+        return t0
+    # The path entered the grown box at one of its corners or edges, which
+    # the real rounded shape does not fill. Distance to a box is convex along
+    # a line, so narrow in on its minimum, then bisect for the first touch.
+    low, high = t0, t1
+    for _ in range(_SWEEP_ITERATIONS):
+        a = low + (high - low) / 3
+        b = high - (high - low) / 3
+        if (_distance2(box, x + a * dx, y + a * dy, z + a * dz) <
+                _distance2(box, x + b * dx, y + b * dy, z + b * dz)):
+            high = b
+        else:
+            low = a
+    closest = (low + high) / 2
+    if _distance2(box, x + closest * dx, y + closest * dy, z + closest * dz) > r2:
+        return -1.0
+    low, high = t0, closest
+    for _ in range(_SWEEP_ITERATIONS):
+        middle = (low + high) / 2
+        if _distance2(box, x + middle * dx, y + middle * dy, z + middle * dz) <= r2:
+            high = middle
+        else:
+            low = middle
+    return high
+
+
+def sweep_point(x, y, z, dx, dy, dz, radius):
+    # Earliest t in [0, 1] at which a point moving from (x, y, z) to
+    # (x + dx, y + dy, z + dz) comes within radius of the origin, or -1.
+    # Two spheres in flight are this with the one's position and motion
+    # relative to the other and their radii added.
+    c = x * x + y * y + z * z - radius * radius
+    if c <= 0:
+        return 0.0
+    b = x * dx + y * dy + z * dz
+    if b >= 0:
+        return -1.0  # Not closing in
+    a = dx * dx + dy * dy + dz * dz
+    discriminant = b * b - a * c
+    if discriminant < 0:
+        return -1.0
+    t = (-b - math.sqrt(discriminant)) / a
+    return t if t <= 1 else -1.0
+
+
+class HurtboxTree:
+    # Two-level AABB tree over one pose's hurtboxes: the root box around the
+    # whole fighter, an upper-body node (head, torso, arms) and a lower-body
+    # node (legs), then one box per body part. Queries test the root first,
+    # so anything nowhere near the fighter costs a single box test.
+    __slots__ = ('root', 'nodes')
+
+    def __init__(self, upper, lower):
+        # upper and lower are lists of (limb, box)
+        self.nodes = tuple((_union([box for _, box in leaves]), tuple(leaves))
+                           for leaves in (upper, lower))
+        self.root = _union([box for box, _ in self.nodes])
+
+    def hit_box(self, box, dx, dy, dz):
+        # First body part overlapped by `box` shifted by (dx, dy, dz), or -1
+        if not _overlaps(self.root, box, dx, dy, dz):
+            return -1
+        for node_box, leaves in self.nodes:
+            if _overlaps(node_box, box, dx, dy, dz):
+                for limb, leaf_box in leaves:
+                    if _overlaps(leaf_box, box, dx, dy, dz):
+                        return limb
+        return -1
+
+    def hit_sphere(self, x, y, z, radius):
+        # First body part touched by the sphere, or -1
+        if not _sphere_overlaps(self.root, x, y, z, radius):
+            return -1
+        for node_box, leaves in self.nodes:
+            if _sphere_overlaps(node_box, x, y, z, radius):
+                for limb, leaf_box in leaves:
+                    if _sphere_overlaps(leaf_box, x, y, z, radius):
+                        return limb
+        return -1
+
+    def sweep_sphere(self, x, y, z, dx, dy, dz, radius):
+        # First body part touched by a sphere moving from (x, y, z) by
+        # (dx, dy, dz) during the step, i.e. the capsule around that path,
+        # or -1. Unlike hit_sphere this cannot skip over a thin limb when the
+        # sphere moves further than its own size in one step.
+        if sweep_box(self.root, x, y, z, dx, dy, dz, radius) < 0:
+            return -1
+        first, first_t = -1, 2.0
+        for node_box, leaves in self.nodes:
+            t = sweep_box(node_box, x, y, z, dx, dy, dz, radius)
+            if 0 <= t < first_t:
+                for limb, leaf_box in leaves:
+                    t = sweep_box(leaf_box, x, y, z, dx, dy, dz, radius)
+                    if 0 <= t < first_t:
+                        first, first_t = limb, t
+        return first
+
+
+# The pose only depends on the punch and kick frames, so every tree and
+# attack box is built once here. State 0 is at rest, state f + 1 is frame f
+# of the animation.
+POSE_STATES = MELEE_FRAMES + 1
+
+_HEAD_BOX = _cube_box(0, 1.2, 0, 0.45)
+_TORSO_BOX = _cube_box(0, 0, 0, 0.8)
+
+
+def _arm_pose(state):
+    frame = state - 1 if state else 0
+    angle = 45 * frame / 10
+    # Bicep and forearm; the bicep bulge makes the arm about 0.3 wide
+    arms = ((LEFT_ARM, _limb_box(-0.6, 0.5, angle, 0, 0.3, 0, 0.6)),
+            (RIGHT_ARM, _limb_box(0.6, 0.5, -angle, 0, 0.3, 0, 0.6)))
+    fists = (_limb_box(-0.6, 0.5, angle, 0, 0.3, 0.4, 0.6),
+             _limb_box(0.6, 0.5, -angle, 0, 0.3, 0.4, 0.6))
+    return arms, fists
+
+
+def _leg_pose(state):
+    kicking = state > 0
+    frame = state - 1 if kicking else 0
+    angle = 90 * frame / 10
+    offset = 0.3 * frame / 10
+    width = 0.25 * (1.2 if kicking else 1.0)
+    legs = ((LEFT_LEG, _limb_box(-0.3, -1, -angle, offset, width, 0, 0.8)),
+            (RIGHT_LEG, _limb_box(0.3, -1, angle, offset, width, 0, 0.8)))
+    feet = (_limb_box(-0.3, -1, -angle, offset, width, 0.5, 0.8),
+            _limb_box(0.3, -1, angle, offset, width, 0.5, 0.8))
+    return legs, feet
+
+
+_ARM_POSES = [_arm_pose(state) for state in range(POSE_STATES)]
+_LEG_POSES = [_leg_pose(state) for state in range(POSE_STATES)]
+
+# HURTBOX_TREES[punch_state][kick_state]
+HURTBOX_TREES = [[HurtboxTree([(HEAD, _HEAD_BOX), (TORSO, _TORSO_BOX)] + list(arms), list(legs))
+                  for legs, _ in _LEG_POSES]
+                 for arms, _ in _ARM_POSES]
+
+# Attack boxes on the frame a punch or kick lands
+PUNCH_BOXES = _ARM_POSES[MELEE_ACTIVE_FRAME + 1][1]
+KICK_BOXES = _LEG_POSES[MELEE_ACTIVE_FRAME + 1][1]
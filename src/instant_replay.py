@@ -0,0 +1,161 @@
+
+import numpy as np
+
+from src.snapshot import new_state, pack_match, unpack_match
+from src.sound_manager import SilentSoundManager
+
+# Playback speeds, slowest rewind to fastest forward
+SPEEDS = (-4.0, -2.0, -1.0, -0.5, 0.0, 0.25, 0.5, 1.0, 2.0, 4.0)
+NORMAL_SPEED = SPEEDS.index(1.0)
+
+# When catching up more than this many frames, particles are only
+# simulated for the last ones
+EFFECT_FRAMES = 30
+
+
+class InstantReplay:
+    # Keeps the last `seconds` of a live match in a fixed amount of memory:
+    # a full state keyframe every `keyframe_interval` frames plus both
+    # players' inputs for every frame in between (two bytes a frame). Any
+    # frame is rebuilt by restoring the keyframe before it and re-simulating
+    # the inputs since, which is at most keyframe_interval - 1 steps. Both
+    # buffers are rings sized up front, so memory stays flat however long
+    # the session runs.
+    #
+    # Playback happens in the live match itself: start() packs the live
+    # state away, seek() puts the match into the replayed frame so the
+    # normal draw path renders it, and stop() puts the live state back.
+    #
+    # fps and keyframe_interval default to the match's tick rate, so there
+    # is a keyframe every second of match time.
+    def __init__(self, match, seconds=10, fps=None, keyframe_interval=None):
+        fps = fps or match.tick_rate.hz
+        keyframe_interval = keyframe_interval or match.tick_rate.ticks(1.0)
+        self.match = match
+        self.keyframe_interval = keyframe_interval
+        self.capacity = seconds * fps
+        # Inputs reach back one keyframe interval further than the replay
+        # window, so the keyframe before its first frame is always usable
+        self.inputs = np.zeros((self.capacity + keyframe_interval, 2), dtype=np.uint8)
+        keyframe_count = len(self.inputs) // keyframe_interval + 1
+        self.keyframes = new_state(keyframe_count)
+        self.keyframe_frames = np.full(keyframe_count, -1, dtype=np.int64)
+        self.first_frame = match.frame
+        self.latest_frame = match.frame
+        if match.frame % keyframe_interval == 0:
+            self._store_keyframe(match.frame)
+
+        # Playback state
+        self.playing = False
+        self.live_state = new_state()
+        self.live_sound_manager = None
+        self.live_random_state = None
+        self.live_quiet = False
+        self.position = 0.0
+        self.speed_index = NORMAL_SPEED
+        self.shown_frame = None
+
+    @property
+    def memory_bytes(self):
+        return self.inputs.nbytes + self.keyframes.nbytes + self.keyframe_frames.nbytes
+
+    @property
+    def speed(self):
+        return SPEEDS[self.speed_index]
+
+    def record(self, inputs1, inputs2):
+        # Called after every live update with the inputs that produced it
+        frame = self.match.frame
+        row = self.inputs[frame % len(self.inputs)]
+        row[0] = inputs1
+        row[1] = inputs2
+        self.latest_frame = frame
+        if frame % self.keyframe_interval == 0:
+            self._store_keyframe(frame)
+
+    def _store_keyframe(self, frame):
+        slot = (frame // self.keyframe_interval) % len(self.keyframes)
+        pack_match(self.match, self.keyframes[slot])
+        self.keyframe_frames[slot] = frame
+
+    def _keyframe_slot(self, frame):
+        # Slot of the keyframe at `frame`, or -1 if it has been overwritten
+        slot = (frame // self.keyframe_interval) % len(self.keyframes)
+        return slot if self.keyframe_frames[slot] == frame else -1
+
+    def oldest_frame(self):
+        oldest = max(self.first_frame, self.latest_frame - self.capacity)
+        keyframe = oldest - oldest % self.keyframe_interval
+        if self._keyframe_slot(keyframe) < 0:
+            # Nothing to rebuild it from; start at the next keyframe
+            oldest = keyframe + self.keyframe_interval
+        return min(oldest, self.latest_frame)
+
+    def start(self):
+        # Enters playback from the oldest frame in the buffer
+        if self.playing:
+            return
+        match = self.match
+        self.latest_frame = match.frame
+        pack_match(match, self.live_state)
+        self.live_sound_manager = match.sound_manager
+        self.live_random_state = np.random.get_state()
+        match.sound_manager = SilentSoundManager()
+        # Re-simulation would print every hit again
+        self.live_quiet = match.quiet
+        match.quiet = True
+        self.playing = True
+        self.shown_frame = match.frame
+        self.speed_index = NORMAL_SPEED
+        self.position = float(self.oldest_frame())
+        self.seek(int(self.position))
+
+    def stop(self):
+        # Returns the match to the live state it was in at start()
+        if not self.playing:
+            return
+        match = self.match
+        unpack_match(match, self.live_state)
+        match.sound_manager = self.live_sound_manager
+        match.quiet = self.live_quiet
+        match.simulate_effects = True
+        np.random.set_state(self.live_random_state)
+        self.playing = False
+        self.shown_frame = None
+
+    def faster(self):
+        self.speed_index = min(self.speed_index + 1, len(SPEEDS) - 1)
+
+    def slower(self):
+        self.speed_index = max(self.speed_index - 1, 0)
+
+    def toggle_hold(self):
+        # Freezes playback, or resumes it at normal speed
+        self.speed_index = NORMAL_SPEED if self.speed == 0.0 else SPEEDS.index(0.0)
+
+    def advance(self):
+        # Moves playback on by one displayed frame at the current speed
+        oldest = self.oldest_frame()
+        self.position = min(max(self.position + self.speed, oldest), self.latest_frame)
+        self.seek(int(self.position))
+
+    def seek(self, frame):
+        # Puts the match into the state it had at the end of `frame`
+        match = self.match
+        shown = self.shown_frame
+        if not shown <= frame < shown + self.keyframe_interval:
+            keyframe = frame - frame % self.keyframe_interval
+            slot = self._keyframe_slot(keyframe)
+            if slot < 0:
+                raise ValueError(f"Frame {frame} is no longer in the replay buffer")
+            unpack_match(match, self.keyframes[slot])
+            shown = keyframe
+
+        inputs = self.inputs
+        size = len(inputs)
+        while shown < frame:
+            shown += 1
+            match.simulate_effects = frame - shown < EFFECT_FRAMES
+            inputs1, inputs2 = inputs[shown % size].tolist()
+            match.step(inputs1, inputs2)
+        self.shown_frame = shown
@@ -0,0 +1,576 @@
+import argparse
+import struct
+import zlib
+from array import array
+
+from src.analytics import MISSILE, MELEE, FIRE_BREATH
+from src.match import Match
+from src.characters import (Character, Projectile, PX, PY, PZ, VX, VY, VZ, AX, AY, AZ,
+                            PHYSICS_SIZE)
+from src.hitboxes import HurtboxTree, HURTBOX_TREES, PUNCH_BOXES, KICK_BOXES, MELEE_ACTIVE_FRAME, LIMB_NAMES
+from src.recording import MatchRecording
+from src.snapshot import new_state, pack_match
+from src.tick_rate import TickRate, BASE_RATE
+from src.stage import DEFAULT_STAGE
+from src.sweep_prune import sort_by_low, overlapping_pairs
+
+# Fixed-point simulation for lockstep play. Two machines stepping the same
+# inputs only stay in step if every frame comes out bit-identical on both,
+# which float physics does not promise across platforms, compilers and
+# library versions. Here every quantity that feeds back into the simulation
+# (positions, velocities, health, score, hitboxes) is an integer count of
+# 1/ONE units and all arithmetic on it is integer arithmetic, which Python
+# does exactly everywhere. The float fields the rest of the game reads
+# (Character.physics, strength, Projectile.position, Match.score) are kept
+# as exact images of the integers, for drawing and snapshots only.
+#
+# The tuning constants are rounded to the fixed-point grid, so a lockstep
+# match plays very slightly differently from a float one; it is its own
+# mode rather than a drop-in check of the float simulation.
+
+SHIFT = 16
+ONE = 1 << SHIFT
+
+# Sent by each peer every frame: the frame number, that frame's input bits
+# and the checksum of the state after the previous frame. Nine bytes per
+# frame instead of a full state.
+FRAME_MESSAGE = struct.Struct('<IBI')
+
+
+def to_fixed(value):
+    return round(value * ONE)
+
+
+def mul(a, b):
+    # Fixed-point product, truncated toward zero so that friction and air
+    # resistance bring small velocities to rest in either direction
+    product = a * b
+    if product >= 0:
+        return product >> SHIFT
+    return -(-product >> SHIFT)
+
+
+# Movement tuning on the grid, from the fighters' BASE_RATE tuning
+FRICTION = to_fixed(Character.friction)
+AIR_RESISTANCE = to_fixed(Character.air_resistance)
+GRAVITY = to_fixed(Character.gravity)
+MOVE_SPEED = to_fixed(Character.move_speed)
+JUMP_SPEED = to_fixed(Character.jump_speed)
+DOUBLE_JUMP_SPEED = to_fixed(Character.jump_speed * 1.5)
+DOUBLE_JUMP_PUSH = to_fixed(Character.double_jump_push)
+PUNCH_PUSH = to_fixed(Character.punch_push)
+KICK_PUSH = to_fixed(Character.kick_push)
+KICK_LIFT = to_fixed(Character.kick_lift)
+MISSILE_SPEED = Character.projectile_speed
+
+# Combat tuning on the grid, from the match's, compiled at BASE_RATE as the
+# fighters' is
+_MATCH_TUNING = TickRate(BASE_RATE).compile(Match.TUNING)
+MELEE_MIN_DAMAGE = to_fixed(Match.melee_min_damage)
+MELEE_MAX_DAMAGE = to_fixed(Character.melee_damage)
+MELEE_IMPACT = round(_MATCH_TUNING['melee_impact'])  # Damage per unit of attacker speed
+KNOCKBACK = to_fixed(Match.knockback)
+KNOCKBACK_LIFT = to_fixed(_MATCH_TUNING['knockback_lift'])
+MISSILE_DAMAGE = to_fixed(Match.missile_damage)
+FIRE_BREATH_DAMAGE = to_fixed(_MATCH_TUNING['fire_breath_damage'])
+FIRE_BREATH_RANGE = to_fixed(Character.fire_breath_range)
+KNOCKOUT_BONUS = to_fixed(Match.knockout_bonus)
+MISSILE_RANGE = to_fixed(Projectile.max_range)
+MISSILE_RADIUS = to_fixed(Projectile.hit_radius)
+
+
+def _fixed_box(box):
+    return tuple(to_fixed(value) for value in box)
+
+
+def _fixed_tree(tree):
+    # The hitbox tables are built with math.sin and math.cos, whose last bit
+    # can differ between C libraries; rounding to the grid removes that
+    upper, lower = ([(limb, _fixed_box(box)) for limb, box in leaves] for _, leaves in tree.nodes)
+    return HurtboxTree(upper, lower)
+
+
+FIXED_HURTBOX_TREES = [[_fixed_tree(tree) for tree in row] for row in HURTBOX_TREES]
+FIXED_PUNCH_BOXES = tuple(_fixed_box(box) for box in PUNCH_BOXES)
+FIXED_KICK_BOXES = tuple(_fixed_box(box) for box in KICK_BOXES)
+
+
+def _score_value(fixed):
+    # Whole scores read as ints, the way the float match keeps them
+    return fixed >> SHIFT if fixed % ONE == 0 else fixed / ONE
+
+
+def _missiles_met(first, second):
+    # Whether two missiles came within touching distance over the frame
+    # they just flew. The closest approach of their relative motion is
+    # worked out in integers, so every peer agrees.
+    a, b = first.fixed_position, second.fixed_position
+    step_a, step_b = first.fixed_step, second.fixed_step
+    end = [a[axis] - b[axis] for axis in range(3)]
+    motion = [step_a[axis] - step_b[axis] for axis in range(3)]
+    start = [end[axis] - motion[axis] for axis in range(3)]
+    reach = (2 * MISSILE_RADIUS) ** 2
+    closing = -sum(start[axis] * motion[axis] for axis in range(3))
+    length = sum(value * value for value in motion)
+    if closing <= 0:
+        return sum(value * value for value in start) <= reach
+    if closing >= length:
+        return sum(value * value for value in end) <= reach
+    # Closest in the middle of the frame, at closing / length of the way
+    return sum(value * value for value in start) * length - closing * closing <= reach * length
+
+
+class DesyncError(Exception):
+    pass
+
+
+class FixedProjectile(Projectile):
+    # A missile moving on the grid; position is its float image
+    def __init__(self, position, direction, speed=MISSILE_SPEED):
+        super().__init__(position, direction, speed)
+        self.fixed_position = [to_fixed(value) for value in position]
+        self.fixed_step = [to_fixed(value * speed) for value in direction]
+
+    def update(self, frames=1):
+        self.add_trail_point()
+        fixed_position = self.fixed_position
+        position = self.position
+        for axis in range(3):
+            fixed_position[axis] += self.fixed_step[axis] * frames
+            position[axis] = fixed_position[axis] / ONE
+        if abs(fixed_position[0]) > MISSILE_RANGE or abs(fixed_position[1]) > MISSILE_RANGE:
+            self.active = False
+
+
+class FixedCharacter(Character):
+    # A fighter whose physics and health are integers on the grid. The base
+    # class still handles flags, timers and cooldowns; the overrides here
+    # redo whatever it would have done in floats.
+    __slots__ = ('fixed', 'fixed_strength')
+
+    def __init__(self, *args, **kwargs):
+        self.fixed = array('q', bytes(8 * PHYSICS_SIZE))
+        super().__init__(*args, **kwargs)
+        self.reject_ai()
+        self.load_physics()
+
+    def reject_ai(self):
+        # The built-in AI rolls numpy's shared generator, which peers neither
+        # exchange nor checksum, so it would drift apart between them. A
+        # computer player has to send inputs like any other peer (see
+        # src/lookahead_ai.py).
+        if self.is_ai:
+            raise ValueError(f"{self.name}: fighters with the built-in AI cannot play in lockstep")
+
+    # Health reads and writes as a float but is stored on the grid
+    @property
+    def strength(self):
+        return self.fixed_strength / ONE
+
+    @strength.setter
+    def strength(self, value):
+        self.fixed_strength = to_fixed(value)
+
+    def load_physics(self):
+        # Takes the grid values from the float physics, after they were
+        # written from outside (construction or a snapshot). Those floats
+        # are always grid images, so this is exact.
+        fixed = self.fixed
+        for i, value in enumerate(self.physics):
+            fixed[i] = to_fixed(value)
+
+    def sync_physics(self):
+        physics = self.physics
+        for i, value in enumerate(self.fixed):
+            physics[i] = value / ONE
+
+    def copy_state_from(self, other):
+        super().copy_state_from(other)
+        self.reject_ai()
+        self.load_physics()
+
+    def facing(self):
+        # 1 facing right (standing left of center), -1 facing left
+        return 1 if self.fixed[PX] < 0 else -1
+
+    def walk(self, direction):
+        self.fixed[PX] += MOVE_SPEED * direction
+        self.physics[PX] = self.fixed[PX] / ONE
+
+    def step_physics(self):
+        p = self.fixed
+        vx = mul(p[VX], FRICTION) + p[AX]
+        vy = mul(p[VY], AIR_RESISTANCE) + p[AY] - GRAVITY
+        vz = p[VZ] + p[AZ]
+
+        p[PX] += vx
+        new_y = p[PY] + vy
+        if new_y < 0:
+            new_y = 0
+
+        # Check if landed
+        if new_y == 0 and vy < 0:
+            vy = 0
+            self.is_jumping = False
+            self.can_double_jump = True
+
+        p[PY] = new_y
+        p[PZ] += vz
+        p[VX] = vx
+        p[VY] = vy
+        p[VZ] = vz
+        p[AX] = p[AY] = p[AZ] = 0
+        self.sync_physics()
+
+    def update(self):
+        if self.is_exploding or self.is_staggered:
+            return
+        self.step_physics()
+        # Combos run on frames; the wall clock differs between peers
+        if self.wheel.frame - self.last_hit_time > self.combo_window:
+            self.combo_count = 0
+
+    def jump(self):
+        if not super().jump():
+            return False
+        if self.can_double_jump:
+            self.fixed[VY] = JUMP_SPEED
+        else:
+            self.fixed[VY] = DOUBLE_JUMP_SPEED
+            self.fixed[VX] += self.facing() * DOUBLE_JUMP_PUSH
+        self.sync_physics()
+        return True
+
+    def punch(self):
+        if not super().punch():
+            return False
+        self.fixed[VX] += self.facing() * PUNCH_PUSH
+        self.sync_physics()
+        return True
+
+    def kick(self):
+        if not super().kick():
+            return False
+        self.fixed[VX] += self.facing() * KICK_PUSH
+        self.fixed[VY] += KICK_LIFT
+        self.sync_physics()
+        return True
+
+    def shoot(self):
+        if self.shoot_cooldown <= 0 and self.pistols > 0:
+            direction = self.facing()
+            # Start slightly in front, at chest height
+            start = ((self.fixed[PX] + direction * ONE) / ONE, (self.fixed[PY] + ONE // 2) / ONE,
+                     self.fixed[PZ] / ONE)
+            self.projectiles.append(FixedProjectile(start, (float(direction), 0, 0), speed=MISSILE_SPEED))
+            self.shoot_cooldown = self.shoot_cooldown_max
+            return True
+        return False
+
+    def hurtboxes(self):
+        punch_state = self.punch_frame + 1 if self.is_punching else 0
+        kick_state = self.kick_frame + 1 if self.is_kicking else 0
+        return FIXED_HURTBOX_TREES[punch_state][kick_state]
+
+    def attack_boxes(self):
+        punch = self.is_punching and self.punch_frame == MELEE_ACTIVE_FRAME
+        kick = self.is_kicking and self.kick_frame == MELEE_ACTIVE_FRAME
+        if punch and kick:
+            return FIXED_PUNCH_BOXES + FIXED_KICK_BOXES
+        if punch:
+            return FIXED_PUNCH_BOXES
+        if kick:
+            return FIXED_KICK_BOXES
+        return ()
+
+
+class LockstepMatch(Match):
+    # A match on fixed-point fighters and missiles that checksums its state
+    # after every frame. Peers (or a server and a replay verifier) that
+    # exchange only inputs can compare checksums to prove they are still
+    # playing the same match, and find the first frame they are not.
+    #
+    # Combines with FightingGame for play on screen; see LockstepGame in
+    # src/game.py.
+    character_class = FixedCharacter
+    projectile_class = FixedProjectile
+
+    def __init__(self, *args, **kwargs):
+        # Checksum of the state after frame f is checksums[f - 1]
+        self.checksums = array('I')
+        self._state = new_state()
+        super().__init__(*args, **kwargs)
+
+    # Score reads and writes as a number but is stored on the grid
+    @property
+    def score(self):
+        return _score_value(self.fixed_score)
+
+    @score.setter
+    def score(self, value):
+        self.fixed_score = to_fixed(value)
+
+    def initialize_characters(self):
+        # The grid constants above are rounded from the BASE_RATE tuning.
+        # Other rates would compile theirs with float powers and divisions,
+        # which are not guaranteed to round the same on every machine.
+        if self.tick_rate.hz != BASE_RATE:
+            raise ValueError(f"Lockstep matches run at {BASE_RATE} ticks per second only")
+        # Fixed-point fighters only know the flat floor
+        if self.stage.name != DEFAULT_STAGE:
+            raise ValueError(f"Lockstep matches are played on the {DEFAULT_STAGE!r} stage only")
+        super().initialize_characters()
+
+    def clone(self):
+        copy = LockstepMatch(quiet=True)
+        copy.simulate_effects = False
+        copy.copy_state_from(self)
+        return copy
+
+    def state_restored(self):
+        super().state_restored()
+        self.player1.load_physics()
+        self.player2.load_physics()
+
+    def checksum(self):
+        # CRC-32 of the packed state. The packed floats are exact images of
+        # the grid values and are hashed little-endian, so equal states give
+        # equal checksums on any machine.
+        state = pack_match(self, self._state)
+        return zlib.crc32(state.astype('<f8').tobytes())
+
+    def verify(self, frame, checksum):
+        # Checks a peer's checksum for a frame already simulated here
+        if not 0 < frame <= len(self.checksums):
+            raise ValueError(f"No checksum for frame {frame}")
+        expected = self.checksums[frame - 1]
+        if checksum != expected:
+            raise DesyncError(f"Desync at frame {frame}: checksum {checksum:08x}, "
+                              f"expected {expected:08x}")
+
+    def frame_message(self, inputs):
+        # This peer's message for the frame about to be simulated
+        previous = self.checksums[-1] if self.checksums else 0
+        return FRAME_MESSAGE.pack(self.frame + 1, inputs, previous)
+
+    def update(self, frames=1):
+        # Checksums are per frame, so there is no coarse stepping here
+        if frames != 1:
+            raise ValueError("Lockstep matches step one frame at a time")
+        self._simulate()
+        checksum = self.checksum()
+        if self.frame <= len(self.checksums):
+            # Stepping an earlier frame again after restoring a snapshot
+            # (the instant replay does this), which gives the same checksum
+            self.checksums[self.frame - 1] = checksum
+        else:
+            self.checksums.append(checksum)
+
+    def _simulate(self):
+        self.frame += 1
+        self.wheel.advance(self.frame)
+        player1, player2 = self.player1, self.player2
+
+        if player1.fixed_strength <= 0 or player2.fixed_strength <= 0:
+            if not player1.is_exploding and not player2.is_exploding:
+                self.say("Game Over!")
+                self.say("Player 1 wins!" if player2.fixed_strength <= 0 else "Player 2 wins!")
+                self.running = False
+                return
+
+        tracker = self.alloc_tracker
+        tracer = self.tracer
+
+        with tracker.section('character update'):
+            with tracer.span('Character.update'):
+                player1.update()
+                player2.update()
+
+        if self.simulate_effects:
+            with tracker.section('particles'):
+                player1.update_particles()
+                player2.update_particles()
+
+        self.check_melee_combat()
+
+        with tracker.section('projectiles'), tracer.span('update_projectiles'):
+            self.update_projectiles()
+
+        # Fire breath burns only while player 1 stands to the left of player 2,
+        # so that both fighters breathe towards each other
+        gap = player2.fixed[PX] - player1.fixed[PX]
+        for attacker, defender in ((player1, player2), (player2, player1)):
+            if attacker.is_breathing_fire and 0 < gap < FIRE_BREATH_RANGE:
+                self.damage(attacker, defender, FIRE_BREATH_DAMAGE, FIRE_BREATH)
+                if self.frame % 10 == 0:
+                    self.sound_manager.play('hit')
+                if defender.fixed_strength <= 0:
+                    self.say(f"{defender.name} was incinerated!")
+                    self.knock_out(attacker, defender)
+
+        self.analytics.sample(self)
+
+    def damage(self, attacker, defender, amount, source):
+        # As Match.damage, with amount on the grid
+        standing = defender.fixed_strength > 0
+        if standing:
+            self.analytics.damage(self, defender, min(amount, defender.fixed_strength) / ONE, source)
+        defender.fixed_strength -= amount
+        # Score is player 1's damage dealt
+        if attacker is self.player1:
+            self.fixed_score += amount
+        if standing and defender.fixed_strength <= 0:
+            self.count_knockout(defender)
+
+    def knock_out(self, attacker, defender):
+        defender.start_explosion()
+        self.sound_manager.play('explosion')
+        if attacker is self.player1:
+            self.fixed_score += KNOCKOUT_BONUS
+        defender.fixed_strength = 0
+
+    def update_projectiles(self):
+        # As Match.update_projectiles, one frame at a time on the grid:
+        # missiles that met during the frame are destroyed first, in the
+        # order the sweep finds them, then the rest can hit a fighter
+        projectiles = self.all_projectiles
+        order = self.missile_order
+        if not order and not self.player1.projectiles and not self.player2.projectiles:
+            return
+        flights = self._flights
+        for projectile in order:
+            projectile.update()
+            x1 = projectile.fixed_position[0]
+            x0 = x1 - projectile.fixed_step[0]
+            flights.append((min(x0, x1) - MISSILE_RADIUS, max(x0, x1) + MISSILE_RADIUS, projectile))
+        sort_by_low(flights)
+        for index, flight in enumerate(flights):
+            order[index] = flight[2]
+
+        spent = self._spent
+        if len(flights) > 1:
+            for a, b in overlapping_pairs(flights):
+                first, second = a[2], b[2]
+                if (first.fixed_step[0] > 0) == (second.fixed_step[0] > 0):
+                    continue
+                if first in spent or second in spent or not _missiles_met(first, second):
+                    continue
+                spent.add(first)
+                spent.add(second)
+                position = [(p + q) / 2 for p, q in zip(first.position, second.position)]
+                self.intercept(first, second, position)
+        flights.clear()
+
+        for projectile in projectiles:
+            if projectile in spent:
+                continue
+            # Missiles only hit the fighter they fly towards
+            if projectile.fixed_step[0] > 0:
+                attacker, defender = self.player1, self.player2
+            elif projectile.fixed_step[0] < 0:
+                attacker, defender = self.player2, self.player1
+            else:
+                continue
+            if self.check_collision(projectile, defender):
+                self.say(f"{defender.name} was hit by a missile!")
+                self.damage(attacker, defender, MISSILE_DAMAGE, MISSILE)
+                projectile.active = False
+                self.sound_manager.play('hit')
+                if defender.fixed_strength <= 0:
+                    self.say(f"{defender.name} has been defeated!")
+                    self.knock_out(attacker, defender)
+        spent.clear()
+
+        for player in self.players:
+            projectiles.extend(player.projectiles)
+            order.extend(player.projectiles)
+            player.projectiles.clear()
+        for missiles in (projectiles, order):
+            kept = 0
+            for projectile in missiles:
+                if projectile.active:
+                    missiles[kept] = projectile
+                    kept += 1
+            del missiles[kept:]
+
+    def check_collision(self, projectile, character):
+        position = projectile.fixed_position
+        origin = character.fixed
+        return character.hurtboxes().hit_sphere(
+            position[0] - origin[PX], position[1] - origin[PY], position[2] - origin[PZ],
+            MISSILE_RADIUS) >= 0
+
+    def check_melee_combat(self):
+        if self.player1.fixed_strength <= 0 or self.player2.fixed_strength <= 0:
+            return
+        for attacker, defender in ((self.player1, self.player2), (self.player2, self.player1)):
+            attacks = attacker.attack_boxes()
+            if not attacks:
+                continue
+            dx = attacker.fixed[PX] - defender.fixed[PX]
+            dy = attacker.fixed[PY] - defender.fixed[PY]
+            dz = attacker.fixed[PZ] - defender.fixed[PZ]
+            tree = defender.hurtboxes()
+            for box in attacks:
+                limb = tree.hit_box(box, dx, dy, dz)
+                if limb >= 0:
+                    self.melee_hit(attacker, defender, limb)
+                    break
+
+    def melee_hit(self, attacker, defender, limb):
+        # Damage and knockback grow with the attacker's speed
+        speed = attacker.fixed[VX]
+        damage = min(max(MELEE_MIN_DAMAGE, abs(speed) * MELEE_IMPACT), MELEE_MAX_DAMAGE)
+        self.damage(attacker, defender, damage, MELEE)
+        defender.fixed[VX] += mul(speed, KNOCKBACK)
+        defender.fixed[VY] += KNOCKBACK_LIFT
+        defender.sync_physics()
+        self.sound_manager.play('hit')
+        self.say(f"{defender.name} was hit in the {LIMB_NAMES[limb]} for {damage / ONE:.1f} damage!")
+
+
+def replay_checksums(recording):
+    # Steps a recording in lockstep and returns its per-frame checksums
+    match = LockstepMatch(seed=recording.seed, quiet=True)
+    for inputs1, inputs2 in recording:
+        if not match.running:
+            break
+        match.step(inputs1, inputs2)
+    return match.checksums
+
+
+def verify_recording(recording):
+    # Replays a lockstep recording and compares it with the checksums
+    # recorded live. Returns the number of frames verified; raises
+    # DesyncError at the first frame that differs.
+    if recording.checksums is None:
+        raise ValueError("The recording has no checksums (record with --lockstep)")
+    replayed = replay_checksums(recording)
+    for frame, (expected, actual) in enumerate(zip(recording.checksums, replayed), 1):
+        if expected != actual:
+            raise DesyncError(f"Desync at frame {frame}: checksum {actual:08x}, "
+                              f"recorded {expected:08x}")
+    return min(len(recording.checksums), len(replayed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify lockstep recordings against their checksums")
+    parser.add_argument('recordings', nargs='+', metavar='RECORDING',
+                        help='.npz recordings made with game.py --lockstep --record')
+    args = parser.parse_args()
+    failed = False
+    for path in args.recordings:
+        recording = MatchRecording.load(path)
+        try:
+            frames = verify_recording(recording)
+        except (DesyncError, ValueError) as e:
+            print(f"{path}: {e}")
+            failed = True
+        else:
+            print(f"{path}: {frames} frames match, {FRAME_MESSAGE.size} bytes per frame per peer in lockstep")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+import argparse
+import time
+
+import numpy as np
+
+from src.match import (Match, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, INPUT_PUNCH,
+                       INPUT_KICK, INPUT_SHOOT, INPUT_FIRE)
+
+# Candidate actions. Movement is relative to the opponent and turned into
+# INPUT_LEFT/INPUT_RIGHT when a plan is made.
+TOWARD = 'toward'
+AWAY = 'away'
+ACTIONS = (
+    ('idle', 0, None),
+    ('advance', 0, TOWARD),
+    ('retreat', 0, AWAY),
+    ('jump', INPUT_JUMP, None),
+    ('jump in', INPUT_JUMP, TOWARD),
+    ('jump out', INPUT_JUMP, AWAY),
+    ('punch', INPUT_PUNCH, None),
+    ('kick', INPUT_KICK, None),
+    ('shoot', INPUT_SHOOT, None),
+    ('breathe fire', INPUT_FIRE, None),
+    ('rush punch', INPUT_PUNCH, TOWARD),
+    ('rush kick', INPUT_KICK, TOWARD),
+)
+
+# Reward for knocking the opponent out (or penalty for being knocked out)
+# within the horizon, on top of the damage itself
+KO_BONUS = 50.0
+
+
+def action_inputs(action, player, opponent):
+    # Input bits for one of ACTIONS from player's side of the fight
+    _, buttons, move = action
+    if move is None:
+        return buttons
+    toward_right = opponent.position[0] > player.position[0]
+    if (move == TOWARD) == toward_right:
+        return buttons | INPUT_RIGHT
+    return buttons | INPUT_LEFT
+
+
+class LookaheadAI:
+    # Plans for one player of a live match by Monte-Carlo rollouts. Every
+    # `replan_interval` frames the match is copied into a scratch match and
+    # each candidate action is tried for that many frames, followed by random
+    # play (from both sides) up to `horizon` frames ahead. The action with the
+    # best average damage differential is then played until the next plan.
+    # Rollouts are spread over the candidates round-robin until `budget_ms`
+    # of wall-clock time has passed, so a decision never holds up the frame
+    # longer than that however fast the machine is. All candidates in a
+    # round face the same random follow-up, which keeps the comparison fair
+    # with only a few rollouts.
+    #
+    # Both intervals default to the same stretch of match time at any tick
+    # rate: half a second ahead, replanned every sixth of a second.
+    def __init__(self, match, player_index, horizon=None, budget_ms=6.0,
+                 replan_interval=None, seed=None):
+        self.match = match
+        self.player_index = player_index
+        self.horizon = horizon or match.tick_rate.ticks(0.5)
+        self.budget_ms = budget_ms
+        self.replan_interval = replan_interval or match.tick_rate.ticks(1 / 6)
+        # Own generator, so planning never shifts the match's random stream
+        self.rng = np.random.default_rng(seed)
+        # Reused for every rollout; copying into it only touches flat arrays.
+        # A clone is of the match's own simulation (fixed-point fighters in a
+        # lockstep game), so rollouts play by the same physics.
+        self.scratch = match.clone()
+        self.action = ACTIONS[0]
+        self.frames_left = 0
+        # Stats from the last plan
+        self.last_scores = np.zeros(len(ACTIONS))
+        self.last_rollouts = 0
+
+    def decide(self):
+        # Input bits for the controlled player this frame
+        if self.frames_left <= 0:
+            self.plan()
+            self.frames_left = self.replan_interval
+        self.frames_left -= 1
+        players = self.match.players
+        player = players[self.player_index]
+        opponent = players[1 - self.player_index]
+        return action_inputs(self.action, player, opponent)
+
+    def plan(self):
+        totals = np.zeros(len(ACTIONS))
+        counts = np.zeros(len(ACTIONS), dtype=np.int64)
+        deadline = time.perf_counter() + self.budget_ms / 1000.0
+        # The combat code draws particles from numpy's global generator when
+        # a fighter explodes; put it back so rollouts leave no trace
+        random_state = np.random.get_state()
+        candidate = 0
+        # Every candidate gets at least one rollout
+        while candidate < len(ACTIONS) or time.perf_counter() < deadline:
+            index = candidate % len(ACTIONS)
+            if index == 0:
+                followup = self.random_followup()
+            totals[index] += self.rollout(ACTIONS[index], followup)
+            counts[index] += 1
+            candidate += 1
+        np.random.set_state(random_state)
+        scores = totals / counts
+        self.last_scores = scores
+        self.last_rollouts = int(counts.sum())
+        self.action = ACTIONS[int(np.argmax(scores))]
+
+    def random_followup(self):
+        # Random actions for both sides, one pair per segment of the horizon
+        segments = (self.horizon + self.replan_interval - 1) // self.replan_interval
+        return self.rng.integers(0, len(ACTIONS), (segments, 2)).tolist()
+
+    def rollout(self, action, followup=None):
+        # Damage dealt minus damage taken over the horizon when starting
+        # with `action`, then playing `followup`
+        if followup is None:
+            followup = self.random_followup()
+        scratch = self.scratch
+        scratch.copy_state_from(self.match)
+        player = scratch.players[self.player_index]
+        opponent = scratch.players[1 - self.player_index]
+        start_player = player.strength
+        start_opponent = opponent.strength
+
+        segment = self.replan_interval
+        own = action
+        other = ACTIONS[followup[0][1]]
+        for frame in range(self.horizon):
+            if not scratch.running:
+                break
+            if frame and frame % segment == 0:
+                own_choice, other_choice = followup[frame // segment]
+                own = ACTIONS[own_choice]
+                other = ACTIONS[other_choice]
+            own_inputs = action_inputs(own, player, opponent)
+            other_inputs = action_inputs(other, opponent, player)
+            if self.player_index == 0:
+                scratch.step(own_inputs, other_inputs)
+            else:
+                scratch.step(other_inputs, own_inputs)
+
+        dealt = start_opponent - opponent.strength
+        taken = start_player - player.strength
+        score = dealt - taken
+        if opponent.strength <= 0:
+            score += KO_BONUS
+        if player.strength <= 0:
+            score -= KO_BONUS
+        return score
+
+
+def benchmark_rollouts(seconds=2.0, horizon=30, seed=0):
+    # Rollout and clone throughput from a mid-fight position
+    match = Match(seed=seed, quiet=True)
+    rng = np.random.default_rng(seed)
+    for _ in range(120):
+        match.step(int(rng.integers(0, 128)), int(rng.integers(0, 128)))
+    ai = LookaheadAI(match, 1, horizon=horizon, seed=seed)
+
+    clones = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds / 4:
+        ai.scratch.copy_state_from(match)
+        clones += 1
+    clone_us = (time.perf_counter() - start) / clones * 1e6
+
+    rollouts = 0
+    random_state = np.random.get_state()
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        ai.rollout(ACTIONS[rollouts % len(ACTIONS)])
+        rollouts += 1
+    elapsed = time.perf_counter() - start
+    np.random.set_state(random_state)
+    return {
+        'clone_us': clone_us,
+        'rollouts_per_second': rollouts / elapsed,
+        'frames_per_second': rollouts * horizon / elapsed,
+        'rollouts_per_decision': rollouts / elapsed * ai.budget_ms / 1000.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark lookahead AI rollout throughput")
+    parser.add_argument('--seconds', type=float, default=2.0, help='time to spend on rollouts')
+    parser.add_argument('--horizon', type=int, default=30, help='frames simulated per rollout')
+    args = parser.parse_args()
+
+    stats = benchmark_rollouts(args.seconds, args.horizon)
+    print(f"State copy:    {stats['clone_us']:.1f} us")
+    print(f"Rollouts:      {stats['rollouts_per_second']:.0f}/s ({args.horizon} frames each)")
+    print(f"Frames:        {stats['frames_per_second']:.0f}/s")
+    print(f"Per decision:  {stats['rollouts_per_decision']:.1f} rollouts in the default budget")
+
+
+if __name__ == '__main__':
+    main()
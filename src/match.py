@@ -0,0 +1,647 @@
+import math
+from operator import itemgetter
+
+import numpy as np
+import pygame
+
+from src.sound_manager import SilentSoundManager
+from src.alloc_tracker import NULL_TRACKER
+from src.analytics import NULL_ANALYTICS, MISSILE, MELEE, FIRE_BREATH, HAZARD
+from src.tracing import NULL_TRACER
+from src.characters import Character, Projectile, GROUND_DRAG, AIR_DRAG
+from src.hitboxes import LIMB_NAMES, sweep_box, sweep_point
+from src.particles import ParticleSystem
+from src.sweep_prune import sort_by_low, overlapping_pairs
+from src.stage import get_stage, DEFAULT_STAGE
+from src.timer_wheel import TimerWheel
+from src.tick_rate import TickRate, BASE_RATE, DURATION, SPEED, RATE, PER_SPEED
+
+# Input bits, one byte per player per frame
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+INPUT_PUNCH = 8
+INPUT_KICK = 16
+INPUT_SHOOT = 32
+INPUT_FIRE = 64
+
+# Particles in one missile interception blast, and room for a few at once
+BLAST_PARTICLES = 24
+BLAST_CAPACITY = 96
+
+# Sort key for the events of a step (see Match.update_projectiles)
+_EVENT_ORDER = itemgetter(0, 1, 2)
+
+# Span arguments telling the two fighters' updates apart in a trace
+_PLAYER1_ARGS = {'player': 1}
+_PLAYER2_ARGS = {'player': 2}
+
+class Match:
+    # The simulation side of a fight: both characters, projectiles, combat
+    # rules and score. Nothing here touches the display, so a match can be
+    # stepped headless from recorded or generated inputs.
+
+    # Subclasses with their own fighters and missiles (see src/lockstep.py)
+    # swap these out
+    character_class = Character
+    projectile_class = Projectile
+    # Per-frame state checksums, for matches that keep them
+    checksums = None
+    # Combat tuning that does not depend on the tick rate
+    melee_min_damage = 5
+    missile_damage = 15
+    knockback = 1.5  # Defender speed per unit of attacker speed
+    knockout_bonus = 50
+    # Combat tuning in real time, compiled per match like Character.TUNING
+    TUNING = {
+        'fire_breath_damage': (RATE, 120.0),  # Strength burnt per second in range
+        'knockback_lift': (SPEED, 6.0, AIR_DRAG),
+        'blast_duration': (DURATION, 0.4),
+        'hazard_damage': (RATE, 30.0),  # Strength burnt per second in a hazard
+        # Melee damage per unit of the attacker's speed in units per second
+        # (20 per unit per 1/60 s), before clamping
+        'melee_impact': (PER_SPEED, 1 / 3, GROUND_DRAG),
+    }
+    def __init__(self, sound_manager=None, seed=None, alloc_tracker=None, tracer=None,
+                 tick_rate=BASE_RATE, stage=DEFAULT_STAGE, analytics=None, rng=None, quiet=False):
+        # Particle effects draw from rng, a numpy Generator of this match's
+        # own, when one is given, which leaves numpy's global state alone for
+        # matches sharing a process. Otherwise they draw from the global
+        # generator, and seeding it makes a replayed match look identical
+        # to the original.
+        if rng is None:
+            if seed is not None:
+                np.random.seed(seed)
+            rng = np.random
+        self.rng = rng
+        self.seed = seed
+
+        # Ticks per second; one frame of the match is one tick. Fighters and
+        # combat take their per-tick tuning from it (see src/tick_rate.py).
+        self.tick_rate = TickRate(tick_rate)
+        for name, value in self.tick_rate.compile(self.TUNING).items():
+            setattr(self, name, value)
+
+        # The named stage (see src/stage.py), shared by both fighters
+        self.stage = get_stage(stage)
+
+        # Cooldowns, animations and effects of both fighters end on this
+        # wheel, which always sits at the current frame
+        self.wheel = TimerWheel()
+
+        # Initialize characters
+        self.initialize_characters()
+        self.players = (self.player1, self.player2)
+        for player in self.players:
+            player.stage = self.stage
+            player.rng = self.rng
+        # Headless runs (batch simulation, lookahead, servers) keep the
+        # match from printing its hits instead of redirecting stdout, which
+        # would silence every other thread as well
+        self.quiet = quiet
+
+        # Game state
+        self.running = True
+        self.frame = 0
+
+        # Sound effects are optional when running headless
+        self.sound_manager = sound_manager or SilentSoundManager()
+        
+        # Add score
+        self.score = 0
+
+        # List to manage all projectiles in the game
+        self.all_projectiles = []
+        # The same missiles in order along x, kept from step to step (see
+        # update_projectiles)
+        self.missile_order = []
+        # Scratch containers for update_projectiles, emptied and refilled
+        # every step rather than built anew
+        self._flights = []
+        self._events = []
+        self._spent = set()
+        # Explosions of missiles that shot each other down
+        self.blast_particles = ParticleSystem(BLAST_CAPACITY)
+
+        # Per-frame allocation tracking (a no-op unless a tracker is given)
+        self.alloc_tracker = alloc_tracker or NULL_TRACKER
+        # Timeline spans (a no-op unless a tracer is given)
+        self.tracer = tracer or NULL_TRACER
+        # Aggregate statistics (a no-op unless a sink is given, see
+        # src/analytics.py)
+        self.analytics = analytics or NULL_ANALYTICS
+        # Fighters whose knockout the sink has been told of. Kept apart from
+        # the simulation state, so a match rewound past a knockout (the
+        # instant replay does this) does not count it again.
+        self.counted_knockouts = set()
+
+        # Particle effects are cosmetic; lookahead copies turn them off
+        self.simulate_effects = True
+
+    def copy_state_from(self, other):
+        # Makes this match a copy of other's simulation state, reusing this
+        # match's characters so no particle pools are reallocated
+        self.wheel.reset(other.wheel.frame)
+        self.player1.copy_state_from(other.player1)
+        self.player2.copy_state_from(other.player2)
+        self.running = other.running
+        self.frame = other.frame
+        self.score = other.score
+        self.all_projectiles = [projectile.clone() for projectile in other.all_projectiles]
+        self.missile_order = list(self.all_projectiles)
+        self.blast_particles.clear()
+
+    def state_restored(self):
+        # Called once a snapshot has been unpacked into this match, which
+        # replaces the missiles
+        self.missile_order = list(self.all_projectiles)
+
+    @property
+    def quiet(self):
+        return self._quiet
+
+    @quiet.setter
+    def quiet(self, value):
+        # The fighters print their own jumps, so they follow the match
+        self._quiet = value
+        for player in self.players:
+            player.quiet = value
+
+    def say(self, text):
+        # Every message about the fight goes through here
+        if not self._quiet:
+            print(text)
+
+    def clone(self):
+        # A silent, effect-free copy for stepping ahead of the real match
+        copy = Match(tick_rate=self.tick_rate.hz, stage=self.stage.name, quiet=True)
+        copy.simulate_effects = False
+        copy.copy_state_from(self)
+        return copy
+
+    def initialize_characters(self):
+        fighter_class = self.character_class.at_rate(self.tick_rate.hz)
+        self.player1 = fighter_class(
+            name="Player 1", 
+            position=(-3, 0, 0),
+            color=(0, 0, 1),      # Blue
+            strength=100,
+            pistols=2,
+            is_ai=False,
+            wheel=self.wheel
+        )
+        self.player2 = fighter_class(
+            name="Player 2",
+            position=(3, 0, 0),
+            color=(1, 0, 0),      # Red
+            strength=100,
+            pistols=2,
+            is_ai=False,         # Changed to False for human player
+            wheel=self.wheel
+        )
+
+    def apply_inputs(self, inputs1, inputs2):
+        self.apply_player_inputs(self.player1, inputs1)
+        self.apply_player_inputs(self.player2, inputs2)
+
+    def apply_player_inputs(self, player, inputs):
+        if player.is_exploding:
+            return  # A knocked out fighter no longer responds to input
+        if inputs & INPUT_LEFT:
+            player.walk(-1)
+        if inputs & INPUT_RIGHT:
+            player.walk(1)
+        if inputs & INPUT_JUMP:
+            double = player.is_jumping
+            if player.jump():
+                self.sound_manager.play('jump')
+                self.analytics.jump(self, player, double)
+        if inputs & INPUT_PUNCH:
+            if player.punch():
+                self.sound_manager.play('punch')
+        if inputs & INPUT_KICK:
+            if player.kick():
+                self.sound_manager.play('kick')
+        if inputs & INPUT_SHOOT:
+            if player.shoot():
+                self.sound_manager.play('shoot')
+        if inputs & INPUT_FIRE:
+            if player.breathe_fire():
+                self.sound_manager.play('fire')
+
+    def step(self, inputs1, inputs2, frames=1):
+        # One headless step: apply both players' inputs, then simulate
+        # `frames` frames (see update)
+        self.apply_inputs(inputs1, inputs2)
+        self.update(frames)
+
+    def update(self, frames=1):
+        # frames > 1 is a coarse step for fast-forwarding headless matches.
+        # Fighters, melee and fire breath still advance frame by frame, as
+        # their timers and attack frames are exact, but missiles fly the whole
+        # step at once and are swept against the fighters' motion over it, so
+        # they hit what they would have hit in single frames. Only the
+        # missiles are saved work, so a coarse step is about 1.2x faster than
+        # single frames at 2 frames and 1.8x at 8 (python -m src.fast_forward).
+        tracker = self.alloc_tracker
+        tracer = self.tracer
+        # Each fighter's position and hurtboxes before the step and after
+        # every frame of it, for the missiles to be checked against. Unless
+        # an AI is in control, missiles are only fired by inputs, so with none
+        # about there is nothing to do.
+        player1, player2 = self.player1, self.player2
+        if (self.all_projectiles or player1.projectiles or player2.projectiles or
+                player1.is_ai or player2.is_ai):
+            path1 = [(tuple(player1.position), player1.hurtboxes())]
+            path2 = [(tuple(player2.position), player2.hurtboxes())]
+        else:
+            path1 = path2 = None
+
+        for step in range(frames):
+            self.frame += 1
+            self.wheel.advance(self.frame)
+
+            # Check if either character is already defeated
+            if self.player1.strength <= 0 or self.player2.strength <= 0:
+                # Wait for explosion animation to finish
+                if not self.player1.is_exploding and not self.player2.is_exploding:
+                    self.say("Game Over!")
+                    if self.player2.strength <= 0:
+                        self.say("Player 1 wins!")
+                    else:
+                        self.say("Player 2 wins!")
+                    self.running = False
+                    return
+
+            # Update characters
+            with tracker.section('character update'):
+                with tracer.span('Character.update', _PLAYER1_ARGS):
+                    self.player1.update()
+                with tracer.span('Character.update', _PLAYER2_ARGS):
+                    self.player2.update()
+            if path1 is not None:
+                path1.append((tuple(player1.position), player1.hurtboxes()))
+                path2.append((tuple(player2.position), player2.hurtboxes()))
+            
+            if self.simulate_effects:
+                with tracker.section('particles'):
+                    self.player1.update_particles()
+                    self.player2.update_particles()
+                    self.update_blasts()
+            
+            # Check melee combat
+            self.check_melee_combat()
+            
+            if step == frames - 1:
+                with tracker.section('projectiles'), tracer.span('update_projectiles'):
+                    self.update_projectiles(path1, path2)
+
+            self.check_fire_breath()
+            self.check_hazards()
+            self.analytics.sample(self)
+
+    def check_hazards(self):
+        # Fighters standing in a hazard burn a little every frame
+        stage = self.stage
+        if not stage.hazards:
+            return
+        for fighter in self.players:
+            if fighter.strength > 0 and stage.in_hazard(fighter.position[0], fighter.position[1]):
+                self.damage(None, fighter, self.hazard_damage, HAZARD)
+                if fighter.strength <= 0:
+                    self.say(f"{fighter.name} was burnt up!")
+                    self.knock_out(None, fighter)
+
+    def check_fire_breath(self):
+        if self.player1.is_breathing_fire:
+            distance = abs(self.player1.position[0] - self.player2.position[0])
+            # Only damage if player 1 is to the left of player 2 (facing right)
+            is_facing_right = self.player1.position[0] < self.player2.position[0]
+            if distance < self.player1.fire_breath_range and is_facing_right:
+                self.damage(self.player1, self.player2, self.fire_breath_damage, FIRE_BREATH)
+                
+                if pygame.time.get_ticks() % 10 == 0:
+                    self.sound_manager.play('hit')
+                    self.say(f"{self.player2.name} is burning! Health: {self.player2.strength}")
+                
+                if self.player2.strength <= 0:
+                    self.say(f"{self.player2.name} was incinerated!")
+                    self.knock_out(self.player1, self.player2)
+
+        # Same for player 2's fire breath
+        if self.player2.is_breathing_fire:
+            distance = abs(self.player1.position[0] - self.player2.position[0])
+            # Only damage if player 2 is to the right of player 1 (facing left)
+            is_facing_left = self.player2.position[0] > self.player1.position[0]
+            if distance < self.player2.fire_breath_range and is_facing_left:
+                self.damage(self.player2, self.player1, self.fire_breath_damage, FIRE_BREATH)
+                
+                if pygame.time.get_ticks() % 10 == 0:
+                    self.sound_manager.play('hit')
+                    self.say(f"{self.player1.name} is burning! Health: {self.player1.strength}")
+                
+                if self.player1.strength <= 0:
+                    self.say(f"{self.player1.name} was incinerated!")
+                    self.knock_out(self.player2, self.player1)
+
+    def damage(self, attacker, defender, amount, source):
+        # Every hit goes through here; attacker is None for the stage's
+        # hazards. Score is player 1's damage dealt.
+        standing = defender.strength > 0
+        if standing:
+            # The sink only hears of the strength a standing fighter had
+            # left, not of burns and blasts on one already knocked out
+            self.analytics.damage(self, defender, min(amount, defender.strength), source)
+        defender.strength -= amount
+        if attacker is self.player1:
+            self.score += amount
+        if standing and defender.strength <= 0:
+            self.count_knockout(defender)
+
+    def count_knockout(self, defender):
+        # Tells the sink of a knockout, once per fighter per match
+        if defender not in self.counted_knockouts:
+            self.counted_knockouts.add(defender)
+            self.analytics.knockout(self, defender)
+
+    def knock_out(self, attacker, defender):
+        defender.start_explosion()
+        self.sound_manager.play('explosion')
+        if attacker is self.player1:
+            self.score += self.knockout_bonus
+        defender.strength = 0  # Ensure health doesn't go negative
+
+    def update_projectiles(self, path1=None, path2=None):
+        # Flies every missile through the step and resolves what it ran into
+        # in the order it happened: opposing missiles that meet destroy each
+        # other, and the rest can hit the fighter they fly towards. path1 and
+        # path2 follow the fighters through the step (see update); without
+        # them missiles are only checked against fighters where they end up.
+        frames = len(path1) - 1 if path1 else 1
+        projectiles = self.all_projectiles
+        order = self.missile_order
+
+        # Missiles fired in this step join the lists. They set off on its
+        # second frame, so a single-frame step leaves them where they are.
+        fired = len(order)
+        for player in self.players:
+            if player.projectiles:
+                projectiles.extend(player.projectiles)
+                order.extend(player.projectiles)
+                player.projectiles.clear()
+        if not order:
+            return
+
+        # One entry per missile: its extent along x over the step, then the
+        # missile, where it started and the frame of the step it set off on
+        flights = self._flights
+        for index, projectile in enumerate(order):
+            launch = 0 if index < fired else 1
+            start = tuple(projectile.position)
+            if launch < frames:
+                projectile.update(frames - launch)
+            x0 = start[0]
+            x1 = projectile.position[0]
+            radius = projectile.hit_radius
+            flights.append((min(x0, x1) - radius, max(x0, x1) + radius, projectile, start, launch))
+        # Kept in order along x from step to step, the missiles are cheap to
+        # sort again (see src/sweep_prune.py)
+        sort_by_low(flights)
+        for index, flight in enumerate(flights):
+            order[index] = flight[2]
+
+        # Everything that happens in the step, as (frame, kind, order, a, b):
+        # missiles meeting (kind 0, flights a and b, ordered by the moment
+        # they touch) go before missiles running into the stage (kind 1,
+        # flight a and where) and those before fighter hits (kind 2, flight
+        # a and the fighter) on the same frame, as they do in single frames
+        events = self._events
+        if len(flights) > 1:
+            for a, b in overlapping_pairs(flights):
+                if a[2].direction[0] * b[2].direction[0] >= 0:
+                    continue  # Only missiles flying at each other can meet
+                when = self.missile_contact(a, b, frames)
+                if when >= 0:
+                    frame = max(math.ceil(when) - 1, a[4], b[4])
+                    events.append((frame, 0, when, a, b))
+        for rank, flight in enumerate(flights):
+            _, _, projectile, start, launch = flight
+            if launch >= frames:
+                continue
+            t = self.stage.sweep(start, projectile.position, projectile.hit_radius)
+            if t >= 0:
+                when = launch + t * (frames - launch)
+                point = [start[axis] + (projectile.position[axis] - start[axis]) * t for axis in range(3)]
+                events.append((max(math.ceil(when) - 1, launch), 1, rank, flight, point))
+            if projectile.direction[0] > 0:  # Moving right (from player1)
+                defender, path = self.player2, path2
+            elif projectile.direction[0] < 0:  # Moving left (from player2)
+                defender, path = self.player1, path1
+            else:
+                continue
+            frame = self.collision_frame(projectile, defender, start,
+                                         path[launch:] if path else None)
+            if frame >= 0:
+                events.append((frame + launch, 2, rank, flight, defender))
+        if len(events) > 1:
+            events.sort(key=_EVENT_ORDER)
+
+        # Each missile only takes part in the first thing that happens to it
+        spent = self._spent
+        for _, kind, when, a, b in events:
+            if a[2] in spent or (kind == 0 and b[2] in spent):
+                continue
+            spent.add(a[2])
+            if kind == 0:
+                spent.add(b[2])
+                self.intercept(a[2], b[2], self.contact_point(a, b, when))
+            elif kind == 1:
+                self.missile_blocked(a[2], b)
+            else:
+                self.missile_hit(a[2], b)
+        flights.clear()
+        events.clear()
+        spent.clear()
+
+        # Remove inactive projectiles, compacting the lists in place
+        for missiles in (projectiles, order):
+            kept = 0
+            for projectile in missiles:
+                if projectile.active:
+                    missiles[kept] = projectile
+                    kept += 1
+            del missiles[kept:]
+
+    def missile_contact(self, a, b, frames):
+        # When, in frames since the step began, two missiles' spheres first
+        # touch as they fly (see update_projectiles for the entries), or -1
+        _, _, first, start_a, launch_a = a
+        _, _, second, start_b, launch_b = b
+        begin = max(launch_a, launch_b)
+        if begin >= frames:
+            return -1.0
+        step_a = first.speed * (begin - launch_a)
+        step_b = second.speed * (begin - launch_b)
+        speed_a = first.speed * (frames - begin)
+        speed_b = second.speed * (frames - begin)
+        direction_a, direction_b = first.direction, second.direction
+        t = sweep_point(
+            start_a[0] + direction_a[0] * step_a - start_b[0] - direction_b[0] * step_b,
+            start_a[1] + direction_a[1] * step_a - start_b[1] - direction_b[1] * step_b,
+            start_a[2] + direction_a[2] * step_a - start_b[2] - direction_b[2] * step_b,
+            direction_a[0] * speed_a - direction_b[0] * speed_b,
+            direction_a[1] * speed_a - direction_b[1] * speed_b,
+            direction_a[2] * speed_a - direction_b[2] * speed_b,
+            first.hit_radius + second.hit_radius)
+        if t < 0:
+            return -1.0
+        return begin + t * (frames - begin)
+
+    def contact_point(self, a, b, when):
+        # Halfway between two missiles `when` frames into the step
+        point = [0.0, 0.0, 0.0]
+        for _, _, projectile, start, launch in (a, b):
+            flown = projectile.speed * (when - launch)
+            for axis in range(3):
+                point[axis] += (start[axis] + projectile.direction[axis] * flown) / 2
+        return point
+
+    def intercept(self, first, second, point):
+        # Two missiles met head on: both go up in a small explosion at point
+        first.active = False
+        second.active = False
+        self.sound_manager.play('explosion')
+        if self.simulate_effects:
+            self.emit_blast(*point)
+
+    def missile_blocked(self, projectile, point):
+        # A missile ran into the stage and blows up where it touched
+        projectile.active = False
+        self.sound_manager.play('explosion')
+        if self.simulate_effects:
+            self.emit_blast(*point)
+
+    def emit_blast(self, x, y, z):
+        particles = self.blast_particles
+        new = particles.emit(BLAST_PARTICLES)
+        n = new.stop - new.start
+        base_ticks = self.tick_rate.base_ticks
+        theta = self.rng.uniform(0, 2 * np.pi, n)
+        height = self.rng.uniform(-1, 1, n)
+        ring = np.sqrt(1 - height * height)
+        speed = self.rng.uniform(0.03, 0.1, n) * base_ticks
+        particles.position[new] = (x, y, z)
+        particles.velocity[new, 0] = np.cos(theta) * ring * speed
+        particles.velocity[new, 1] = height * speed
+        particles.velocity[new, 2] = np.sin(theta) * ring * speed
+        particles.color[new, 0] = 1.0  # Yellow to orange
+        particles.color[new, 1] = self.rng.uniform(0.4, 0.9, n)
+        particles.color[new, 2] = self.rng.uniform(0.0, 0.2, n)
+        particles.size[new] = self.rng.uniform(0.08, 0.2, n)
+        particles.life[new] = self.blast_duration
+
+    def update_blasts(self):
+        particles = self.blast_particles
+        if len(particles):
+            particles.advance(shrink=0.93 ** self.tick_rate.base_ticks, stage=self.stage)
+            particles.remove_dead()
+
+    def missile_hit(self, projectile, defender):
+        self.say(f"{defender.name} was hit by a missile!")
+        attacker = self.player1 if defender is self.player2 else self.player2
+        self.damage(attacker, defender, self.missile_damage, MISSILE)
+        projectile.active = False
+        self.sound_manager.play('hit')
+
+        if defender.strength <= 0:
+            self.say(f"{defender.name} has been defeated!")
+            self.knock_out(attacker, defender)
+
+    def collision_frame(self, projectile, character, start=None, path=None):
+        # Missile sphere against the character's hurtboxes, in the
+        # character's local space; returns the frame of the path on which
+        # they touch, or -1. Given where the missile set off and the
+        # character's path over the same frames (position and hurtboxes
+        # before and after each one, see update), the sphere is swept along
+        # the missile's motion relative to the character frame by frame, so
+        # neither a fast missile nor a fighter thrown by knockback can pass
+        # through the other between checks.
+        position = projectile.position
+        radius = projectile.hit_radius
+        if path is None:
+            origin = character.position
+            hit = character.hurtboxes().hit_sphere(
+                position[0] - origin[0], position[1] - origin[1], position[2] - origin[2],
+                radius) >= 0
+            return 0 if hit else -1
+
+        frames = len(path) - 1
+        step_x = (position[0] - start[0]) / frames
+        step_y = (position[1] - start[1]) / frames
+        step_z = (position[2] - start[2]) / frames
+        if frames > 1:
+            # Most missiles are nowhere near the fighter: one sweep against
+            # the box around everywhere the body went settles those
+            low_x = low_y = low_z = float('inf')
+            high_x = high_y = high_z = -float('inf')
+            for origin, tree in path:
+                root = tree.root
+                low_x = min(low_x, origin[0] + root[0])
+                low_y = min(low_y, origin[1] + root[1])
+                low_z = min(low_z, origin[2] + root[2])
+                high_x = max(high_x, origin[0] + root[3])
+                high_y = max(high_y, origin[1] + root[4])
+                high_z = max(high_z, origin[2] + root[5])
+            if sweep_box((low_x, low_y, low_z, high_x, high_y, high_z),
+                         start[0], start[1], start[2],
+                         position[0] - start[0], position[1] - start[1], position[2] - start[2],
+                         radius) < 0:
+                return -1
+
+        x, y, z = start
+        for frame in range(frames):
+            origin = path[frame][0]
+            end, tree = path[frame + 1]
+            x0 = x - origin[0]
+            y0 = y - origin[1]
+            z0 = z - origin[2]
+            if frame == frames - 1:
+                x, y, z = position
+            else:
+                x, y, z = x + step_x, y + step_y, z + step_z
+            x1 = x - end[0]
+            y1 = y - end[1]
+            z1 = z - end[2]
+            if tree.sweep_sphere(x0, y0, z0, x1 - x0, y1 - y0, z1 - z0, radius) >= 0:
+                return frame
+        return -1
+
+    def check_melee_combat(self):
+        if self.player1.strength <= 0 or self.player2.strength <= 0:
+            return
+
+        for attacker, defender in ((self.player1, self.player2), (self.player2, self.player1)):
+            attacks = attacker.attack_boxes()
+            if not attacks:
+                continue
+            # Fists and feet are tested in the defender's local space
+            dx = attacker.position[0] - defender.position[0]
+            dy = attacker.position[1] - defender.position[1]
+            dz = attacker.position[2] - defender.position[2]
+            tree = defender.hurtboxes()
+            for box in attacks:
+                limb = tree.hit_box(box, dx, dy, dz)
+                if limb >= 0:
+                    self.melee_hit(attacker, defender, limb)
+                    break
+
+    def melee_hit(self, attacker, defender, limb):
+        # Calculate damage based on velocity
+        impact = abs(attacker.velocity[0]) * self.melee_impact
+        damage = min(max(self.melee_min_damage, impact), attacker.melee_damage)
+        self.damage(attacker, defender, damage, MELEE)
+        # Add knockback
+        defender.velocity[0] += attacker.velocity[0] * self.knockback
+        defender.velocity[1] += self.knockback_lift
+        self.sound_manager.play('hit')
+        self.say(f"{defender.name} was hit in the {LIMB_NAMES[limb]} for {damage:.1f} damage!")
@@ -0,0 +1,317 @@
+import argparse
+import asyncio
+import contextlib
+import multiprocessing
+import time
+
+import numpy as np
+
+from src.match import Match
+from src.perf_stats import FrameStats
+from src.gc_policy import GCPolicy
+from src.snapshot import new_state, pack_match
+from src.spectator import StateStream, StateDecoder, write_packet, read_packet, parse_address
+
+DEFAULT_PORT = 7778
+
+# Sent once to each player after connecting: the packet kind (numbered on
+# from the spectator stream's KEYFRAME and DELTA) and the player's index.
+# Everything after it is the match's spectator stream.
+JOINED = 2
+
+
+class HostedMatch:
+    __slots__ = ('match', 'stream', 'inputs', 'players', 'state')
+
+    def __init__(self, seed, queue_size, tick_rate):
+        # A generator of its own rather than Match(seed=...), which would
+        # reseed numpy's global one under every other match in the process.
+        # Quiet, since nobody reads the server's stdout.
+        self.match = Match(tick_rate=tick_rate, rng=np.random.default_rng(seed), quiet=True)
+        # Nobody watches particles on the server
+        self.match.simulate_effects = False
+        self.stream = StateStream(queue_size)
+        # Latest input bits from each player, held until they send new ones
+        self.inputs = [0, 0]
+        self.players = 0
+        self.state = new_state()
+
+
+class MatchServer:
+    # Hosts many headless matches in one process. Players connect over TCP
+    # and are paired in order of arrival, each pair getting its own Match.
+    # One tick loop steps every active match once per frame and queues its
+    # state to both players through a StateStream, which drops the backlog of
+    # anyone who cannot keep up. A player sends one byte, their current
+    # INPUT_* bits, whenever it changes; only the latest value is kept, so
+    # input cannot pile up either.
+    #
+    # Stepping matches has a deadline of `tick_budget` of the frame; the rest
+    # is left for socket I/O. Matches not reached by the deadline skip that
+    # frame and go first on the next one, so an overloaded server slows
+    # every match down a little rather than stalling.
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, tick_rate=60, tick_budget=0.75,
+                 max_matches=1000, queue_size=30, seed=None):
+        self.host = host
+        self.port = port
+        self.tick_rate = tick_rate
+        self.tick_seconds = 1.0 / tick_rate
+        self.tick_budget = tick_budget
+        self.max_matches = max_matches
+        self.queue_size = queue_size
+        self.rng = np.random.default_rng(seed)
+        self.matches = []
+        self.waiting = None
+        self.next_index = 0
+        self.server = None
+        self.running = False
+
+        self.stats = FrameStats(budget_ms=self.tick_seconds * 1000)
+        self.gc_policy = GCPolicy(self.stats)
+        self.ticks = 0
+        self.late_ticks = 0
+        self.skipped_steps = 0
+        self.matches_started = 0
+        self.matches_finished = 0
+        self.players_refused = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._connect, self.host, self.port)
+        # With port 0 the system picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.gc_policy.install()
+        self.gc_policy.freeze()
+
+    async def run(self):
+        # Ticks until stop(). A tick that overruns its frame is not made up
+        # for; the schedule restarts from now instead of bunching ticks up.
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        self.running = True
+        while self.running:
+            self.tick()
+            next_tick += self.tick_seconds
+            delay = next_tick - loop.time()
+            if delay < 0:
+                self.late_ticks += 1
+                next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    async def stop(self):
+        self.running = False
+        self.server.close()
+        for hosted in self.matches:
+            hosted.stream.close()
+        if self.waiting is not None:
+            self.waiting.stream.close()
+        await self.server.wait_closed()
+        self.gc_policy.uninstall()
+
+    def tick(self):
+        stats = self.stats
+        stats.begin_frame()
+        matches = self.matches
+        count = len(matches)
+        if count:
+            first = self.next_index % count
+            deadline = time.perf_counter() + self.tick_seconds * self.tick_budget
+            finished = []
+            for done in range(count):
+                if done and time.perf_counter() > deadline:
+                    self.skipped_steps += count - done
+                    first = (first + done) % count
+                    break
+                hosted = matches[(first + done) % count]
+                match = hosted.match
+                match.step(*hosted.inputs)
+                hosted.stream.publish(pack_match(match, hosted.state))
+                if not match.running:
+                    finished.append(hosted)
+            self.next_index = first
+            for hosted in finished:
+                self._finish(hosted)
+        self.ticks += 1
+        stats.end_frame()
+
+    def _finish(self, hosted):
+        # The final state is already queued; close() ends both streams after it
+        hosted.stream.close()
+        self.matches.remove(hosted)
+        self.matches_finished += 1
+
+    async def _connect(self, reader, writer):
+        if self.waiting is not None:
+            hosted = self.waiting
+            self.waiting = None
+            index = 1
+            self.matches.append(hosted)
+            self.matches_started += 1
+        elif len(self.matches) < self.max_matches:
+            hosted = HostedMatch(int(self.rng.integers(0, 2**31 - 1)), self.queue_size, self.tick_rate)
+            self.waiting = hosted
+            index = 0
+        else:
+            self.players_refused += 1
+            writer.close()
+            return
+        hosted.players += 1
+        write_packet(writer, bytes((JOINED, index)))
+        sender = asyncio.ensure_future(hosted.stream.send(writer))
+        try:
+            while True:
+                data = await reader.read(64)
+                if not data:
+                    break
+                hosted.inputs[index] = data[-1]
+        except ConnectionError:
+            pass
+        finally:
+            hosted.inputs[index] = 0
+            hosted.players -= 1
+            if hosted is self.waiting:
+                self.waiting = None
+            elif hosted.players == 0 and hosted in self.matches:
+                # Both players left before the end
+                self.matches.remove(hosted)
+            sender.cancel()
+
+    def report(self):
+        return '\n'.join([
+            self.stats.report(),
+            f"  ticks         {self.ticks} ({self.late_ticks} late), "
+            f"{self.skipped_steps} match steps skipped at the deadline",
+            f"  matches       {len(self.matches)} active, {self.matches_started} started, "
+            f"{self.matches_finished} finished, {self.players_refused} players refused",
+        ])
+
+
+async def _synthetic_player(host, port, seconds, seed, results):
+    # Plays match after match for `seconds`: holds random inputs for a few
+    # frames at a time and decodes every state packet, like a real client
+    # minus the rendering
+    rng = np.random.default_rng(seed)
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            results['failed'] += 1
+            return
+        decoder = StateDecoder()
+
+        async def send_inputs():
+            while True:
+                writer.write(bytes((int(rng.integers(0, 128)),)))
+                await asyncio.sleep(8 / 60)
+
+        sender = None
+        try:
+            joined = await read_packet(reader)
+            if joined[0] != JOINED:
+                raise ConnectionError("Unexpected first packet")
+            sender = asyncio.ensure_future(send_inputs())
+            while time.perf_counter() < end:
+                packet = await read_packet(reader)
+                results['bytes'] += len(packet) + 4
+                if packet[0] == 0:
+                    results['keyframes'] += 1
+                if decoder.decode(packet) is not None:
+                    results['frames'] += 1
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # The match is over (or the server went away); join another
+            results['matches'] += 1
+        finally:
+            if sender is not None:
+                sender.cancel()
+            writer.close()
+
+
+def _run_synthetic_players(host, port, count, seconds, seed, queue):
+    results = {'bytes': 0, 'frames': 0, 'keyframes': 0, 'matches': 0, 'failed': 0}
+
+    async def run_all():
+        await asyncio.gather(*(_synthetic_player(host, port, seconds, seed + i, results)
+                               for i in range(count)))
+
+    asyncio.run(run_all())
+    queue.put(results)
+
+
+def load_test(players=400, seconds=10.0, processes=1, tick_rate=60, seed=0):
+    # Runs a server in this process against synthetic players in `processes`
+    # child processes and returns the server's report and the players' totals
+    async def run():
+        server = MatchServer(port=0, tick_rate=tick_rate, seed=seed)
+        await server.start()
+        queue = multiprocessing.Queue()
+        workers = []
+        for worker in range(processes):
+            count = players // processes + (worker < players % processes)
+            process = multiprocessing.Process(
+                target=_run_synthetic_players,
+                args=(server.host, server.port, count, seconds, seed + worker * players, queue))
+            process.start()
+            workers.append(process)
+
+        ticker = asyncio.ensure_future(server.run())
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        results = [await loop.run_in_executor(None, queue.get) for _ in workers]
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        await server.stop()
+        await ticker
+        for process in workers:
+            process.join()
+        totals = {key: sum(result[key] for result in results) for key in results[0]}
+        totals['cpu_percent'] = cpu / elapsed * 100
+        totals['elapsed'] = elapsed
+        return server.report(), totals
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host headless matches for networked players")
+    parser.add_argument('--listen', default=f':{DEFAULT_PORT}', metavar='[HOST]:PORT',
+                        help=f'address to accept players on (default: port {DEFAULT_PORT} on localhost)')
+    parser.add_argument('--tick-rate', type=int, default=60, help='simulation ticks per second')
+    parser.add_argument('--max-matches', type=int, default=1000, help='matches hosted at once')
+    parser.add_argument('--load-test', type=int, metavar='PLAYERS',
+                        help='instead of serving, run against this many local synthetic players')
+    parser.add_argument('--seconds', type=float, default=10.0, help='load test duration')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='processes to spread the synthetic players over')
+    args = parser.parse_args()
+
+    if args.load_test:
+        report, totals = load_test(args.load_test, args.seconds, args.processes, args.tick_rate)
+        frames = max(totals['frames'], 1)
+        print(report)
+        print(f"Players: {args.load_test} over {totals['elapsed']:.1f} s, "
+              f"{totals['matches']} matches played to the end, {totals['failed']} failed to connect")
+        print(f"  received      {totals['frames']} frames, {totals['keyframes']} keyframes, "
+              f"{totals['bytes'] / frames:.0f} bytes per frame, "
+              f"{totals['frames'] / args.load_test / totals['elapsed']:.1f} frames/s per player")
+        print(f"  server CPU    {totals['cpu_percent']:.1f}%")
+        return
+
+    async def serve():
+        host, port = parse_address(args.listen)
+        server = MatchServer(host, port, tick_rate=args.tick_rate, max_matches=args.max_matches)
+        await server.start()
+        print(f"Hosting matches on {host}:{server.port}")
+        try:
+            await server.run()
+        finally:
+            await server.stop()
+            print(server.report())
+
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(serve())
+
+
+if __name__ == '__main__':
+    main()
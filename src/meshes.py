@@ -0,0 +1,465 @@
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+from OpenGL.GL import *
+
+from src import animation, hitboxes, stage as stages
+from src.animation import WING_WAVE
+from src.hitboxes import MELEE_FRAMES
+from src.tracing import traced
+
+# Static fighter, missile and stage geometry, built once as vertex arrays
+# and baked to disk. Quads are split into triangles, so a mesh is one range
+# of GL_TRIANGLES vertices and one of GL_LINES vertices. Each vertex has
+# either a literal color or one of the palette slots below, which each
+# fighter fills with its own shades (see Character.palette).
+BODY = 0
+BICEP = 1
+MUSCLE = 2
+CHEST = 3
+WING = 4
+WING_DETAIL = 5
+WING_BONE = 6
+LITERAL = -1
+
+# Bump when the file layout changes
+CACHE_FORMAT = 1
+# Baked meshes go to <cache dir>/meshes/<source hash>/; by default the cache
+# dir is .asset_cache in the project root
+CACHE_DIR_VARIABLE = 'RETRO_FIGHTER_CACHE'
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                 '.asset_cache')
+
+# Everything the geometry depends on; editing any of these rebakes
+GEOMETRY_SOURCES = (__file__, animation.__file__, hitboxes.__file__, stages.__file__)
+
+# Arms bulge more as a punch goes on, one mesh per punch frame (the resting
+# arm is frame 0); legs are wider while kicking
+ARM_MESHES = tuple(f'arm_{frame}' for frame in range(MELEE_FRAMES))
+LEG_MESH = 'leg'
+KICK_LEG_MESH = 'leg_kick'
+
+
+class MeshBuilder:
+    # Collects meshes in the order they are added. Within a mesh, triangles
+    # and lines each keep the order they were added in.
+    def __init__(self):
+        self.meshes = []
+        self.offset = (0.0, 0.0, 0.0)
+
+    def begin_mesh(self, name):
+        # Triangle and line vertices of the new mesh
+        self.meshes.append((name, [], []))
+        self.offset = (0.0, 0.0, 0.0)
+
+    def translate(self, x, y, z):
+        # Moves the origin for the rest of the current mesh
+        ox, oy, oz = self.offset
+        self.offset = (ox + x, oy + y, oz + z)
+
+    def _add(self, vertices, color, points):
+        if isinstance(color, tuple):
+            slot, rgb = LITERAL, color
+        else:
+            slot, rgb = color, (1.0, 1.0, 1.0)
+        ox, oy, oz = self.offset
+        for x, y, z in points:
+            vertices.append((x + ox, y + oy, z + oz, slot) + rgb)
+
+    def triangles(self, color, *points):
+        self._add(self.meshes[-1][1], color, points)
+
+    def quads(self, color, *points):
+        split = []
+        for i in range(0, len(points), 4):
+            a, b, c, d = points[i:i + 4]
+            split += (a, b, c, a, c, d)
+        self._add(self.meshes[-1][1], color, split)
+
+    def lines(self, color, *points):
+        self._add(self.meshes[-1][2], color, points)
+
+    def arrays(self):
+        rows = []
+        ranges = []
+        for _, triangles, lines in self.meshes:
+            ranges.append((len(rows), len(triangles), len(rows) + len(triangles), len(lines)))
+            rows += triangles
+            rows += lines
+        rows = np.array(rows, dtype=np.float64).reshape(-1, 7)
+        return {
+            'vertices': rows[:, 0:3].astype(np.float32),
+            'slots': rows[:, 3].astype(np.int8),
+            'colors': rows[:, 4:7].astype(np.float32),
+            'ranges': np.array(ranges, dtype=np.int32).reshape(-1, 4),
+            'names': np.array([name for name, _, _ in self.meshes]),
+        }
+
+
+def _cube(b, color, size):
+    h = size / 2
+    b.quads(color,
+            # Front, back, top, bottom, right, left
+            (-h, -h, h), (h, -h, h), (h, h, h), (-h, h, h),
+            (-h, -h, -h), (-h, h, -h), (h, h, -h), (h, -h, -h),
+            (-h, h, -h), (-h, h, h), (h, h, h), (h, h, -h),
+            (-h, -h, -h), (h, -h, -h), (h, -h, h), (-h, -h, h),
+            (h, -h, -h), (h, h, -h), (h, h, h), (h, -h, h),
+            (-h, -h, -h), (-h, -h, h), (-h, h, h), (-h, h, -h))
+
+
+def _limb(b, width, length, is_arm):
+    w = width / 2
+    b.quads(BODY,
+            # Front, back and side faces
+            (-w, 0, w), (w, 0, w), (w, -length, w), (-w, -length, w),
+            (-w, 0, -w), (w, 0, -w), (w, -length, -w), (-w, -length, -w),
+            (-w, 0, -w), (-w, 0, w), (-w, -length, w), (-w, -length, -w),
+            (w, 0, -w), (w, 0, w), (w, -length, w), (w, -length, -w))
+    if is_arm:
+        # Forearm muscle bulge
+        b.triangles(MUSCLE,
+                    (-width / 3, -length * 0.3, w + 0.05), (width / 3, -length * 0.3, w + 0.05),
+                    (0, -length * 0.6, w + 0.08))
+    else:
+        # Calf muscle at the back, then the side bulges
+        b.triangles(MUSCLE,
+                    (-w, -length * 0.3, -w - 0.05), (w, -length * 0.3, -w - 0.05),
+                    (0, -length * 0.6, -w - 0.1),
+                    (-w - 0.05, -length * 0.3, 0), (-w - 0.05, -length * 0.6, 0),
+                    (-w, -length * 0.45, 0),
+                    (w + 0.05, -length * 0.3, 0), (w + 0.05, -length * 0.6, 0),
+                    (w, -length * 0.45, 0))
+
+
+def _torso(b):
+    _cube(b, BODY, 0.8)
+    # Chest muscles, slightly forward of the torso
+    b.translate(0, 0.2, 0.41)
+    b.triangles(CHEST,
+                (-0.3, 0.2, 0), (-0.1, 0, 0), (-0.3, -0.1, 0),
+                (0.3, 0.2, 0), (0.1, 0, 0), (0.3, -0.1, 0))
+
+
+def _skull(b):
+    # Relative to the head; the jaw, flames and horns are separate
+    _cube(b, (0.95, 0.95, 0.95), 0.45)
+    # Eye sockets, each with a black inner layer for depth
+    b.quads((0.1, 0.1, 0.1),
+            (-0.15, 0.1, 0.23), (-0.05, 0.1, 0.23), (-0.05, -0.05, 0.23), (-0.15, -0.05, 0.23))
+    b.quads((0.0, 0.0, 0.0),
+            (-0.14, 0.09, 0.231), (-0.06, 0.09, 0.231), (-0.06, -0.04, 0.231), (-0.14, -0.04, 0.231))
+    b.quads((0.1, 0.1, 0.1),
+            (0.15, 0.1, 0.23), (0.05, 0.1, 0.23), (0.05, -0.05, 0.23), (0.15, -0.05, 0.23))
+    b.quads((0.0, 0.0, 0.0),
+            (0.14, 0.09, 0.231), (0.06, 0.09, 0.231), (0.06, -0.04, 0.231), (0.14, -0.04, 0.231))
+    # Nasal cavity and bridge
+    b.triangles((0.0, 0.0, 0.0),
+                (-0.03, -0.1, 0.23), (0.03, -0.1, 0.23), (0, -0.15, 0.23),
+                (-0.02, -0.05, 0.23), (0.02, -0.05, 0.23), (0, -0.1, 0.23))
+    # Upper teeth
+    for i in range(4):
+        x = -0.15 + i * 0.1
+        b.quads((1.0, 1.0, 1.0),
+                (x, -0.2, 0.231), (x + 0.08, -0.2, 0.231), (x + 0.08, -0.15, 0.231), (x, -0.15, 0.231))
+    # Suture lines
+    b.lines((0.8, 0.8, 0.8),
+            (-0.22, 0.1, 0.23), (0.22, 0.1, 0.23),
+            (0, -0.1, 0.23), (0, 0.22, 0.23))
+
+
+def _jaw(b):
+    # Relative to the jaw pivot
+    b.quads((0.9, 0.9, 0.9),
+            (-0.2, 0, 0.23), (0.2, 0, 0.23), (0.2, -0.15, 0.23), (-0.2, -0.15, 0.23),
+            (-0.2, -0.15, 0.23), (0.2, -0.15, 0.23), (0.15, -0.15, 0), (-0.15, -0.15, 0))
+    for i in range(4):
+        x = -0.15 + i * 0.1
+        b.quads((1.0, 1.0, 1.0),
+                (x, 0, 0.231), (x + 0.08, 0, 0.231), (x + 0.08, 0.05, 0.231), (x, 0.05, 0.231))
+
+
+def _horns(b):
+    b.triangles((0.2, 0.2, 0.2),
+                (-0.2, 0.3, 0), (-0.4, 0.9, 0), (-0.1, 0.3, 0),
+                (0.2, 0.3, 0), (0.4, 0.9, 0), (0.1, 0.3, 0))
+
+
+def _wing(b, side):
+    # Relative to the wing root; side is -1 for the left wing, 1 for the right
+    for i in range(len(WING_WAVE)):
+        wave = WING_WAVE[i]
+        # Membrane, then a darker detail layer
+        b.triangles(WING,
+                    (0, 0, 0),
+                    (side * (1.0 + i * 0.5), 0.4 + wave * 0.3, -0.6 - i * 0.3),
+                    (side * (0.8 + i * 0.5), -0.4 + wave * 0.3, -0.5 - i * 0.3))
+        b.triangles(WING_DETAIL,
+                    (side * (0.2 + i * 0.4), 0.1 + wave * 0.2, -0.2 - i * 0.2),
+                    (side * (0.7 + i * 0.5), 0.3 + wave * 0.2, -0.5 - i * 0.3),
+                    (side * (0.6 + i * 0.5), -0.3 + wave * 0.2, -0.4 - i * 0.3))
+        # Main bone, then the veins
+        bones = [(0, 0, 0), (side * (1.2 + i * 0.5), wave * 0.3, -0.7 - i * 0.3)]
+        for j in range(3):
+            t = j / 2.0
+            bones.append((side * (0.3 + i * 0.4 * t), 0.2 * t, -0.2 - i * 0.2 * t))
+            bones.append((side * (0.8 + i * 0.5 * t), -0.2 + wave * 0.3, -0.5 - i * 0.3 * t))
+        b.lines(WING_BONE, *bones)
+
+
+def _arm(b, frame):
+    # Relative to the shoulder; the bicep flexes during a punch
+    size = 0.3 + 0.1 * (frame / 10)
+    b.translate(0, -0.2, 0)
+    b.triangles(BICEP,
+                (-size, 0, size), (size, 0, size), (0, size * 1.5, size * 0.8),
+                (-size, 0, -size), (size, 0, -size), (0, size * 1.5, -size * 0.8),
+                (-size, 0, -size), (-size, 0, size), (0, size * 1.5, 0),
+                (size, 0, -size), (size, 0, size), (0, size * 1.5, 0))
+    b.triangles(MUSCLE,
+                (-0.2, 0, -0.2), (0.2, 0, -0.2), (0, -0.2 * 1.2, -0.2 * 1.2))
+    b.translate(0, 0.2, 0)
+    _limb(b, 0.2, 0.6, True)
+
+
+def _projectile(b):
+    size = 0.1
+    length = 0.4
+    # Body
+    b.quads((0.8, 0.8, 0.8),
+            (-length, -size, size), (length, -size, size), (length, size, size), (-length, size, size),
+            (-length, -size, -size), (-length, size, -size), (length, size, -size), (length, -size, -size),
+            (-length, size, -size), (-length, size, size), (length, size, size), (length, size, -size),
+            (-length, -size, -size), (length, -size, -size), (length, -size, size), (-length, -size, size))
+    # Nose cone
+    tip = (length, 0, 0)
+    base = length - 0.2
+    b.triangles((1.0, 0.0, 0.0),
+                tip, (base, size, size), (base, -size, size),
+                tip, (base, -size, -size), (base, size, -size),
+                tip, (base, size, size), (base, size, -size),
+                tip, (base, -size, -size), (base, -size, size))
+    # Fins: top, bottom and sides
+    fin = 0.2
+    b.triangles((0.7, 0.7, 0.7),
+                (-length, size, 0), (-length + 0.2, size + fin, 0), (-length + 0.4, size, 0),
+                (-length, -size, 0), (-length + 0.2, -size - fin, 0), (-length + 0.4, -size, 0),
+                (-length, 0, size), (-length + 0.2, 0, size + fin), (-length + 0.4, 0, size),
+                (-length, 0, -size), (-length + 0.2, 0, -size - fin), (-length + 0.4, 0, -size))
+
+
+def _stage(b, stage):
+    # Every collider as a box, cut off where the view ends. Faces away from
+    # the light are darker, as nothing here has normals.
+    view_min, view_max = stages.VIEW_X
+    for collider in stage.colliders:
+        min_x, min_y, min_z, max_x, max_y, max_z = collider.box
+        min_x, max_x = max(min_x, view_min), min(max_x, view_max)
+        if min_x >= max_x:
+            continue
+        top = collider.color
+        front = tuple(c * 0.8 for c in top)
+        side = tuple(c * 0.65 for c in top)
+        back = tuple(c * 0.5 for c in top)
+        b.quads(top, (min_x, max_y, min_z), (min_x, max_y, max_z), (max_x, max_y, max_z), (max_x, max_y, min_z))
+        b.quads(front, (min_x, min_y, max_z), (max_x, min_y, max_z), (max_x, max_y, max_z), (min_x, max_y, max_z))
+        b.quads(side,
+                (min_x, min_y, min_z), (min_x, min_y, max_z), (min_x, max_y, max_z), (min_x, max_y, min_z),
+                (max_x, min_y, min_z), (max_x, max_y, min_z), (max_x, max_y, max_z), (max_x, min_y, max_z))
+        b.quads(back,
+                (min_x, min_y, min_z), (min_x, max_y, min_z), (max_x, max_y, min_z), (max_x, min_y, min_z),
+                (min_x, min_y, min_z), (max_x, min_y, min_z), (max_x, min_y, max_z), (min_x, min_y, max_z))
+
+
+def build_meshes():
+    # Generates every mesh; returns the arrays that get baked
+    b = MeshBuilder()
+    b.begin_mesh('torso')
+    _torso(b)
+    b.begin_mesh('skull')
+    _skull(b)
+    b.begin_mesh('jaw')
+    _jaw(b)
+    b.begin_mesh('horns')
+    _horns(b)
+    b.begin_mesh('left_wing')
+    _wing(b, -1)
+    b.begin_mesh('right_wing')
+    _wing(b, 1)
+    for frame, name in enumerate(ARM_MESHES):
+        b.begin_mesh(name)
+        _arm(b, frame)
+    b.begin_mesh(LEG_MESH)
+    _limb(b, 0.25, 0.8, False)
+    b.begin_mesh(KICK_LEG_MESH)
+    _limb(b, 0.25 * 1.2, 0.8, False)
+    b.begin_mesh('projectile')
+    _projectile(b)
+    for name in stages.STAGES:
+        stage = stages.get_stage(name)
+        b.begin_mesh(stage.mesh)
+        _stage(b, stage)
+    return b.arrays()
+
+
+def source_hash():
+    # Key of the baked files: the geometry code and the format version
+    digest = hashlib.sha256(str(CACHE_FORMAT).encode())
+    for path in GEOMETRY_SOURCES:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def cache_path(cache_dir=None):
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_VARIABLE) or DEFAULT_CACHE_DIR
+    return os.path.join(cache_dir, 'meshes', source_hash())
+
+
+@traced('bake meshes')
+def bake(cache_dir=None):
+    # Writes the meshes to the cache unless they are already there; returns
+    # the directory. Bakes from older geometry are removed.
+    path = cache_path(cache_dir)
+    if os.path.isdir(path):
+        return path
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    # Written next to the final directory and renamed into place, so a
+    # half-written bake is never loaded
+    staging = tempfile.mkdtemp(dir=parent)
+    for name, values in build_meshes().items():
+        np.save(os.path.join(staging, name + '.npy'), values)
+    try:
+        os.rename(staging, path)
+    except OSError:
+        # Another process baked it first
+        shutil.rmtree(staging)
+    for entry in os.listdir(parent):
+        stale = os.path.join(parent, entry)
+        if stale != path and os.path.isdir(stale) and not entry.startswith('tmp'):
+            shutil.rmtree(stale, ignore_errors=True)
+    return path
+
+
+@traced('load meshes')
+def load_arrays(cache_dir=None):
+    # The baked arrays, memory-mapped; built in memory if the cache cannot
+    # be written
+    try:
+        path = bake(cache_dir)
+    except OSError:
+        return build_meshes()
+    arrays = {}
+    for name in ('vertices', 'slots', 'colors', 'ranges'):
+        arrays[name] = np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+    arrays['names'] = np.load(os.path.join(path, 'names.npy'))
+    return arrays
+
+
+class MeshLibrary:
+    # All meshes share one vertex buffer, uploaded straight from the mapped
+    # file on first use, and each palette gets a color buffer. bind() a
+    # palette once, then draw() any number of meshes with one or two
+    # glDrawArrays calls each, then unbind().
+    def __init__(self, arrays):
+        self.vertices = arrays['vertices']
+        self.slots = arrays['slots']
+        self.colors = arrays['colors']
+        self.ranges = {str(name): tuple(ranges)
+                       for name, ranges in zip(arrays['names'].tolist(), arrays['ranges'].tolist())}
+        self.vertex_buffer = None
+        self.color_buffers = {}
+
+    def palette_colors(self, palette):
+        # Per-vertex colors with the palette slots filled in
+        colors = np.array(self.colors)
+        slotted = self.slots >= 0
+        if palette:
+            colors[slotted] = np.asarray(palette, dtype=np.float32)[self.slots[slotted]]
+        return colors
+
+    def _upload(self, data):
+        buffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, buffer)
+        glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STATIC_DRAW)
+        return buffer
+
+    def bind(self, palette=()):
+        if self.vertex_buffer is None:
+            self.vertex_buffer = self._upload(self.vertices)
+        color_buffer = self.color_buffers.get(palette)
+        if color_buffer is None:
+            color_buffer = self._upload(self.palette_colors(palette))
+            self.color_buffers[palette] = color_buffer
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+        glVertexPointer(3, GL_FLOAT, 0, None)
+        glBindBuffer(GL_ARRAY_BUFFER, color_buffer)
+        glColorPointer(3, GL_FLOAT, 0, None)
+
+    def unbind(self):
+        # Other draw code uses client-side arrays, which need no buffer bound
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def draw(self, name):
+        first, count, line_first, line_count = self.ranges[name]
+        if count:
+            glDrawArrays(GL_TRIANGLES, first, count)
+        if line_count:
+            glDrawArrays(GL_LINES, line_first, line_count)
+
+
+_library = None
+_loader = None
+_loaded_arrays = None
+
+
+def _load_in_background():
+    global _loaded_arrays
+    _loaded_arrays = load_arrays()
+
+
+def preload():
+    # Starts loading the meshes (baking them first if needed) on a
+    # background thread, leaving get_meshes() only the GL upload
+    global _loader
+    if _library is None and _loader is None:
+        _loader = threading.Thread(target=_load_in_background, name='asset-loader', daemon=True)
+        _loader.start()
+
+
+def get_meshes():
+    # The process-wide mesh library, loaded on first use
+    global _library, _loader
+    if _library is None:
+        arrays = None
+        if _loader is not None:
+            _loader.join()
+            _loader = None
+            arrays = _loaded_arrays
+        # Loaded here if nothing preloaded them or the loader failed
+        _library = MeshLibrary(arrays if arrays is not None else load_arrays())
+    return _library
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bake fighter, missile and stage meshes to the asset cache")
+    parser.add_argument('--cache-dir', help=f'cache directory (default: ${CACHE_DIR_VARIABLE} or .asset_cache)')
+    args = parser.parse_args()
+    path = bake(args.cache_dir)
+    arrays = load_arrays(args.cache_dir)
+    print(f"Meshes baked to {path}: {len(arrays['names'])} meshes, "
+          f"{len(arrays['vertices'])} vertices")
+
+
+if __name__ == '__main__':
+    main()
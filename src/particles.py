@@ -0,0 +1,118 @@
+import numpy as np
+from OpenGL.GL import *
+
+
+class ParticleSystem:
+    # A fixed-capacity pool of particles stored in preallocated numpy arrays.
+    # Particles used to be one dict each, created and thrown away every
+    # frame; here emitting and updating only writes into existing arrays.
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self.position = np.zeros((capacity, 3))
+        self.velocity = np.zeros((capacity, 3))
+        self.color = np.zeros((capacity, 3))
+        self.size = np.zeros(capacity)
+        self.life = np.zeros(capacity)
+        # Scratch space for building vertex arrays at draw time
+        self._vertices = np.zeros((capacity * 4, 3), dtype=np.float32)
+        self._colors = np.zeros((capacity * 4, 3), dtype=np.float32)
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+    def copy_from(self, other):
+        # Makes this pool hold the same particles as other, whose capacity
+        # must not be larger
+        n = other.count
+        for mine, theirs in ((self.position, other.position), (self.velocity, other.velocity),
+                             (self.color, other.color), (self.size, other.size),
+                             (self.life, other.life)):
+            mine[:n] = theirs[:n]
+        self.count = n
+
+    def emit(self, count):
+        # Reserves up to `count` slots and returns their slice so the caller
+        # can fill them in. Particles past capacity are dropped.
+        start = self.count
+        end = min(start + count, self.capacity)
+        self.count = end
+        return slice(start, end)
+
+    def advance(self, gravity=0.0, shrink=1.0, stage=None):
+        # With a stage, particles that would move into its solids and
+        # platforms stop where they are
+        n = self.count
+        if n == 0:
+            return
+        position = self.position[:n]
+        velocity = self.velocity[:n]
+        if stage is not None:
+            velocity[stage.blocks(position + velocity)] = 0.0
+        position += velocity
+        if gravity:
+            velocity[:, 1] -= gravity
+        if shrink != 1.0:
+            self.size[:n] *= shrink
+        self.life[:n] -= 1
+
+    def remove_dead(self):
+        # Keeps the live particles packed at the front of the arrays
+        n = self.count
+        alive = self.life[:n] > 0
+        live = int(np.count_nonzero(alive))
+        if live == n:
+            return
+        for array in (self.position, self.velocity, self.color, self.size, self.life):
+            array[:live] = array[:n][alive]
+        self.count = live
+
+    def visible_mask(self, frustum, radius_scale=1.5):
+        n = self.count
+        if frustum is None:
+            return np.ones(n, dtype=bool)
+        return frustum.spheres_visible(self.position[:n], self.size[:n] * radius_scale)
+
+    def draw(self, shape, mask=None, color_scale=None):
+        # Draws the particles as camera-facing triangles or quads in one
+        # glDrawArrays call. color_scale multiplies each particle's color
+        # (used for fading out with remaining life).
+        n = self.count
+        if n == 0:
+            return
+        position = self.position[:n]
+        size = self.size[:n]
+        color = self.color[:n]
+        if color_scale is not None:
+            color = color * color_scale[:, None]
+        if mask is not None:
+            position = position[mask]
+            size = size[mask]
+            color = color[mask]
+            n = len(position)
+            if n == 0:
+                return
+
+        if shape == GL_TRIANGLES:
+            corners = ((-1, -1), (1, -1), (0, 1))
+        else:
+            corners = ((-1, -1), (1, -1), (1, 1), (-1, 1))
+        per_particle = len(corners)
+        vertices = self._vertices[:n * per_particle].reshape(n, per_particle, 3)
+        colors = self._colors[:n * per_particle].reshape(n, per_particle, 3)
+        for i, (cx, cy) in enumerate(corners):
+            vertices[:, i, 0] = position[:, 0] + cx * size
+            vertices[:, i, 1] = position[:, 1] + cy * size
+            vertices[:, i, 2] = position[:, 2]
+            colors[:, i] = color
+
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_COLOR_ARRAY)
+        glVertexPointer(3, GL_FLOAT, 0, self._vertices)
+        glColorPointer(3, GL_FLOAT, 0, self._colors)
+        glDrawArrays(shape, 0, n * per_particle)
+        glDisableClientState(GL_COLOR_ARRAY)
+        glDisableClientState(GL_VERTEX_ARRAY)
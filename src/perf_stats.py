@@ -0,0 +1,166 @@
+import time
+
+import numpy as np
+
+# Frame budget at 60 FPS
+FRAME_BUDGET_MS = 1000.0 / 60
+
+# Columns of the per-frame history
+FRAME_MS = 0     # Time spent on the frame's work (events, update, draw)
+GC_MS = 1        # Time spent inside garbage collections during the frame
+GC_COUNT = 2     # Number of collections during the frame
+GC_OLDEST = 3    # Oldest generation collected during the frame, -1 for none
+INTERVAL_MS = 4  # Time from the previous frame's release by the pacer to this one's
+MISSED = 5       # 1 if the frame reached the pacer after its deadline
+LATENCY_MS = 6   # From reading the inputs shown in the frame to its buffer flip, 0 if none
+CULLED = 7       # Objects skipped by frustum culling when the frame was drawn
+STAT_COUNT = 8
+
+
+class FrameStats:
+    # Timing for the last `history` frames. The game loop brackets each
+    # frame with begin_frame()/end_frame(); anything else that costs time
+    # inside a frame (garbage collections, for now) reports it with
+    # add_gc_pause() so slow frames can be traced to their cause. A
+    # FramePacer adds how evenly the frames went out with add_pacing(), and
+    # the game adds how long its inputs took to reach the screen with
+    # add_latency() and how many objects it culled with add_culled().
+    def __init__(self, history=600, budget_ms=FRAME_BUDGET_MS):
+        self.history = history
+        self.budget_ms = budget_ms
+        self.frames = np.zeros((history, STAT_COUNT))
+        self.frame_count = 0
+        self._row = self.frames[0]
+        self._row[GC_OLDEST] = -1
+        self._frame_start = None
+        # Collections that happen between frames (for example the explicit
+        # ones at round end or on the pause screen)
+        self.idle_gc_ms = 0.0
+        self.idle_gc_count = 0
+        # Set by a FramePacer reporting here
+        self.target_rate = None
+        # Set once the game reports culling
+        self.culling = False
+
+    def begin_frame(self):
+        self._row = self.frames[self.frame_count % self.history]
+        self._row[:] = 0
+        self._row[GC_OLDEST] = -1
+        self._frame_start = time.perf_counter()
+
+    def end_frame(self):
+        self._row[FRAME_MS] = (time.perf_counter() - self._frame_start) * 1000
+        self._frame_start = None
+        self.frame_count += 1
+
+    def add_gc_pause(self, generation, duration_ms):
+        if self._frame_start is None:
+            self.idle_gc_ms += duration_ms
+            self.idle_gc_count += 1
+            return
+        row = self._row
+        row[GC_MS] += duration_ms
+        row[GC_COUNT] += 1
+        row[GC_OLDEST] = max(row[GC_OLDEST], generation)
+
+    def add_pacing(self, interval_ms, missed):
+        # For the frame that just ended
+        self._row[INTERVAL_MS] = interval_ms
+        self._row[MISSED] = missed
+
+    def add_latency(self, latency_ms):
+        # For the frame that just ended
+        self._row[LATENCY_MS] = latency_ms
+
+    def add_culled(self, count):
+        # For the frame being drawn
+        self._row[CULLED] = count
+        self.culling = True
+
+    def frame_ms(self, index):
+        # Duration of frame number `index` (counting from 0), or None if it
+        # is still running or has fallen out of the history
+        if not self.frame_count - self.history <= index < self.frame_count:
+            return None
+        return float(self.frames[index % self.history, FRAME_MS])
+
+    def recorded_frames(self):
+        # The history rows in use, oldest first
+        n = min(self.frame_count, self.history)
+        if self.frame_count <= self.history:
+            return self.frames[:n]
+        start = self.frame_count % self.history
+        return np.concatenate((self.frames[start:], self.frames[:start]))
+
+    def summary(self):
+        frames = self.recorded_frames()
+        if len(frames) == 0:
+            return {'frames': 0}
+        frame_ms = frames[:, FRAME_MS]
+        gc_ms = frames[:, GC_MS]
+        collected = frames[:, GC_COUNT] > 0
+        result = {
+            'frames': len(frames),
+            'frame_ms_mean': float(frame_ms.mean()),
+            'frame_ms_p99': float(np.percentile(frame_ms, 99)),
+            'frame_ms_max': float(frame_ms.max()),
+            'over_budget': int(np.count_nonzero(frame_ms > self.budget_ms)),
+            'gc_collections': int(frames[:, GC_COUNT].sum()),
+            'gc_full_collections': int(np.count_nonzero(frames[:, GC_OLDEST] == 2)),
+            'gc_ms_total': float(gc_ms.sum()),
+            'gc_ms_max': float(gc_ms.max()),
+            # Slow frames that had a collection in them
+            'over_budget_with_gc': int(np.count_nonzero(collected & (frame_ms > self.budget_ms))),
+            'idle_gc_count': self.idle_gc_count,
+            'idle_gc_ms': self.idle_gc_ms,
+        }
+        if self.target_rate is not None:
+            # The first paced frame has no interval
+            intervals = frames[frames[:, INTERVAL_MS] > 0, INTERVAL_MS]
+            result.update({
+                'target_rate': self.target_rate,
+                'interval_ms_mean': float(intervals.mean()) if len(intervals) else 0.0,
+                'interval_ms_stddev': float(intervals.std()) if len(intervals) else 0.0,
+                'interval_ms_max': float(intervals.max()) if len(intervals) else 0.0,
+                'missed_deadlines': int(frames[:, MISSED].sum()),
+            })
+        if self.culling:
+            result.update({
+                'culled_mean': float(frames[:, CULLED].mean()),
+                'culled_max': int(frames[:, CULLED].max()),
+            })
+        latency = frames[frames[:, LATENCY_MS] > 0, LATENCY_MS]
+        if len(latency):
+            result.update({
+                'latency_ms_mean': float(latency.mean()),
+                'latency_ms_max': float(latency.max()),
+            })
+        return result
+
+    def report(self):
+        stats = self.summary()
+        if stats['frames'] == 0:
+            return "No frames recorded"
+        lines = [
+            f"Frame timing over the last {stats['frames']} frames:",
+            f"  frame time    mean {stats['frame_ms_mean']:.2f} ms, p99 {stats['frame_ms_p99']:.2f} ms, "
+            f"max {stats['frame_ms_max']:.2f} ms",
+            f"  over budget   {stats['over_budget']} frames > {self.budget_ms:.1f} ms "
+            f"({stats['over_budget_with_gc']} with a GC pause)",
+            f"  gc in frames  {stats['gc_collections']} collections ({stats['gc_full_collections']} full), "
+            f"{stats['gc_ms_total']:.2f} ms total, worst frame {stats['gc_ms_max']:.2f} ms",
+            f"  gc idle       {stats['idle_gc_count']} collections, {stats['idle_gc_ms']:.2f} ms",
+        ]
+        if 'target_rate' in stats:
+            lines.append(
+                f"  pacing        {stats['target_rate']:g} FPS target, interval mean "
+                f"{stats['interval_ms_mean']:.2f} ms, stddev {stats['interval_ms_stddev']:.3f} ms, "
+                f"max {stats['interval_ms_max']:.2f} ms, {stats['missed_deadlines']} missed deadlines")
+        if 'culled_mean' in stats:
+            lines.append(f"  culled        mean {stats['culled_mean']:.1f} objects per frame, "
+                         f"max {stats['culled_max']}")
+        if 'latency_ms_mean' in stats:
+            lines.append(
+                f"  latency       input to display mean {stats['latency_ms_mean']:.2f} ms, "
+                f"max {stats['latency_ms_max']:.2f} ms")
+        return '\n'.join(lines)
@@ -0,0 +1,153 @@
+import queue
+import threading
+import time
+
+from src.match import Match
+from src.particles import ParticleSystem
+from src.snapshot import new_state, pack_match, unpack_match
+
+# Snapshots in flight: one being drawn, the newest finished one and one
+# being written
+BUFFER_COUNT = 3
+
+
+class FrameSnapshot:
+    # One simulated frame as the renderer needs it: the packed match state
+    # (see src/snapshot.py), both fighters' particles and the missile
+    # blasts, which the packed state leaves out, and when the frame's inputs
+    # were read. Filled in by the simulation thread, then only read until
+    # the buffer recycles it.
+    def __init__(self, match):
+        self.state = new_state()
+        self.particles = [(ParticleSystem(fighter.explosion_particles.capacity),
+                           ParticleSystem(fighter.fire_breath_particles.capacity))
+                          for fighter in match.players]
+        self.blast_particles = ParticleSystem(match.blast_particles.capacity)
+        self.input_ns = None
+        self.shown = False
+
+    def capture(self, match, input_ns):
+        pack_match(match, self.state)
+        for (explosion, fire), fighter in zip(self.particles, match.players):
+            explosion.copy_from(fighter.explosion_particles)
+            fire.copy_from(fighter.fire_breath_particles)
+        self.blast_particles.copy_from(match.blast_particles)
+        self.input_ns = input_ns
+        self.shown = False
+
+    def show(self, view):
+        # Puts view into this frame's state for drawing. The view's fighters
+        # are handed this snapshot's particle pools rather than copies.
+        unpack_match(view, self.state, clear_effects=False)
+        for (explosion, fire), fighter in zip(self.particles, view.players):
+            fighter.explosion_particles = explosion
+            fighter.fire_breath_particles = fire
+        view.blast_particles = self.blast_particles
+
+
+class FrameBuffer:
+    # Triple buffering between one writer and one reader. The writer always
+    # has a spare snapshot to fill and never waits for the reader; the reader
+    # takes the newest finished snapshot, and the one it holds is never
+    # written to.
+    def __init__(self, snapshots):
+        self._lock = threading.Lock()
+        self.back, self.ready, self.front = snapshots
+        # Whether ready holds a frame the reader has not taken yet
+        self.fresh = False
+
+    def publish(self):
+        # Writer: back has been filled in and becomes the newest frame
+        with self._lock:
+            self.back, self.ready = self.ready, self.back
+            self.fresh = True
+
+    def latest(self):
+        # Reader: the newest finished frame
+        with self._lock:
+            if self.fresh:
+                self.front, self.ready = self.ready, self.front
+                self.fresh = False
+            return self.front
+
+
+class SimulationPipeline:
+    # Runs a live game's simulation on its own thread so that stepping frame
+    # N + 1 overlaps with drawing frame N. The main thread reads the inputs
+    # and submit()s them; the simulation thread applies them, steps the
+    # match (see FightingGame.take_inputs and simulate) and publishes a
+    # snapshot, and the main thread draws the newest snapshot through a
+    # separate view match instead of the live one. Work that releases the
+    # GIL, numpy's particle updates and the GL driver, can then run side by
+    # side, at the cost of showing each frame's inputs one frame later.
+    #
+    # At most one frame waits to be simulated; submit() blocks beyond that,
+    # so the simulation never falls more than a frame behind. Anything else
+    # that touches the live match (the instant replay, saving on exit) first
+    # calls drain() to let the simulation thread go idle.
+    def __init__(self, game):
+        self.game = game
+        self.view = Match(tick_rate=game.tick_rate.hz, stage=game.stage.name)
+        self.view.simulate_effects = False
+        snapshots = [FrameSnapshot(game) for _ in range(BUFFER_COUNT)]
+        self.buffer = FrameBuffer(snapshots)
+        self.buffer.front.capture(game, None)
+        self.inputs = queue.Queue(maxsize=1)
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='simulation', daemon=True)
+        self.thread.start()
+
+    def submit(self, inputs1, inputs2):
+        # inputs2 is None when the AI chooses player 2's inputs
+        self.inputs.put((inputs1, inputs2, time.perf_counter_ns()))
+
+    def drain(self):
+        self.inputs.join()
+
+    def stop(self):
+        # Finishes the frames already submitted, then ends the thread. An
+        # error on the simulation thread is raised again here.
+        if self.thread is not None:
+            self.inputs.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            raise self.error
+
+    def show_latest(self):
+        # The view match in the newest simulated frame, and when that frame's
+        # inputs were read if it has not been shown before (None otherwise)
+        snapshot = self.buffer.latest()
+        if snapshot.shown:
+            return self.view, None
+        snapshot.shown = True
+        snapshot.show(self.view)
+        return self.view, snapshot.input_ns
+
+    def _run(self):
+        game = self.game
+        buffer = self.buffer
+        tracer = game.tracer
+        while True:
+            item = self.inputs.get()
+            try:
+                if item is None:
+                    return
+                # Frames read before the match ended or the game quit
+                if self.error is not None or not game.running:
+                    continue
+                inputs1, inputs2, input_ns = item
+                with tracer.span('simulate'):
+                    game.take_inputs(inputs1, inputs2)
+                    game.simulate()
+                    buffer.back.capture(game, input_ns)
+                buffer.publish()
+            except Exception as e:
+                # Ends the game; the main thread raises it from stop()
+                self.error = e
+                game.running = False
+            finally:
+                self.inputs.task_done()
@@ -0,0 +1,59 @@
+import numpy as np
+
+from src.tick_rate import BASE_RATE
+from src.stage import DEFAULT_STAGE
+
+
+class MatchRecording:
+    # A match is fully described by its random seed and the input bits both
+    # players held on each frame (see the INPUT_* flags in src/match.py), so
+    # recordings stay tiny: two bytes per frame. Lockstep matches also
+    # record the checksum of the state after each frame (see
+    # src/lockstep.py), which a replay must reproduce exactly. The tick rate
+    # and stage the match ran on are kept too, as the inputs are only good
+    # for those.
+    def __init__(self, seed=0, inputs=None, checksums=None, tick_rate=BASE_RATE, stage=DEFAULT_STAGE):
+        self.seed = seed
+        self.tick_rate = tick_rate
+        self.stage = stage
+        self.inputs = bytearray(inputs or b'')
+        self.checksums = checksums
+
+    @property
+    def lockstep(self):
+        return self.checksums is not None
+
+    def record(self, inputs1, inputs2):
+        self.inputs.append(inputs1)
+        self.inputs.append(inputs2)
+
+    def __len__(self):
+        return len(self.inputs) // 2
+
+    def frame_inputs(self, frame):
+        return self.inputs[frame * 2], self.inputs[frame * 2 + 1]
+
+    def __iter__(self):
+        inputs = self.inputs
+        for i in range(0, len(inputs), 2):
+            yield inputs[i], inputs[i + 1]
+
+    def save(self, path):
+        arrays = {}
+        if self.checksums is not None:
+            arrays['checksums'] = np.asarray(self.checksums, dtype=np.uint32)
+        with open(path, 'wb') as f:
+            np.savez(f, seed=np.int64(self.seed), tick_rate=np.int64(self.tick_rate),
+                     stage=np.str_(self.stage),
+                     inputs=np.frombuffer(bytes(self.inputs), dtype=np.uint8).reshape(-1, 2),
+                     **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            checksums = data['checksums'].tolist() if 'checksums' in data.files else None
+            # Recordings from before tick rates were kept ran at the base rate
+            tick_rate = int(data['tick_rate']) if 'tick_rate' in data.files else BASE_RATE
+            # Recordings from before stages were kept are on the flat one
+            stage = str(data['stage']) if 'stage' in data.files else DEFAULT_STAGE
+            return cls(int(data['seed']), data['inputs'].tobytes(), checksums, tick_rate, stage)
@@ -0,0 +1,114 @@
+from operator import itemgetter
+
+from OpenGL.GL import *
+
+from src.tracing import NULL_TRACER
+
+# Render passes, flushed in this order
+PASS_LIT = 0        # 3D geometry with lighting
+PASS_PARTICLES = 1  # 3D effects drawn without lighting
+PASS_HUD = 2        # 2D overlay in an orthographic projection
+
+_sort_key = itemgetter(0, 1)
+
+
+class RenderQueue:
+    # Draw routines submit items instead of drawing straight away. Each item
+    # is tagged with a pass, a material (a flat color, or None when the draw
+    # function sets its own colors) and a transform (a translation from the
+    # pass origin, or None to draw at the origin). flush() sorts the items so
+    # that each pass and each material is set up only once per frame. With a
+    # tracer, every draw function call is a span named after the function.
+    def __init__(self, tracer=None):
+        self.items = []
+        self.tracer = tracer or NULL_TRACER
+        self.state_changes = 0  # GL state transitions issued by the last flush
+
+    def submit(self, render_pass, material, transform, draw_fn, *args):
+        self.items.append((render_pass, material or (), material, transform, draw_fn, args))
+
+    def flush(self):
+        items = self.items
+        if not items:
+            return
+        # Stable sort: items with the same pass and material keep their
+        # submission order, so overlapping 2D elements still layer correctly
+        items.sort(key=_sort_key)
+
+        camera = glGetFloatv(GL_MODELVIEW_MATRIX)
+        origin = camera
+        current_pass = None
+        current_material = None
+        current_transform = None
+        changes = 0
+        tracer = self.tracer
+
+        for render_pass, _, material, transform, draw_fn, args in items:
+            if render_pass != current_pass:
+                self._enter_pass(render_pass, current_pass)
+                current_pass = render_pass
+                origin = None if render_pass == PASS_HUD else camera
+                current_material = None
+                current_transform = False  # Force a matrix reload
+                changes += 1
+
+            if material is not None and material != current_material:
+                glColor3f(*material)
+                current_material = material
+                changes += 1
+
+            # Load the pass origin and translate, instead of a push/pop
+            # pair around every item
+            if transform != current_transform:
+                if origin is None:
+                    glLoadIdentity()
+                else:
+                    glLoadMatrixf(origin)
+                if transform is not None:
+                    glTranslatef(*transform)
+                current_transform = transform
+                changes += 1
+
+            if tracer.enabled:
+                with tracer.span(draw_fn.__qualname__):
+                    draw_fn(*args)
+            else:
+                draw_fn(*args)
+
+            if material is None:
+                # The item picked its own colors, so the current color is unknown
+                current_material = None
+            if transform is not None:
+                # Draw functions may rotate or scale on top of the translation
+                current_transform = False
+
+        self._leave_pass(current_pass, camera)
+        self.state_changes = changes
+        items.clear()
+
+    def _enter_pass(self, render_pass, previous_pass):
+        if render_pass == PASS_LIT:
+            glEnable(GL_LIGHTING)
+            glEnable(GL_DEPTH_TEST)
+        elif render_pass == PASS_PARTICLES:
+            glDisable(GL_LIGHTING)
+            glEnable(GL_DEPTH_TEST)
+        elif render_pass == PASS_HUD:
+            # One orthographic setup for the whole overlay
+            glDisable(GL_LIGHTING)
+            glDisable(GL_DEPTH_TEST)
+            glMatrixMode(GL_PROJECTION)
+            glPushMatrix()
+            glLoadIdentity()
+            glOrtho(-1, 1, -1, 1, -1, 1)
+            glMatrixMode(GL_MODELVIEW)
+
+    def _leave_pass(self, render_pass, camera):
+        # Put GL back into the default 3D lit state
+        if render_pass == PASS_HUD:
+            glMatrixMode(GL_PROJECTION)
+            glPopMatrix()
+            glMatrixMode(GL_MODELVIEW)
+        glEnable(GL_LIGHTING)
+        glEnable(GL_DEPTH_TEST)
+        glLoadMatrixf(camera)
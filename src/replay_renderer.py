@@ -0,0 +1,311 @@
+import os
+
+# PyOpenGL picks its platform when it is first imported, so the offscreen
+# backend has to be chosen before anything imports OpenGL. EGL is the
+# default; set PYOPENGL_PLATFORM=osmesa to use software OSMesa instead.
+os.environ.setdefault('PYOPENGL_PLATFORM', 'egl')
+if os.environ['PYOPENGL_PLATFORM'] == 'egl':
+    # Lets Mesa create contexts with no X server or Wayland compositor
+    os.environ.setdefault('EGL_PLATFORM', 'surfaceless')
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import argparse
+import ctypes
+import multiprocessing
+import subprocess
+import time
+from collections import deque
+
+import pygame
+from OpenGL.GL import *
+from OpenGL.raw.GL.VERSION.GL_1_0 import glReadPixels as raw_glReadPixels
+
+from src.game import FightingGame, LockstepGame
+from src.recording import MatchRecording
+
+
+class OffscreenContext:
+    # A GL context with no window, rendering into a framebuffer object
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        platform = os.environ['PYOPENGL_PLATFORM']
+        if platform == 'egl':
+            self._create_egl_context()
+        elif platform == 'osmesa':
+            self._create_osmesa_context()
+        else:
+            raise RuntimeError(f"Offscreen rendering needs PYOPENGL_PLATFORM=egl or osmesa, not {platform!r}")
+        self._create_framebuffer()
+
+    def _create_egl_context(self):
+        from OpenGL import EGL
+        self.platform = 'egl'
+        display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        if not EGL.eglInitialize(display, None, None):
+            raise RuntimeError("Could not initialize EGL")
+        attributes = (EGL.EGLint * 13)(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+            EGL.EGL_RED_SIZE, 8,
+            EGL.EGL_GREEN_SIZE, 8,
+            EGL.EGL_BLUE_SIZE, 8,
+            EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+            EGL.EGL_NONE
+        )
+        config = EGL.EGLConfig()
+        config_count = EGL.EGLint()
+        EGL.eglChooseConfig(display, attributes, ctypes.pointer(config), 1, ctypes.pointer(config_count))
+        if config_count.value == 0:
+            raise RuntimeError("No suitable EGL config found")
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+
+        # A tiny pbuffer just to make the context current; all drawing goes
+        # to the framebuffer object
+        pbuffer_attributes = (EGL.EGLint * 5)(EGL.EGL_WIDTH, 1, EGL.EGL_HEIGHT, 1, EGL.EGL_NONE)
+        surface = EGL.eglCreatePbufferSurface(display, config, pbuffer_attributes)
+        context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, None)
+        if not EGL.eglMakeCurrent(display, surface, surface, context):
+            raise RuntimeError("Could not make the EGL context current")
+        self._egl = (EGL, display, surface, context)
+
+    def _create_osmesa_context(self):
+        from OpenGL import osmesa, arrays
+        self.platform = 'osmesa'
+        context = osmesa.OSMesaCreateContextExt(osmesa.OSMESA_RGBA, 24, 0, 0, None)
+        if not context:
+            raise RuntimeError("Could not create an OSMesa context")
+        # OSMesa needs a client-side buffer to be current; we still render
+        # into the framebuffer object
+        self._osmesa_buffer = arrays.GLubyteArray.zeros((1, 1, 4))
+        if not osmesa.OSMesaMakeCurrent(context, self._osmesa_buffer, GL_UNSIGNED_BYTE, 1, 1):
+            raise RuntimeError("Could not make the OSMesa context current")
+        self._osmesa = (osmesa, context)
+
+    def _create_framebuffer(self):
+        self.framebuffer = glGenFramebuffers(1)
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        self.color_buffer, self.depth_buffer = glGenRenderbuffers(2)
+
+        glBindRenderbuffer(GL_RENDERBUFFER, self.color_buffer)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RGBA8, self.width, self.height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, self.color_buffer)
+
+        glBindRenderbuffer(GL_RENDERBUFFER, self.depth_buffer)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, self.width, self.height)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self.depth_buffer)
+
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError(f"Framebuffer incomplete: 0x{status:x}")
+        glReadBuffer(GL_COLOR_ATTACHMENT0)
+
+    def close(self):
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+        glDeleteRenderbuffers(2, [self.color_buffer, self.depth_buffer])
+        glDeleteFramebuffers(1, [self.framebuffer])
+        if self.platform == 'egl':
+            EGL, display, surface, context = self._egl
+            EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroySurface(display, surface)
+            EGL.eglDestroyContext(display, context)
+            EGL.eglTerminate(display)
+        else:
+            osmesa, context = self._osmesa
+            osmesa.OSMesaDestroyContext(context)
+
+
+class PixelReader:
+    # Reads frames back through a ring of pixel buffer objects. glReadPixels
+    # into a PBO returns immediately and the copy happens on the GPU side, so
+    # frame N is only mapped once frame N+1 has been queued. Rendering and
+    # readback overlap instead of stalling on every frame.
+    def __init__(self, width, height, buffer_count=2):
+        self.width = width
+        self.height = height
+        self.frame_size = width * height * 4
+        self.buffers = list(glGenBuffers(buffer_count))
+        for buffer in self.buffers:
+            glBindBuffer(GL_PIXEL_PACK_BUFFER, buffer)
+            glBufferData(GL_PIXEL_PACK_BUFFER, self.frame_size, None, GL_STREAM_READ)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.next_buffer = 0
+        self.pending = deque()
+
+    def read(self):
+        # Queue a read of the frame just rendered. Returns the oldest frame
+        # still in flight once the ring is full, otherwise None.
+        frame = None
+        if len(self.pending) == len(self.buffers):
+            frame = self._collect(self.pending.popleft())
+
+        buffer = self.buffers[self.next_buffer]
+        self.next_buffer = (self.next_buffer + 1) % len(self.buffers)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, buffer)
+        raw_glReadPixels(0, 0, self.width, self.height, GL_RGBA, GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        self.pending.append(buffer)
+        return frame
+
+    def drain(self):
+        # The frames still in flight at the end of the replay
+        while self.pending:
+            yield self._collect(self.pending.popleft())
+
+    def _collect(self, buffer):
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, buffer)
+        pointer = glMapBuffer(GL_PIXEL_PACK_BUFFER, GL_READ_ONLY)
+        frame = ctypes.string_at(pointer, self.frame_size)
+        glUnmapBuffer(GL_PIXEL_PACK_BUFFER)
+        glBindBuffer(GL_PIXEL_PACK_BUFFER, 0)
+        return frame
+
+    def close(self):
+        glDeleteBuffers(len(self.buffers), self.buffers)
+
+
+class EncoderSink:
+    # Streams raw RGBA frames into an encoder subprocess (ffmpeg by default)
+    def __init__(self, path, width, height, fps=60, encoder='ffmpeg'):
+        command = [
+            encoder, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgba',
+            '-s', f'{width}x{height}', '-r', str(fps),
+            '-i', '-',
+            '-vf', 'vflip',  # GL rows come back bottom-up
+            '-pix_fmt', 'yuv420p',
+            path
+        ]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(frame)
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"Encoder exited with status {self.process.returncode}")
+
+
+class PngSequenceSink:
+    # Writes one numbered PNG per frame into a directory
+    def __init__(self, directory, width, height):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.size = (width, height)
+        self.frame = 0
+
+    def write(self, frame):
+        image = pygame.image.frombuffer(frame, self.size, 'RGBA')
+        image = pygame.transform.flip(image, False, True)  # GL rows come back bottom-up
+        pygame.image.save(image, os.path.join(self.directory, f'frame_{self.frame:05d}.png'))
+        self.frame += 1
+
+    def close(self):
+        pass
+
+
+def open_sink(output, width, height, fps=60):
+    # A path with a file extension goes to the encoder, anything else is
+    # treated as a directory for a PNG sequence
+    if os.path.splitext(output)[1]:
+        return EncoderSink(output, width, height, fps)
+    return PngSequenceSink(output, width, height)
+
+
+def render_replay(recording_path, output, width=800, height=600, fps=None):
+    # The video runs at the recording's tick rate unless fps is given; a
+    # lower fps renders only the ticks that fall due, so the video still
+    # plays in real time.
+    recording = MatchRecording.load(recording_path)
+    tick_rate = recording.tick_rate
+    fps = fps or tick_rate
+    context = OffscreenContext(width, height)
+    game_class = LockstepGame if recording.lockstep else FightingGame
+    game = game_class(width, height, display=False, seed=recording.seed, tick_rate=tick_rate,
+                      stage=recording.stage)
+    reader = PixelReader(width, height)
+    sink = open_sink(output, width, height, fps)
+
+    start = time.perf_counter()
+    frames = 0
+    try:
+        for inputs1, inputs2 in recording:
+            if not game.running:
+                break
+            game.step(inputs1, inputs2)
+            if frames * tick_rate >= game.frame * fps:
+                continue  # The video is not due another frame yet
+            # Animations follow match time rather than the wall clock
+            game.render(time_ms=game.frame * 1000 // tick_rate)
+            frame = reader.read()
+            if frame is not None:
+                sink.write(frame)
+            frames += 1
+        for frame in reader.drain():
+            sink.write(frame)
+    finally:
+        sink.close()
+        reader.close()
+        context.close()
+        # The game hooked its collector policy into gc.callbacks; a caller
+        # rendering several replays would otherwise collect one per game
+        game.gc_policy.uninstall()
+    elapsed = time.perf_counter() - start
+
+    return {
+        'recording': recording_path,
+        'output': output,
+        'frames': frames,
+        'seconds': elapsed,
+        'fps': frames / elapsed if elapsed > 0 else 0.0,
+        'realtime_factor': frames / fps / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def _render_job(job):
+    return render_replay(*job)
+
+
+def render_replays(jobs, processes=None):
+    # Each job is (recording_path, output, width, height, fps). Every worker
+    # process gets its own GL context; spawn rather than fork so no GL or
+    # SDL state is shared with the parent.
+    pool_context = multiprocessing.get_context('spawn')
+    with pool_context.Pool(processes) as pool:
+        return pool.map(_render_job, jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render recorded matches to video without a display")
+    parser.add_argument('recordings', nargs='+', help='match recordings saved with game.py --record')
+    parser.add_argument('--output-dir', default='renders', help='where to write the videos or frame directories')
+    parser.add_argument('--format', default='mp4', help="video container for the encoder, or 'png' for frame sequences")
+    parser.add_argument('--size', default='800x600', help='frame size as WIDTHxHEIGHT')
+    parser.add_argument('--fps', type=int, default=None,
+                        help="video frame rate (default: each recording's tick rate)")
+    parser.add_argument('--jobs', type=int, default=None, help='worker processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split('x'))
+    jobs = []
+    for path in args.recordings:
+        name = os.path.splitext(os.path.basename(path))[0]
+        output = os.path.join(args.output_dir, name)
+        if args.format != 'png':
+            output += '.' + args.format
+        jobs.append((path, output, width, height, args.fps))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if len(jobs) == 1:
+        results = [_render_job(jobs[0])]
+    else:
+        results = render_replays(jobs, args.jobs)
+    for result in results:
+        print(f"{result['recording']} -> {result['output']}: {result['frames']} frames "
+              f"in {result['seconds']:.1f}s ({result['fps']:.0f} fps, {result['realtime_factor']:.1f}x real time)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Seconds between samples (200 a second); a sample walks one stack, a few
+# microseconds of work
+DEFAULT_INTERVAL = 0.005
+# Length of a profile started from the game
+DEFAULT_PROFILE_SECONDS = 10.0
+
+
+class SamplingProfiler:
+    # Statistical profiler for the game loop. A background thread wakes
+    # every `interval` seconds, grabs the game thread's current Python stack
+    # and counts it against the frame the game is on, as given by
+    # frame_source(). Nothing is hooked into the game thread itself, so the
+    # cost to the game is the sampler holding the interpreter for the few
+    # microseconds each sample takes.
+    #
+    # Output is the collapsed-stack format flamegraph tools read, one
+    # "root;caller;...;callee count" line per distinct stack, with the frame
+    # number (and its duration, when frame_stats still has it) as the root,
+    # so slow frames can be picked out and their stacks compared.
+    def __init__(self, frame_source, frame_stats=None, interval=DEFAULT_INTERVAL):
+        self.frame_source = frame_source
+        self.frame_stats = frame_stats
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self.path = None
+        self.thread = None
+        self._stop = threading.Event()
+        self._labels = {}
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, seconds, path):
+        # Profiles the calling thread for `seconds`, then writes `path`
+        if self.running:
+            return
+        self.samples = Counter()
+        self.sample_count = 0
+        self.path = path
+        self._stop.clear()
+        self.thread = threading.Thread(
+            target=self._run, args=(threading.get_ident(), time.perf_counter() + seconds),
+            name='sampling-profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # Ends a profile early; the file is still written
+        if self.thread is not None:
+            self._stop.set()
+            self.thread.join()
+            self.thread = None
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _run(self, thread_id, end):
+        samples = self.samples
+        while not self._stop.wait(self.interval) and time.perf_counter() < end:
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break  # The game thread is gone
+            game_frame = self.frame_source()
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            samples[game_frame, tuple(stack)] += 1
+            self.sample_count += 1
+            del frame
+        self.write(self.path)
+        print(f"Profile of {self.sample_count} samples written to {self.path}")
+
+    def _frame_tag(self, game_frame):
+        stats = self.frame_stats
+        frame_ms = stats.frame_ms(game_frame) if stats is not None else None
+        if frame_ms is None:
+            return f"frame {game_frame}"
+        if frame_ms > stats.budget_ms:
+            return f"frame {game_frame} ({frame_ms:.1f} ms, over budget)"
+        return f"frame {game_frame} ({frame_ms:.1f} ms)"
+
+    def write(self, path):
+        tags = {}
+        with open(path, 'w') as f:
+            for (game_frame, stack), count in sorted(self.samples.items()):
+                tag = tags.get(game_frame)
+                if tag is None:
+                    tag = tags[game_frame] = self._frame_tag(game_frame)
+                f.write(f"{tag};{';'.join(stack)} {count}\n")
@@ -0,0 +1,131 @@
+from array import array
+
+import numpy as np
+
+from src.characters import PHYSICS_SIZE, TIMER_COUNT
+
+# Flat float64 layout of a match's simulation state. Everything that
+# affects how the match plays out from here is included; particles and
+# animation are cosmetic and are not. Timers are int32 frame numbers and
+# round-trip through float64 exactly.
+
+# Match header
+M_FRAME = 0
+M_SCORE = 1
+M_RUNNING = 2
+M_PROJECTILE_COUNT = 3
+HEADER_SIZE = 4
+
+# One block per fighter
+C_PHYSICS = 0
+C_TIMERS = C_PHYSICS + PHYSICS_SIZE
+C_STRENGTH = C_TIMERS + TIMER_COUNT
+C_PISTOLS = C_STRENGTH + 1
+C_COMBO_COUNT = C_PISTOLS + 1
+C_LAST_HIT_TIME = C_COMBO_COUNT + 1
+C_FLAGS = C_LAST_HIT_TIME + 1
+CHARACTER_SIZE = C_FLAGS + 1
+
+# Boolean fighter state, packed into C_FLAGS one bit each
+FLAG_NAMES = (
+    'is_jumping', 'can_double_jump', 'is_exploding', 'is_punching',
+    'is_kicking', 'is_breathing_fire', 'is_eyes_on_fire', 'is_staggered',
+)
+
+# One block per projectile: position, direction, speed, trail length
+PROJECTILE_SIZE = 8
+# Projectiles beyond this many are not stored. Shooting is limited by a
+# cooldown, so a real match stays far below it.
+MAX_PROJECTILES = 32
+
+PLAYERS_OFFSET = HEADER_SIZE
+PROJECTILES_OFFSET = PLAYERS_OFFSET + 2 * CHARACTER_SIZE
+STATE_SIZE = PROJECTILES_OFFSET + MAX_PROJECTILES * PROJECTILE_SIZE
+
+
+def new_state(count=None):
+    # One state row, or `count` rows for a buffer of states
+    shape = STATE_SIZE if count is None else (count, STATE_SIZE)
+    return np.zeros(shape)
+
+
+def pack_character(character, out, offset):
+    out[offset + C_PHYSICS:offset + C_PHYSICS + PHYSICS_SIZE] = character.physics
+    out[offset + C_TIMERS:offset + C_TIMERS + TIMER_COUNT] = character.timers
+    out[offset + C_STRENGTH] = character.strength
+    out[offset + C_PISTOLS] = character.pistols
+    out[offset + C_COMBO_COUNT] = character.combo_count
+    out[offset + C_LAST_HIT_TIME] = character.last_hit_time
+    flags = 0
+    for bit, name in enumerate(FLAG_NAMES):
+        if getattr(character, name):
+            flags |= 1 << bit
+    out[offset + C_FLAGS] = flags
+
+
+def unpack_character(character, state, offset, clear_effects=True):
+    # Restores a fighter in place. The caller resets the timer wheel to the
+    # state's frame first; pending ends are then scheduled from the timers.
+    # Particles are cleared unless the caller keeps simulating them itself.
+    values = state[offset:offset + CHARACTER_SIZE].tolist()
+    character.physics[:] = array('d', values[C_PHYSICS:C_PHYSICS + PHYSICS_SIZE])
+    character.timers[:] = array('i', [int(value) for value in values[C_TIMERS:C_TIMERS + TIMER_COUNT]])
+    character.strength = values[C_STRENGTH]
+    character.pistols = int(values[C_PISTOLS])
+    character.combo_count = int(values[C_COMBO_COUNT])
+    character.last_hit_time = int(values[C_LAST_HIT_TIME])
+    flags = int(values[C_FLAGS])
+    for bit, name in enumerate(FLAG_NAMES):
+        setattr(character, name, bool(flags & (1 << bit)))
+    character.projectiles.clear()
+    if clear_effects:
+        character.explosion_particles.clear()
+        character.fire_breath_particles.clear()
+    character.schedule_timers()
+
+
+def pack_match(match, out=None):
+    # Writes match's state into `out` (a STATE_SIZE row) and returns it
+    if out is None:
+        out = new_state()
+    else:
+        out[:] = 0
+    out[M_FRAME] = match.frame
+    out[M_SCORE] = match.score
+    out[M_RUNNING] = match.running
+    pack_character(match.player1, out, PLAYERS_OFFSET)
+    pack_character(match.player2, out, PLAYERS_OFFSET + CHARACTER_SIZE)
+    projectiles = match.all_projectiles[:MAX_PROJECTILES]
+    out[M_PROJECTILE_COUNT] = len(projectiles)
+    offset = PROJECTILES_OFFSET
+    for projectile in projectiles:
+        out[offset:offset + 3] = projectile.position
+        out[offset + 3:offset + 6] = projectile.direction
+        out[offset + 6] = projectile.speed
+        out[offset + 7] = projectile.trail_count
+        offset += PROJECTILE_SIZE
+    return out
+
+
+def unpack_match(match, state, clear_effects=True):
+    # Makes match's simulation state equal to the packed state
+    frame = int(state[M_FRAME])
+    match.frame = frame
+    score = float(state[M_SCORE])
+    match.score = int(score) if score.is_integer() else score
+    match.running = bool(state[M_RUNNING])
+    match.wheel.reset(frame)
+    unpack_character(match.player1, state, PLAYERS_OFFSET, clear_effects)
+    unpack_character(match.player2, state, PLAYERS_OFFSET + CHARACTER_SIZE, clear_effects)
+    projectiles = []
+    offset = PROJECTILES_OFFSET
+    for _ in range(int(state[M_PROJECTILE_COUNT])):
+        values = state[offset:offset + PROJECTILE_SIZE].tolist()
+        projectile = match.projectile_class(values[0:3], tuple(values[3:6]), values[6])
+        projectile.restore_trail(int(values[7]))
+        projectiles.append(projectile)
+        offset += PROJECTILE_SIZE
+    match.all_projectiles = projectiles
+    if clear_effects:
+        match.blast_particles.clear()
+    match.state_restored()
@@ -1,11 +1,19 @@
-import pygame
 import os
+import threading
+
+import pygame
+
+from src import tracing
 
 class SoundManager:
+    # Sounds are decoded on a background thread so the window comes up
+    # without waiting for them; until a sound has loaded, playing it does
+    # nothing.
     def __init__(self):
         pygame.mixer.init()
         self.sounds = {}
-        self._load_sounds()
+        self.loader = threading.Thread(target=self._load_sounds, name='sound-loader', daemon=True)
+        self.loader.start()
 
     def _load_sounds(self):
         sound_dir = os.path.join(os.path.dirname(__file__), '..', 'sounds')
@@ -18,13 +26,18 @@ class SoundManager:
             'kick': 'hit.wav'
         }
         
+        # Sounds sharing a file share one decoded copy
+        loaded = {}
         for name, file in sound_files.items():
             try:
-                path = os.path.join(sound_dir, file)
-                if os.path.exists(path):
-                    self.sounds[name] = pygame.mixer.Sound(path)
-                else:
-                    print(f"Warning: Sound file not found: {file}")
+                if file not in loaded:
+                    path = os.path.join(sound_dir, file)
+                    if not os.path.exists(path):
+                        print(f"Warning: Sound file not found: {file}")
+                        continue
+                    with tracing.span('load sound', {'file': file}):
+                        loaded[file] = pygame.mixer.Sound(path)
+                self.sounds[name] = loaded[file]
             except Exception as e:
                 print(f"Warning: Could not load sound {file}: {e}")
 
@@ -33,4 +46,9 @@ class SoundManager:
             try:
                 self.sounds[sound_name].play()
             except:
-                print(f"Warning: Could not play sound: {sound_name}") 
\ No newline at end of file
+                print(f"Warning: Could not play sound: {sound_name}") 
+
+class SilentSoundManager:
+    # Stand-in used for headless matches, where there is no audio device
+    def play(self, sound_name):
+        pass
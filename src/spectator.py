@@ -0,0 +1,392 @@
+import argparse
+import asyncio
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from src.match import Match
+from src.snapshot import STATE_SIZE, new_state, pack_match
+
+DEFAULT_PORT = 7777
+
+# Every packet on the wire is a uint32 length followed by a kind byte, the
+# frame number and a zlib-compressed payload
+KEYFRAME = 0
+DELTA = 1
+_LENGTH = struct.Struct('<I')
+_HEADER = struct.Struct('<BI')
+
+# A delta payload starts with one bit per state word saying whether it changed
+MASK_BYTES = (STATE_SIZE + 7) // 8
+
+
+def parse_address(text, default_host='127.0.0.1'):
+    # 'host:port', ':port' or 'port' to a (host, port) tuple
+    host, _, port = text.rpartition(':')
+    return host or default_host, int(port)
+
+
+class StateEncoder:
+    # Turns a stream of packed match states (see src.snapshot) into packets.
+    # A keyframe carries the whole state row. A delta carries a bitmask of
+    # the 8-byte words that changed since the previous state, then those
+    # words XORed with their old values: a float that moved a little keeps
+    # its sign, exponent and high mantissa bits, so most of each XORed word
+    # is zero bytes and compresses well. Deltas are bit-exact, so spectators
+    # never drift from the match they are watching.
+    def __init__(self, level=1):
+        self.level = level
+        self.previous = np.zeros(STATE_SIZE, dtype=np.uint64)
+        self.frame = 0
+
+    def _packet(self, kind, payload):
+        return _HEADER.pack(kind, self.frame) + zlib.compress(payload, self.level)
+
+    def update(self, state):
+        # Delta packet from the previous state to `state`, which becomes the
+        # new reference
+        words = state.view(np.uint64)
+        changed_words = words ^ self.previous
+        changed = changed_words != 0
+        payload = np.packbits(changed).tobytes() + changed_words[changed].tobytes()
+        self.previous = words.copy()
+        self.frame = int(state[0])
+        return self._packet(DELTA, payload)
+
+    def keyframe(self):
+        # Keyframe packet for the latest state given to update()
+        return self._packet(KEYFRAME, self.previous.tobytes())
+
+
+class StateDecoder:
+    # Rebuilds state rows from StateEncoder packets. Deltas that arrive
+    # before the first keyframe cannot be applied and are skipped.
+    def __init__(self):
+        self.state = new_state()
+        self.words = self.state.view(np.uint64)
+        self.synced = False
+
+    def decode(self, packet):
+        # Applies one packet; returns its frame, or None if it was skipped
+        kind, frame = _HEADER.unpack_from(packet)
+        payload = zlib.decompress(memoryview(packet)[_HEADER.size:])
+        if kind == KEYFRAME:
+            self.words[:] = np.frombuffer(payload, dtype=np.uint64)
+            self.synced = True
+        elif not self.synced:
+            return None
+        else:
+            mask = np.unpackbits(np.frombuffer(payload, dtype=np.uint8, count=MASK_BYTES),
+                                 count=STATE_SIZE).view(bool)
+            self.words[mask] ^= np.frombuffer(payload, dtype=np.uint64, offset=MASK_BYTES)
+        return frame
+
+
+def _start_loop_thread(name):
+    # An asyncio event loop running forever on a daemon thread
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name=name, daemon=True)
+    thread.start()
+    return loop, thread
+
+
+async def _cancel_tasks():
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _stop_loop_thread(loop, thread):
+    # Cancels whatever is still running on the loop, then ends the thread
+    asyncio.run_coroutine_threadsafe(_cancel_tasks(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+class _Receiver:
+    __slots__ = ('writer', 'queue', 'resync', 'bytes_sent', 'packets_sent', 'resyncs')
+
+    def __init__(self, writer, queue_size):
+        self.writer = writer
+        self.queue = asyncio.Queue(queue_size)
+        # New receivers start from a keyframe
+        self.resync = True
+        self.bytes_sent = 0
+        self.packets_sent = 0
+        self.resyncs = 0
+
+
+def write_packet(writer, packet):
+    writer.write(_LENGTH.pack(len(packet)) + packet)
+
+
+async def read_packet(reader):
+    length, = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(length)
+
+
+class StateStream:
+    # One match's state stream and the connections receiving it. Each frame
+    # is encoded once and the same packet is queued for every receiver. A
+    # receiver whose queue fills up has fallen behind: its backlog is dropped
+    # and it gets a keyframe in place of the delta, so a slow connection
+    # costs the server a bounded amount of memory and never holds up the
+    # others. Must be used from the event loop's thread.
+    def __init__(self, queue_size=30, level=1):
+        self.queue_size = queue_size
+        self.encoder = StateEncoder(level)
+        self.receivers = []
+        self.frames = 0
+        self.delta_bytes = 0
+        self.keyframe_bytes = 0
+        self.keyframes = 0
+
+    def publish(self, state):
+        # Queues a packed state for every receiver
+        delta = self.encoder.update(state)
+        keyframe = None
+        for receiver in self.receivers:
+            queue = receiver.queue
+            if queue.full():
+                # Everything still queued would only be thrown away by the
+                # keyframe, so drop it now
+                while not queue.empty():
+                    queue.get_nowait()
+                receiver.resync = True
+                receiver.resyncs += 1
+            if receiver.resync:
+                if keyframe is None:
+                    keyframe = self.encoder.keyframe()
+                    self.keyframe_bytes += len(keyframe)
+                    self.keyframes += 1
+                receiver.resync = False
+                queue.put_nowait(keyframe)
+            else:
+                queue.put_nowait(delta)
+        self.frames += 1
+        self.delta_bytes += len(delta)
+
+    async def send(self, writer):
+        # Sends the stream to `writer` until close() or a connection error
+        receiver = _Receiver(writer, self.queue_size)
+        self.receivers.append(receiver)
+        try:
+            while True:
+                packet = await receiver.queue.get()
+                if packet is None:
+                    break
+                write_packet(writer, packet)
+                receiver.bytes_sent += _LENGTH.size + len(packet)
+                receiver.packets_sent += 1
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.receivers.remove(receiver)
+            writer.close()
+
+    def close(self):
+        # Ends every send(); None replaces whatever backlog is left
+        for receiver in self.receivers:
+            queue = receiver.queue
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+
+
+class SpectatorServer:
+    # Streams a match's state to any number of TCP spectators. The server
+    # runs its own asyncio loop on a background thread; publish() only packs
+    # the state and hands it over, so the game loop never waits on the
+    # network.
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT, queue_size=30, level=1):
+        self.host = host
+        self.port = port
+        self.stream = StateStream(queue_size, level)
+        self.loop = None
+        self.thread = None
+        self.server = None
+        # Time spent encoding and queueing, on the server thread
+        self.broadcast_seconds = 0.0
+
+    def start(self):
+        self.loop, self.thread = _start_loop_thread('spectator-server')
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self._serve, self.host, self.port), self.loop).result()
+        # With port 0 the system picks a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+        _stop_loop_thread(self.loop, self.thread)
+        self.loop = None
+
+    async def _close(self):
+        self.server.close()
+        self.stream.close()
+        await self.server.wait_closed()
+
+    def publish(self, match):
+        # Queues the match's current state for every spectator
+        self.loop.call_soon_threadsafe(self._broadcast, pack_match(match))
+
+    def cpu_seconds(self):
+        # CPU time used by the server thread so far
+        async def thread_time():
+            return time.thread_time()
+        return asyncio.run_coroutine_threadsafe(thread_time(), self.loop).result()
+
+    @property
+    def spectator_count(self):
+        return len(self.stream.receivers)
+
+    def _broadcast(self, state):
+        start = time.thread_time()
+        self.stream.publish(state)
+        self.broadcast_seconds += time.thread_time() - start
+
+    async def _serve(self, reader, writer):
+        await self.stream.send(writer)
+
+
+class SpectatorClient:
+    # Receives a spectator stream. start() runs it on a background thread;
+    # receive() can also be awaited directly to run many clients on one
+    # loop. `state` is replaced (never written in place) after every packet,
+    # so another thread reading it always sees one whole frame.
+    def __init__(self, host='127.0.0.1', port=DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.decoder = StateDecoder()
+        self.state = None
+        self.frame = -1
+        self.connected = False
+        self.bytes_received = 0
+        self.packets_received = 0
+        self.loop = None
+        self.thread = None
+        self.task = None
+
+    def start(self):
+        self.loop, self.thread = _start_loop_thread('spectator-client')
+        self.task = asyncio.run_coroutine_threadsafe(self.receive(), self.loop)
+
+    def stop(self):
+        if self.loop is None:
+            return
+        _stop_loop_thread(self.loop, self.thread)
+        self.loop = None
+
+    async def receive(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self.connected = True
+        decoder = self.decoder
+        try:
+            while True:
+                packet = await read_packet(reader)
+                self.bytes_received += _LENGTH.size + len(packet)
+                self.packets_received += 1
+                frame = decoder.decode(packet)
+                if frame is not None:
+                    self.state = decoder.state.copy()
+                    self.frame = frame
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connected = False
+            writer.close()
+
+
+def benchmark(client_count, frames=300, fps=60.0, seed=0):
+    # Streams a match with random inputs to `client_count` local spectators
+    # at `fps` and measures what each one costs. The clients share one loop
+    # on their own thread, so they do not count towards server CPU time.
+    server = SpectatorServer(port=0)
+    server.start()
+    clients = [SpectatorClient(port=server.port) for _ in range(client_count)]
+    client_loop, client_thread = _start_loop_thread('spectator-clients')
+    # The event loop only holds weak references to its tasks
+    receivers = [asyncio.run_coroutine_threadsafe(client.receive(), client_loop)
+                 for client in clients]
+    while server.spectator_count < client_count:
+        time.sleep(0.01)
+
+    match = Match(seed=seed, quiet=True)
+    rng = np.random.default_rng(seed)
+    inputs = (0, 0)
+    cpu_start = server.cpu_seconds()
+    start = time.perf_counter()
+    for frame in range(frames):
+        if not match.running:
+            match = Match(seed=seed + frame, quiet=True)
+        # Hold each input for a few frames, like a player would
+        if frame % 8 == 0:
+            inputs = tuple(int(value) for value in rng.integers(0, 128, 2))
+        match.step(*inputs)
+        server.publish(match)
+        delay = start + (frame + 1) / fps - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+    # Let the last packets arrive, then check every spectator matches
+    deadline = time.perf_counter() + 5.0
+    while (any(client.frame != match.frame for client in clients) and
+           time.perf_counter() < deadline):
+        time.sleep(0.01)
+    cpu = server.cpu_seconds() - cpu_start
+    final = pack_match(match)
+    exact = all(client.state is not None and np.array_equal(client.state, final)
+                for client in clients)
+    received = sum(client.bytes_received for client in clients)
+    stream = server.stream
+    resyncs = sum(receiver.resyncs for receiver in stream.receivers)
+    # Ends each client's receive loop (closing its connection) before the
+    # loop stops and waits on whatever is left
+    for receiver in receivers:
+        receiver.cancel()
+    _stop_loop_thread(client_loop, client_thread)
+    server.stop()
+
+    bytes_per_frame = received / client_count / frames
+    return {
+        'clients': client_count,
+        'raw_bytes': STATE_SIZE * 8,
+        'delta_bytes': stream.delta_bytes / stream.frames,
+        'keyframe_bytes': stream.keyframe_bytes / max(stream.keyframes, 1),
+        'bytes_per_second': bytes_per_frame * fps,
+        'broadcast_us': server.broadcast_seconds / stream.frames * 1e6,
+        'cpu_percent': cpu / (frames / fps) * 100,
+        'cpu_us_per_client': cpu / frames / client_count * 1e6,
+        'resyncs': resyncs,
+        'exact': exact,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure spectator stream bandwidth and server CPU")
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 10, 100],
+                        help='numbers of local spectators to try')
+    parser.add_argument('--frames', type=int, default=300, help='frames to stream per run')
+    parser.add_argument('--fps', type=float, default=60.0, help='frames published per second')
+    args = parser.parse_args()
+
+    print(f"Raw state: {STATE_SIZE * 8} bytes")
+    print(f"{'clients':>8} {'delta B':>8} {'key B':>7} {'KB/s each':>10} "
+          f"{'publish us':>10} {'server CPU':>11} {'us/client':>10} {'resyncs':>8}  exact")
+    for count in args.clients:
+        stats = benchmark(count, args.frames, args.fps)
+        print(f"{stats['clients']:>8} {stats['delta_bytes']:>8.0f} {stats['keyframe_bytes']:>7.0f} "
+              f"{stats['bytes_per_second'] / 1024:>10.2f} {stats['broadcast_us']:>10.1f} "
+              f"{stats['cpu_percent']:>10.1f}% {stats['cpu_us_per_client']:>10.1f} "
+              f"{stats['resyncs']:>8}  {'yes' if stats['exact'] else 'NO'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+import argparse
+import math
+import time
+
+import numpy as np
+
+from src.hitboxes import sweep_box
+
+# Kinds of stage collider
+SOLID = 0     # Blocks fighters from every side, stops missiles and particles
+PLATFORM = 1  # Fighters land on it from above and pass through it otherwise
+HAZARD = 2    # Burns fighters that stand in it (see Match.check_hazards)
+
+# A fighter's position is at its chest. Its feet are STAND_HEIGHT below,
+# where the ground is drawn, the top of its head HEAD_HEIGHT above, and it
+# is HALF_WIDTH wide on either side (arms included, see src/hitboxes.py).
+STAND_HEIGHT = 2.0
+HEAD_HEIGHT = 1.5
+HALF_WIDTH = 0.6
+
+# Every stage fits the same arena; the grids cover this area in square
+# cells. Colliders reaching past it are listed in the edge cells, and
+# queries past it look there, so the grids stay small even for a floor
+# nobody can walk off.
+ARENA = (-12.0, -12.0, 12.0, 12.0)
+CELL_SIZE = 1.0
+# Colliders touching more cells than this (a floor, a long wall) are kept
+# once, in a short list every query checks, rather than in each cell
+LARGE_CELLS = 32
+# The stretch of x that is drawn
+VIEW_X = (-10.0, 10.0)
+
+# Colliders are (kind, min_x, min_y, max_x, max_y, depth, color) in world
+# space, with depth along z centered on z = 0
+STAGES = {
+    # The original arena: a floor as wide as anyone can walk
+    'flat': (
+        (SOLID, -1000.0, -12.0, 1000.0, -2.0, 20.0, (0.2, 0.5, 0.2)),
+    ),
+    # Walls at both ends with lava along their foot, a platform over each
+    # starting spot and one higher up in the middle
+    'towers': (
+        (SOLID, -1000.0, -12.0, 1000.0, -2.0, 20.0, (0.2, 0.5, 0.2)),
+        (SOLID, -10.0, -2.0, -9.0, 8.0, 6.0, (0.45, 0.4, 0.35)),
+        (SOLID, 9.0, -2.0, 10.0, 8.0, 6.0, (0.45, 0.4, 0.35)),
+        (PLATFORM, -6.5, 0.5, -3.5, 0.8, 3.0, (0.55, 0.45, 0.3)),
+        (PLATFORM, 3.5, 0.5, 6.5, 0.8, 3.0, (0.55, 0.45, 0.3)),
+        (PLATFORM, -1.5, 2.5, 1.5, 2.8, 3.0, (0.55, 0.45, 0.3)),
+        (HAZARD, -9.0, -2.0, -7.5, -1.7, 4.0, (1.0, 0.35, 0.0)),
+        (HAZARD, 7.5, -2.0, 9.0, -1.7, 4.0, (1.0, 0.35, 0.0)),
+    ),
+}
+DEFAULT_STAGE = 'flat'
+
+
+def _cell(value, origin, count):
+    cell = math.floor((value - origin) / CELL_SIZE)
+    return 0 if cell < 0 else count - 1 if cell >= count else cell
+
+
+class UniformGrid:
+    # Items bucketed by the cells of ARENA their boxes (min_x, min_y, max_x,
+    # max_y) touch. A query only looks at the cells its own box touches, so
+    # it costs the same however many items lie elsewhere. Items touching
+    # more than LARGE_CELLS cells are kept in the tuple self.large instead,
+    # unless keep_large is set, and callers test those as well as the ones
+    # a query finds. An item can come up more than once; callers test the
+    # items they get exactly. A query inside one cell, which most fighter
+    # queries are, hands back that cell's own tuple; one spanning several
+    # cells gathers them into a new list.
+    def __init__(self, entries, keep_large=False):
+        min_x, min_y, max_x, max_y = ARENA
+        self.columns = math.ceil((max_x - min_x) / CELL_SIZE)
+        self.rows = math.ceil((max_y - min_y) / CELL_SIZE)
+        cells = [[] for _ in range(self.columns * self.rows)]
+        large = []
+        for box, item in entries:
+            indices = self.cell_indices(*box)
+            if len(indices) > LARGE_CELLS and not keep_large:
+                large.append(item)
+                continue
+            for index in indices:
+                cells[index].append(item)
+        self.cells = [tuple(cell) for cell in cells]
+        self.large = tuple(large)
+
+    def cell_indices(self, min_x, min_y, max_x, max_y):
+        columns = self.columns
+        x0, x1 = _cell(min_x, ARENA[0], columns), _cell(max_x, ARENA[0], columns)
+        y0, y1 = _cell(min_y, ARENA[1], self.rows), _cell(max_y, ARENA[1], self.rows)
+        return [row * columns + column for row in range(y0, y1 + 1) for column in range(x0, x1 + 1)]
+
+    def query(self, min_x, min_y, max_x, max_y):
+        columns = self.columns
+        x0, x1 = _cell(min_x, ARENA[0], columns), _cell(max_x, ARENA[0], columns)
+        y0, y1 = _cell(min_y, ARENA[1], self.rows), _cell(max_y, ARENA[1], self.rows)
+        cells = self.cells
+        if x0 == x1 and y0 == y1:
+            return cells[y0 * columns + x0]
+        found = []
+        for row in range(y0, y1 + 1):
+            for column in range(x0, x1 + 1):
+                found.extend(cells[row * columns + column])
+        return found
+
+
+class Collider:
+    # One stage box. For fighters it is grown by their size, so that a
+    # fighter collides with it when its position is inside: between left
+    # and right, and between ceiling (the highest a fighter fits under it)
+    # and stand (where a fighter standing on it is).
+    __slots__ = ('kind', 'box', 'color', 'left', 'right', 'ceiling', 'stand')
+
+    def __init__(self, kind, min_x, min_y, max_x, max_y, depth, color):
+        self.kind = kind
+        self.box = (min_x, min_y, -depth / 2, max_x, max_y, depth / 2)
+        self.color = color
+        self.left = min_x - HALF_WIDTH
+        self.right = max_x + HALF_WIDTH
+        self.ceiling = min_y - HEAD_HEIGHT
+        self.stand = max_y + STAND_HEIGHT
+
+
+class Stage:
+    # A stage's colliders, in grids built once when it is loaded. Each
+    # fighter query has its own, holding only the colliders it tests and
+    # only the part of them it tests: the grown boxes of solids for walls
+    # and of hazards for burning, the line a fighter stands at on top of
+    # solids and platforms for landing, and the line under solids it bumps
+    # its head at for rising. Missiles look up solids' own boxes, and
+    # particles a table of the boxes that stop them, for numpy. Per-frame
+    # collision cost then depends on what is near each fighter, missile or
+    # particle rather than on how much the stage holds.
+    def __init__(self, name, layout):
+        self.name = name
+        self.mesh = f'stage_{name}'
+        self.colliders = [Collider(*entry) for entry in layout]
+        self.hazards = [c for c in self.colliders if c.kind == HAZARD]
+        solid = [c for c in self.colliders if c.kind == SOLID]
+        self.wall_grid = UniformGrid(((c.left, c.ceiling, c.right, c.stand), c) for c in solid)
+        self.hazard_grid = UniformGrid(((c.left, c.ceiling, c.right, c.stand), c) for c in self.hazards)
+        self.ground_grid = UniformGrid(((c.left, c.stand, c.right, c.stand), c)
+                                       for c in self.colliders if c.kind != HAZARD)
+        self.ceiling_grid = UniformGrid(((c.left, c.ceiling, c.right, c.ceiling), c) for c in solid)
+        self.missile_grid = UniformGrid(((c.box[0], c.box[1], c.box[3], c.box[4]), c) for c in solid)
+
+        # Particles stop in solids and platforms. Row i of the table lists
+        # the blockers in cell i, large ones included, padded with a box
+        # that holds no point.
+        blockers = [c for c in self.colliders if c.kind != HAZARD]
+        grid = UniformGrid((((c.box[0], c.box[1], c.box[3], c.box[4]), i) for i, c in enumerate(blockers)),
+                           keep_large=True)
+        width = max(1, max(len(cell) for cell in grid.cells))
+        empty = len(blockers)
+        self.particle_table = np.array([cell + (empty,) * (width - len(cell)) for cell in grid.cells],
+                                       dtype=np.intp)
+        self.particle_boxes = np.array([(c.box[0], c.box[1], c.box[3], c.box[4]) for c in blockers] +
+                                       [(np.inf, np.inf, -np.inf, -np.inf)])
+        self.grid_shape = (grid.columns, grid.rows)
+
+    def stop_x(self, x0, x1, y):
+        # Where a fighter at height y moving from x0 to x1 ends up, stopped
+        # by the first solid in the way
+        grid = self.wall_grid
+        if x1 > x0:
+            for found in (grid.query(x0, y, x1, y), grid.large):
+                for c in found:
+                    if c.ceiling < y < c.stand and x0 <= c.left < x1:
+                        x1 = c.left
+        elif x1 < x0:
+            for found in (grid.query(x1, y, x0, y), grid.large):
+                for c in found:
+                    if c.ceiling < y < c.stand and x1 < c.right <= x0:
+                        x1 = c.right
+        return x1
+
+    def ground(self, x, y0, y1):
+        # The highest surface a fighter at x falling from y0 to y1 lands on,
+        # as the height it stands at, or None
+        ground = None
+        grid = self.ground_grid
+        for found in (grid.query(x, y1, x, y0), grid.large):
+            for c in found:
+                if (c.left < x < c.right and y1 <= c.stand <= y0 and
+                        (ground is None or c.stand > ground)):
+                    ground = c.stand
+        return ground
+
+    def ceiling(self, x, y0, y1):
+        # The lowest a fighter at x rising from y0 to y1 bumps its head at,
+        # or None
+        ceiling = None
+        grid = self.ceiling_grid
+        for found in (grid.query(x, y0, x, y1), grid.large):
+            for c in found:
+                if (c.left < x < c.right and y0 <= c.ceiling <= y1 and
+                        (ceiling is None or c.ceiling < ceiling)):
+                    ceiling = c.ceiling
+        return ceiling
+
+    def in_hazard(self, x, y):
+        grid = self.hazard_grid
+        for found in (grid.query(x, y, x, y), grid.large):
+            for c in found:
+                if c.left < x < c.right and c.ceiling < y < c.stand:
+                    return True
+        return False
+
+    def sweep(self, start, end, radius):
+        # Earliest t in [0, 1] at which a sphere moving from start to end
+        # touches a solid, or -1 (see hitboxes.sweep_box)
+        x, y, z = start
+        dx, dy, dz = end[0] - x, end[1] - y, end[2] - z
+        first = -1.0
+        low_x, low_y = min(x, end[0]) - radius, min(y, end[1]) - radius
+        high_x, high_y = max(x, end[0]) + radius, max(y, end[1]) + radius
+        grid = self.missile_grid
+        for found in (grid.query(low_x, low_y, high_x, high_y), grid.large):
+            for c in found:
+                box = c.box
+                if box[0] > high_x or box[3] < low_x or box[1] > high_y or box[4] < low_y:
+                    continue
+                t = sweep_box(box, x, y, z, dx, dy, dz, radius)
+                if t >= 0 and (first < 0 or t < first):
+                    first = t
+        return first
+
+    def blocks(self, points):
+        # Which of the (n, 3) points are inside a solid or a platform
+        columns, rows = self.grid_shape
+        column = np.clip(np.floor((points[:, 0] - ARENA[0]) / CELL_SIZE), 0, columns - 1).astype(np.intp)
+        row = np.clip(np.floor((points[:, 1] - ARENA[1]) / CELL_SIZE), 0, rows - 1).astype(np.intp)
+        boxes = self.particle_boxes[self.particle_table[row * columns + column]]
+        x = points[:, 0, None]
+        y = points[:, 1, None]
+        inside = (boxes[..., 0] <= x) & (x <= boxes[..., 2]) & (boxes[..., 1] <= y) & (y <= boxes[..., 3])
+        return inside.any(axis=1)
+
+
+_stages = {}
+
+
+def get_stage(name):
+    # The named stage, built on first use and shared from then on
+    stage = _stages.get(name)
+    if stage is None:
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage {name!r}; choose from {', '.join(sorted(STAGES))}")
+        stage = _stages[name] = Stage(name, STAGES[name])
+    return stage
+
+
+def benchmark(boxes=100, queries=2000, seed=0):
+    # Ground queries for fighters at random spots on a stage of `boxes`
+    # random platforms, through the grid and by testing every collider.
+    # Returns the time per query of each.
+    rng = np.random.default_rng(seed)
+    low = rng.uniform((-11, -10), (10, 10), (boxes, 2))
+    size = rng.uniform((0.5, 0.2), (2.0, 0.4), (boxes, 2))
+    layout = [(PLATFORM, x, y, x + w, y + h, 1.0, (1, 1, 1)) for (x, y), (w, h) in zip(low, size)]
+    stage = Stage('benchmark', layout)
+    spots = rng.uniform((-10, -10), (10, 10), (queries, 2)).tolist()
+
+    start = time.perf_counter()
+    grid_found = [stage.ground(x, y, y - 0.5) for x, y in spots]
+    grid_s = (time.perf_counter() - start) / queries
+
+    start = time.perf_counter()
+    found = []
+    for x, y in spots:
+        ground = None
+        for c in stage.colliders:
+            if c.left < x < c.right and y - 0.5 <= c.stand <= y and (ground is None or c.stand > ground):
+                ground = c.stand
+        found.append(ground)
+    all_s = (time.perf_counter() - start) / queries
+    assert found == grid_found
+
+    return {'boxes': boxes, 'grid_us': grid_s * 1e6, 'all_us': all_s * 1e6}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark stage collision queries through the grid "
+                                                 "against testing every collider")
+    parser.add_argument('--boxes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+    for boxes in args.boxes:
+        stats = benchmark(boxes, args.queries)
+        print(f"{stats['boxes']:5d} colliders: grid {stats['grid_us']:6.1f} us/query, "
+              f"every collider {stats['all_us']:7.1f} us/query")
+
+
+if __name__ == '__main__':
+    main()
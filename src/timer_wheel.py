@@ -0,0 +1,59 @@
+class TimerWheel:
+    # Frame-indexed timer wheel. Callbacks are registered for an expiry
+    # frame and filed in slot (frame % size); advancing the wheel one frame
+    # only looks at that frame's slot, so timers that are not due cost
+    # nothing per frame however many of them there are. Expiries more than
+    # `size` frames ahead share a slot with nearer ones and simply stay
+    # filed until their own frame comes round.
+    def __init__(self, size=128, frame=0):
+        if size & (size - 1):
+            raise ValueError("Timer wheel size must be a power of two")
+        self.mask = size - 1
+        self.slots = [[] for _ in range(size)]
+        self.frame = frame
+        self.pending = 0
+
+    def schedule(self, frame, callback, *args):
+        # Calls callback(*args) when the wheel reaches `frame`. Anything due
+        # now or in the past fires on the next advance. Returns a handle for
+        # cancel().
+        if frame <= self.frame:
+            frame = self.frame + 1
+        entry = [frame, callback, args]
+        self.slots[frame & self.mask].append(entry)
+        self.pending += 1
+        return entry
+
+    def cancel(self, entry):
+        # Cancelled entries stay in their slot and are dropped when reached
+        entry[1] = None
+
+    def advance(self, frame):
+        # Moves the wheel forward to `frame`, firing everything due on the way
+        while self.frame < frame:
+            self.frame += 1
+            if not self.pending:
+                continue
+            index = self.frame & self.mask
+            slot = self.slots[index]
+            if not slot:
+                continue
+            current = self.frame
+            # Keep later rotations in place; callbacks may schedule new
+            # entries into this same slot, so swap in a fresh list first
+            self.slots[index] = [entry for entry in slot if entry[0] != current]
+            for entry in slot:
+                if entry[0] == current:
+                    self.pending -= 1
+                    callback = entry[1]
+                    if callback is not None:
+                        callback(*entry[2])
+
+    def reset(self, frame=0):
+        # Drops every pending timer and sets the current frame
+        if self.pending:
+            for slot in self.slots:
+                if slot:
+                    slot.clear()
+        self.pending = 0
+        self.frame = frame
@@ -0,0 +1,124 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class _Span:
+    # Context manager timing one occurrence of a span
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer._record(self.name, self.args, self.start, time.perf_counter_ns())
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullTracer:
+    # Used when tracing is off; span() hands back one shared no-op
+    enabled = False
+
+    def span(self, name, args=None):
+        return _NULL_SPAN
+
+
+NULL_TRACER = NullTracer()
+
+
+class Tracer:
+    # Records when each span started and how long it took, on every thread,
+    # and saves them as Chrome trace-event JSON, which chrome://tracing and
+    # ui.perfetto.dev show as one timeline per thread. Only the latest
+    # `max_events` spans are kept, so tracing a long session stays bounded.
+    enabled = True
+
+    def __init__(self, max_events=500_000):
+        self.events = deque(maxlen=max_events)
+        self.threads = {}
+        self.origin = time.perf_counter_ns()
+
+    def span(self, name, args=None):
+        # args is an optional dict shown with the span in the viewer
+        return _Span(self, name, args)
+
+    def _record(self, name, args, start, end):
+        ident = threading.get_ident()
+        if ident not in self.threads:
+            self.threads[ident] = (threading.get_native_id(), threading.current_thread().name)
+        # deque.append is atomic, so threads need no lock here
+        self.events.append((name, args, ident, start, end - start))
+
+    def save(self, path):
+        pid = os.getpid()
+        with open(path, 'w') as f:
+            f.write('{"displayTimeUnit": "ms", "traceEvents": [\n')
+            f.write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                                'args': {'name': 'Retro Fighting Game'}}))
+            for tid, thread_name in list(self.threads.values()):
+                f.write(',\n' + json.dumps({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                                            'args': {'name': thread_name}}))
+            for name, args, ident, start, duration in list(self.events):
+                event = {'name': name, 'ph': 'X', 'pid': pid, 'tid': self.threads[ident][0],
+                         'ts': (start - self.origin) / 1000, 'dur': duration / 1000}
+                if args:
+                    event['args'] = args
+                f.write(',\n' + json.dumps(event))
+            f.write('\n]}\n')
+
+
+# The tracer for code with no match at hand to ask, such as loader threads
+_tracer = NULL_TRACER
+
+
+def install(tracer):
+    global _tracer
+    _tracer = tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def span(name, args=None):
+    return _tracer.span(name, args)
+
+
+def traced(name=None):
+    # Decorator putting every call of a function in a span of the installed
+    # tracer (named after the function by default). Costs one check per
+    # call while tracing is off.
+    def decorate(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if not tracer.enabled:
+                return fn(*args, **kwargs)
+            with tracer.span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
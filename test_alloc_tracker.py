@@ -0,0 +1,78 @@
+from src.alloc_tracker import AllocationTracker, measure_allocations
+from src.characters import Projectile
+from src.match import Match, INPUT_SHOOT
+
+# A headless step keeps nothing from frame to frame. What is left over
+# after thousands of steps is a few lists the timer wheel has resized
+# once, a few dozen bytes in all, hence a budget rather than zero.
+STEP_BYTES_BUDGET = 0.1
+STEP_BLOCKS_BUDGET = 0.001
+
+
+def _headless_match(**kwargs):
+    # Quiet, or pytest's captured stdout would keep every printed hit
+    match = Match(seed=1, quiet=True, **kwargs)
+    match.simulate_effects = False
+    return match
+
+
+def test_projectile_update_allocates_nothing():
+    projectile = Projectile((-5, 0, 0), (1, 0, 0), speed=0.001)
+    assert measure_allocations(projectile.update, calls=2000) == (0.0, 0.0)
+
+
+def test_idle_match_step_within_budget():
+    match = _headless_match()
+    net_bytes, net_blocks = measure_allocations(match.step, 0, 0, calls=3000, warmup=300)
+    assert net_bytes <= STEP_BYTES_BUDGET
+    assert net_blocks <= STEP_BLOCKS_BUDGET
+
+
+def test_missile_duel_match_step_within_budget():
+    # Both fighters fire whenever they can; the missiles meet and blow up.
+    # The longer warmup fills CPython's free list of list objects with the
+    # missiles' freed position lists, which would otherwise count as kept.
+    match = _headless_match()
+    net_bytes, net_blocks = measure_allocations(match.step, INPUT_SHOOT, INPUT_SHOOT,
+                                                calls=3000, warmup=1000)
+    assert match.running
+    assert net_bytes <= STEP_BYTES_BUDGET
+    assert net_blocks <= STEP_BLOCKS_BUDGET
+
+
+def test_match_sections_allocate_nothing_per_frame():
+    tracker = AllocationTracker(history=600)
+    tracker.start()
+    try:
+        match = _headless_match(alloc_tracker=tracker)
+        for _ in range(900):
+            tracker.begin_frame()
+            match.step(INPUT_SHOOT, INPUT_SHOOT)
+            tracker.end_frame()
+    finally:
+        tracker.stop()
+    # Only the last 600 frames are kept, well past warming up
+    tracker.assert_budget('character update')
+    tracker.assert_budget('projectiles')
+
+
+def test_nested_sections_are_charged_exactly():
+    tracker = AllocationTracker(history=100)
+    tracker.start()
+    kept = []
+    try:
+        outer, empty, leaky = (tracker.section(name) for name in ('outer', 'empty', 'leaky'))
+        for _ in range(200):
+            tracker.begin_frame()
+            with outer:
+                with empty:
+                    pass
+                with leaky:
+                    kept.append(object())
+            tracker.end_frame()
+    finally:
+        tracker.stop()
+    tracker.assert_budget('outer')
+    tracker.assert_budget('empty')
+    summary = tracker.summary()
+    assert summary['leaky']['net_blocks_mean'] >= 1
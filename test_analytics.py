@@ -0,0 +1,19 @@
+import numpy as np
+
+from src.analytics import MatchAnalytics
+from src.match import Match
+
+
+def test_damage_and_knockouts_stop_at_the_knockout():
+    # Random play leaves fire breath burning on fighters already knocked
+    # out; none of it may be counted
+    for seed in range(10):
+        analytics = MatchAnalytics()
+        rng = np.random.default_rng(seed)
+        match = Match(seed=seed, analytics=analytics, quiet=True)
+        match.simulate_effects = False
+        while match.running and match.frame < 3600:
+            match.step(int(rng.integers(0, 128)), int(rng.integers(0, 128)))
+        assert not match.running
+        assert np.all(analytics.damage_taken.sum(axis=(1, 2)) <= 100 + 1e-9)
+        assert np.all(analytics.knockouts.sum(axis=1) <= 1)
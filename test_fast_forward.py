@@ -0,0 +1,18 @@
+import pytest
+
+from src.fast_forward import DEFAULT_STEPS, check_parity
+
+SEEDS = range(4)
+
+
+@pytest.mark.parametrize('frames', DEFAULT_STEPS)
+@pytest.mark.parametrize('stage', ['flat', 'towers'])
+def test_coarse_steps_match_single_frames(frames, stage):
+    for seed in SEEDS:
+        result = check_parity(seed, frames, duration=1200, stage=stage)
+        assert result['mismatch'] is None, f"seed {seed}: hits differ from step {result['mismatch']}"
+
+
+def test_parity_check_sees_hits():
+    # The matches have to land hits for agreeing on them to mean anything
+    assert sum(check_parity(seed, 4, duration=1200)['hits'] for seed in SEEDS) > 0